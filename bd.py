@@ -1,29 +1,202 @@
-# bd.py
+import atexit
+import threading
+from contextlib import contextmanager
+
 import psycopg2
+from psycopg2 import extensions, pool
 
 DB_CONFIG = {
-    'dbname': 'postgres',    
-    'user': 'postgres',       
-    'password': '123',        
+    'dbname': 'postgres',
+    'user': 'postgres',
+    'password': '123',
     'host': 'localhost',
 }
 
+# Tamaño del pool de conexiones compartido por todo el proceso
+POOL_CONFIG = {
+    'minconn': 1,
+    'maxconn': 10,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ConexionPool:
+    """
+    Envoltorio de una conexión del pool.
+    Se comporta como una conexión de psycopg2, pero close() la devuelve al pool
+    en lugar de cerrar el socket, así las llamadas existentes reutilizan conexiones.
+    Lecturas y asignaciones (conn.autocommit = True, conn.isolation_level, ...) se
+    reenvían a la conexión real; solo _conn y _origen pertenecen al envoltorio.
+    """
+
+    _PROPIOS = ('_conn', '_origen')
+
+    def __init__(self, conn, origen):
+        self._conn = conn
+        self._origen = origen
+
+    def _real(self):
+        conn = self.__dict__.get('_conn')
+        if conn is None:
+            raise psycopg2.InterfaceError("connection already closed")
+        return conn
+
+    def __getattr__(self, nombre):
+        return getattr(self._real(), nombre)
+
+    def __setattr__(self, nombre, valor):
+        if nombre in self._PROPIOS:
+            object.__setattr__(self, nombre, valor)
+        else:
+            setattr(self._real(), nombre, valor)
+
+    @property
+    def closed(self):
+        return 1 if self._conn is None else self._conn.closed
+
+    def close(self):
+        """Devuelve la conexión al pool (idempotente)"""
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            _devolver_conexion(conn, self._origen)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # Misma semántica que psycopg2: commit si no hubo error, rollback si lo hubo
+        if self._conn is None:
+            return False
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        return False
+
+
+def _obtener_pool():
+    """Crea el pool la primera vez que se necesita (thread-safe)"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = pool.ThreadedConnectionPool(
+                    POOL_CONFIG['minconn'], POOL_CONFIG['maxconn'], **DB_CONFIG
+                )
+    return _pool
+
+
+def _preparar_conexion(conn, usuario_app):
+    """
+    Health check + usuario de auditoría en un solo round-trip.
+    Devuelve False si la conexión está rota y hay que descartarla.
+    """
+    if conn.closed:
+        return False
+    try:
+        conn.autocommit = True
+        cursor = conn.cursor()
+        cursor.execute("SELECT set_config('app.usuario', %s, false)", (usuario_app or '',))
+        cursor.close()
+        conn.autocommit = False
+        return True
+    except psycopg2.Error:
+        return False
+
+
+def _devolver_conexion(conn, origen):
+    """Limpia el estado de la transacción y devuelve la conexión a su pool"""
+    if origen is None:
+        conn.close()
+        return
+    descartar = bool(conn.closed)
+    if not descartar:
+        try:
+            estado = conn.info.transaction_status
+            if estado == extensions.TRANSACTION_STATUS_UNKNOWN:
+                descartar = True
+            elif estado != extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if not descartar and conn.autocommit:
+                conn.autocommit = False
+            # Aislamiento / solo lectura cambiados a través del envoltorio: volver al default del servidor
+            if not descartar and (conn.isolation_level is not None or conn.readonly is not None
+                                  or conn.deferrable is not None):
+                conn.set_session(isolation_level='DEFAULT', readonly='DEFAULT', deferrable='DEFAULT')
+        except psycopg2.Error:
+            descartar = True
+    try:
+        origen.putconn(conn, close=descartar)
+    except pool.PoolError:
+        # El pool ya fue cerrado (ej. al salir de la aplicación)
+        if not conn.closed:
+            conn.close()
+
+
+def _checkout(usuario_app=None):
+    """Obtiene una conexión sana del pool; si el pool está agotado abre una directa"""
+    origen = _obtener_pool()
+    for _ in range(POOL_CONFIG['maxconn'] + 1):
+        try:
+            conn = origen.getconn()
+        except pool.PoolError:
+            print("⚠️ Pool de conexiones agotado, abriendo conexión directa")
+            conn = psycopg2.connect(**DB_CONFIG)
+            if usuario_app:
+                establecer_usuario_app(conn, usuario_app)
+            return ConexionPool(conn, None)
+        if _preparar_conexion(conn, usuario_app):
+            return ConexionPool(conn, origen)
+        # Conexión rota (servidor reiniciado, timeout, etc.): descartarla y probar otra
+        origen.putconn(conn, close=True)
+    raise psycopg2.OperationalError("No se pudo obtener una conexión sana del pool")
+
+
 def conectar_db(usuario_app=None):
     """
     Conecta a la base de datos y establece el usuario de aplicación si se proporciona
     """
     try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        
-        # Si se proporciona un usuario de aplicación, establecerlo en la sesión
-        if usuario_app:
-            establecer_usuario_app(conn, usuario_app)
-            
-        return conn
+        return _checkout(usuario_app)
     except Exception as e:
         print("Error al conectar a la base de datos:", e)
         return None
 
+
+@contextmanager
+def conexion(usuario_app=None):
+    """
+    Context manager sobre el pool: entrega una conexión y la devuelve al salir.
+    Si el bloque lanza una excepción se hace rollback antes de devolverla.
+
+        with conexion() as conn:
+            cur = conn.cursor()
+            ...
+    """
+    conn = _checkout(usuario_app)
+    try:
+        yield conn
+    except Exception:
+        if not conn.closed:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+
+def cerrar_pool():
+    """Cierra todas las conexiones del pool (al salir de la aplicación)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.closeall()
+            _pool = None
+
+
+atexit.register(cerrar_pool)
+
 def establecer_usuario_app(conn, usuario_app):
     """
     Establece el usuario de la aplicación en la variable de sesión de PostgreSQL
@@ -63,4 +236,4 @@ def probar_conexion_usuario(usuario_app):
     conn = conectar_db(usuario_app)
     if conn:
         verificar_variable_sesion(conn)
-        conn.close()
\ No newline at end of file
+        conn.close()
@@ -0,0 +1,164 @@
+# Benchmark: reconciliación de alertas de stock
+# bucle por producto (implementación anterior) vs SQL basado en conjuntos (SQL_NUEVAS_ALERTAS)
+#
+# Crea un schema temporal (bench_alertas) con stock sintético, corre ambas versiones
+# sobre copias idénticas, compara el resultado y borra el schema al terminar.
+# Usa la conexión configurada en bd.DB_CONFIG.
+#
+# Uso:
+#   python benchmarks/bench_alertas.py                      # 10k y 100k artículos
+#   python benchmarks/bench_alertas.py --articulos 100000 --cambios 0.05
+
+import argparse
+import os
+import sys
+import time
+
+import psycopg2
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from bd import DB_CONFIG
+from services.alertas_service import SQL_NUEVAS_ALERTAS, ServicioAlertas
+
+SCHEMA = "bench_alertas"
+
+
+def crear_datos(cur, n_articulos, proporcion_baja=0.2, seed=42):
+    """Stock sintético: ~proporcion_baja de los artículos por debajo de 1.25 x mínimo."""
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE; CREATE SCHEMA {SCHEMA};")
+    cur.execute("SELECT setseed(%s)", (seed / 100,))
+    cur.execute(f"""
+        CREATE TABLE {SCHEMA}.stock (
+            id_articulo integer PRIMARY KEY, descripcion text, cant_inventario integer, stock_minimo integer
+        );
+        INSERT INTO {SCHEMA}.stock
+        SELECT g, 'Artículo ' || g,
+               CASE WHEN random() < %s THEN (random() * 12)::int ELSE 20 + (random() * 200)::int END,
+               CASE WHEN random() < 0.1 THEN NULL ELSE 5 + (random() * 5)::int END
+        FROM generate_series(1, %s) g;
+    """, (proporcion_baja, n_articulos))
+    for version in ("bucle", "conjuntos"):
+        cur.execute(f"""
+            CREATE TABLE {SCHEMA}.alertas_{version} (
+                id_alerta serial PRIMARY KEY, id_producto integer, descripcion_producto text,
+                stock_actual integer, stock_minimo integer, nivel_alerta text, estado text,
+                fecha_alerta timestamp, fecha_resolucion timestamp, vista boolean DEFAULT false
+            );
+            CREATE UNIQUE INDEX ON {SCHEMA}.alertas_{version} (id_producto) WHERE estado = 'ACTIVA';
+        """)
+
+
+def modificar_stock(cur, proporcion):
+    """Simula movimientos: cambia el inventario de una fracción de los artículos."""
+    cur.execute(f"""
+        UPDATE {SCHEMA}.stock SET cant_inventario = GREATEST(0, cant_inventario + (random() * 10)::int - 6)
+        WHERE random() < %s
+    """, (proporcion,))
+
+
+def reconciliar_bucle(cur, tabla):
+    """Implementación anterior de verificar_nuevas_alertas (una sentencia por producto)."""
+    calcular_nivel = ServicioAlertas()._calcular_nivel
+    cambios = 0
+    cur.execute(f"""
+        SELECT id_producto, id_alerta, nivel_alerta, stock_actual, stock_minimo
+        FROM {SCHEMA}.{tabla} WHERE estado = 'ACTIVA'
+    """)
+    alertas_activas = {
+        row[0]: {'id': row[1], 'nivel': row[2], 'stock': row[3], 'minimo': row[4]}
+        for row in cur.fetchall()
+    }
+    cur.execute(f"""
+        SELECT id_articulo, descripcion, cant_inventario, COALESCE(stock_minimo, 5)
+        FROM {SCHEMA}.stock
+        WHERE cant_inventario <= COALESCE(stock_minimo, 5) * 1.25
+    """)
+    for pid, desc, stock, minimo in cur.fetchall():
+        nuevo_nivel = calcular_nivel(stock, minimo)
+        if pid in alertas_activas:
+            datos_alerta = alertas_activas[pid]
+            if (datos_alerta['nivel'] != nuevo_nivel or
+                    datos_alerta['stock'] != stock or
+                    datos_alerta['minimo'] != minimo):
+                cur.execute(f"""
+                    UPDATE {SCHEMA}.{tabla}
+                    SET nivel_alerta = %s, stock_actual = %s, fecha_alerta = NOW(), stock_minimo = %s
+                    WHERE id_alerta = %s
+                """, (nuevo_nivel, stock, minimo, datos_alerta['id']))
+                cambios += 1
+        else:
+            cur.execute(f"""
+                INSERT INTO {SCHEMA}.{tabla}
+                (id_producto, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta)
+                VALUES (%s, %s, %s, %s, %s, 'ACTIVA', NOW())
+            """, (pid, desc, stock, minimo, nuevo_nivel))
+            cambios += 1
+    return cambios
+
+
+def reconciliar_conjuntos(cur, tabla):
+    sql = (SQL_NUEVAS_ALERTAS
+           .replace("desarrollo.stock", f"{SCHEMA}.stock")
+           .replace("desarrollo.alertas_stock", f"{SCHEMA}.{tabla}"))
+    cur.execute(sql, {"ids": None})
+    actualizadas, insertadas = cur.fetchone()
+    return actualizadas + insertadas
+
+
+def cronometrar(conn, funcion, tabla):
+    with conn.cursor() as cur:
+        inicio = time.perf_counter()
+        cambios = funcion(cur, tabla)
+        conn.commit()
+        return cambios, time.perf_counter() - inicio
+
+
+def contenido(cur, tabla):
+    cur.execute(f"""
+        SELECT id_producto, stock_actual, stock_minimo, nivel_alerta, estado
+        FROM {SCHEMA}.{tabla} ORDER BY id_producto, id_alerta
+    """)
+    return cur.fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--articulos', type=int, nargs='+', default=[10000, 100000])
+    parser.add_argument('--cambios', type=float, default=0.05, help="Fracción de artículos que cambia entre ciclos")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        print(f"{'artículos':>10} | {'ciclo':<14} | {'cambios':>8} | {'bucle (s)':>10} | {'conjuntos (s)':>13} | {'speedup':>8}")
+        print("-" * 80)
+        for n_articulos in args.articulos:
+            with conn.cursor() as cur:
+                crear_datos(cur, n_articulos)
+            conn.commit()
+
+            for ciclo in ("inicial", "con cambios", "sin cambios"):
+                if ciclo == "con cambios":
+                    with conn.cursor() as cur:
+                        modificar_stock(cur, args.cambios)
+                    conn.commit()
+                cambios_bucle, t_bucle = cronometrar(conn, reconciliar_bucle, "alertas_bucle")
+                cambios_conj, t_conj = cronometrar(conn, reconciliar_conjuntos, "alertas_conjuntos")
+                assert cambios_bucle == cambios_conj, (cambios_bucle, cambios_conj)
+                print(f"{n_articulos:>10,} | {ciclo:<14} | {cambios_conj:>8,} | {t_bucle:>10.3f} | "
+                      f"{t_conj:>13.3f} | {t_bucle / t_conj:>7.0f}x")
+
+            with conn.cursor() as cur:
+                assert contenido(cur, "alertas_bucle") == contenido(cur, "alertas_conjuntos")
+    finally:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
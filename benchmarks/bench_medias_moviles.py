@@ -0,0 +1,71 @@
+# Micro-benchmark: medias móviles desplazadas (rm_3/rm_6/rm_12) de generar_features_mensuales
+# groupby.transform(lambda ...) por producto vs medias_moviles_desplazadas (ventanas por índice)
+#
+# Uso:
+#   python benchmarks/bench_medias_moviles.py
+#   python benchmarks/bench_medias_moviles.py --productos 1000 20000 --meses 48
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from model_trainer import medias_moviles_desplazadas
+
+VENTANAS = (3, 6, 12)
+
+
+def medias_legacy(df):
+    """Implementación anterior: una lambda de Python por producto y por ventana."""
+    grouped = df.groupby("v_id_producto")["cantidad_vendida"]
+    return {w: grouped.transform(lambda x: x.shift(1).rolling(window=w).mean()).to_numpy() for w in VENTANAS}
+
+
+def generar_datos(n_productos, n_meses, seed=42):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        "v_id_producto": np.repeat(np.arange(1, n_productos + 1), n_meses),
+        "fecha_mes": np.tile(pd.date_range("2021-01-01", periods=n_meses, freq="MS"), n_productos),
+        "cantidad_vendida": rng.gamma(2.0, 10.0, n_productos * n_meses).round(2),
+    })
+
+
+def cronometrar(funcion, repeticiones):
+    mejor = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        resultado = funcion()
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return resultado, mejor
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--productos', type=int, nargs='+', default=[1000, 5000, 20000])
+    parser.add_argument('--meses', type=int, default=36)
+    parser.add_argument('--repeticiones', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'productos':>10} | {'filas':>10} | {'legacy (s)':>10} | {'vectorizado (s)':>15} | {'speedup':>8} | {'máx. dif.':>10}")
+    print("-" * 80)
+    for n_productos in args.productos:
+        df = generar_datos(n_productos, args.meses)
+        legacy, t_legacy = cronometrar(lambda: medias_legacy(df), args.repeticiones)
+        nuevo, t_nuevo = cronometrar(
+            lambda: medias_moviles_desplazadas(df["cantidad_vendida"], df["v_id_producto"], VENTANAS),
+            args.repeticiones
+        )
+        diferencia = max(np.nanmax(np.abs(legacy[w] - nuevo[w])) for w in VENTANAS)
+        print(f"{n_productos:>10} | {len(df):>10,} | {t_legacy:>10.3f} | {t_nuevo:>15.4f} | {t_legacy / t_nuevo:>7.0f}x | {diferencia:>10.1e}")
+
+
+if __name__ == "__main__":
+    main()
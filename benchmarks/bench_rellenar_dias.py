@@ -0,0 +1,107 @@
+# Benchmark: rellenar_dias_sin_ventas (matrices densas) vs implementación anterior (MultiIndex + merge)
+#
+# Uso:
+#   python benchmarks/bench_rellenar_dias.py                    # 10k y 50k SKUs, 365 días
+#   python benchmarks/bench_rellenar_dias.py --skus 10000 --dias 1095
+#   python benchmarks/bench_rellenar_dias.py --sin-legacy       # solo la versión nueva
+
+import argparse
+import os
+import sys
+import multiprocessing as mp
+import time
+
+import numpy as np
+import pandas as pd
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from data_processor import rellenar_dias_sin_ventas
+
+
+def rellenar_legacy(df_ventas, df_productos):
+    """Implementación anterior, copiada tal cual para comparar."""
+    fecha_min = df_ventas['v_fecha'].min()
+    fecha_max = df_ventas['v_fecha'].max()
+    todas_fechas = pd.date_range(start=fecha_min, end=fecha_max, freq='D')
+    idx = pd.MultiIndex.from_product(
+        [todas_fechas, df_productos['v_id_producto'].unique()],
+        names=['v_fecha', 'v_id_producto']
+    )
+    df_completo = pd.DataFrame(index=idx).reset_index()
+    df_final = pd.merge(df_completo, df_ventas, on=['v_fecha', 'v_id_producto'], how='left')
+    df_final['cantidad_vendida'] = df_final['cantidad_vendida'].fillna(0)
+    df_final['precio_promedio'] = df_final.groupby('v_id_producto')['precio_promedio'].ffill()
+    df_final['precio_promedio'] = df_final.groupby('v_id_producto')['precio_promedio'].bfill()
+    df_final['precio_promedio'] = df_final['precio_promedio'].fillna(0)
+    return df_final
+
+
+def generar_datos(n_skus, n_dias, densidad, seed=42):
+    """Ventas sintéticas: cada SKU vende en ~densidad de los días."""
+    rng = np.random.default_rng(seed)
+    fechas = pd.date_range("2022-01-01", periods=n_dias, freq="D")
+    n_ventas = int(n_skus * n_dias * densidad)
+    pares = np.unique(rng.integers(0, n_skus * n_dias, n_ventas))
+    df_ventas = pd.DataFrame({
+        'v_fecha': fechas[pares // n_skus],
+        'v_id_producto': (pares % n_skus) + 1,
+        'cantidad_vendida': rng.integers(1, 20, len(pares)).astype(np.float64),
+        'precio_promedio': rng.uniform(1, 500, len(pares)),
+    })
+    df_productos = pd.DataFrame({'v_id_producto': np.arange(1, n_skus + 1), 'categoria': 'GENERAL'})
+    return df_ventas, df_productos
+
+
+def _worker(version, n_skus, n_dias, densidad, cola):
+    """Corre una sola versión en un proceso limpio para medir su pico de RSS."""
+    import resource
+    df_ventas, df_productos = generar_datos(n_skus, n_dias, densidad)
+    base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    funcion = rellenar_dias_sin_ventas if version == 'densa' else rellenar_legacy
+    inicio = time.perf_counter()
+    resultado = funcion(df_ventas, df_productos)
+    duracion = time.perf_counter() - inicio
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    cola.put((len(resultado), duracion, base / 1024, pico / 1024))
+
+
+def medir(version, n_skus, n_dias, densidad):
+    contexto = mp.get_context('spawn')
+    cola = contexto.Queue()
+    proceso = contexto.Process(target=_worker, args=(version, n_skus, n_dias, densidad, cola))
+    proceso.start()
+    resultado = cola.get()
+    proceso.join()
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--skus', type=int, nargs='+', default=[10000, 50000])
+    parser.add_argument('--dias', type=int, default=365)
+    parser.add_argument('--densidad', type=float, default=0.05)
+    parser.add_argument('--sin-legacy', action='store_true')
+    args = parser.parse_args()
+
+    # Verificación rápida de que ambas versiones devuelven exactamente lo mismo
+    df_ventas, df_productos = generar_datos(1000, 90, args.densidad)
+    pd.testing.assert_frame_equal(
+        rellenar_legacy(df_ventas, df_productos),
+        rellenar_dias_sin_ventas(df_ventas, df_productos),
+    )
+
+    versiones = ['densa'] if args.sin_legacy else ['densa', 'legacy']
+    print(f"{'SKUs':>8} | {'filas':>12} | {'versión':<8} | {'tiempo (s)':>10} | {'RSS datos (MB)':>14} | {'RSS pico (MB)':>13}")
+    print("-" * 82)
+    for n_skus in args.skus:
+        for version in versiones:
+            filas, duracion, base, pico = medir(version, n_skus, args.dias, args.densidad)
+            print(f"{n_skus:>8} | {filas:>12,} | {version:<8} | {duracion:>10.2f} | {base:>14.0f} | {pico:>13.0f}")
+
+
+if __name__ == "__main__":
+    main()
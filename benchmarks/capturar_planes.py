@@ -0,0 +1,235 @@
+# Captura de planes de ejecución (EXPLAIN) de las consultas críticas
+#
+# Guarda el plan de cada consulta en benchmarks/planes/<fecha_hora>.json y lo compara con la
+# captura anterior: marca REGRESIÓN si el costo estimado sube más de --tolerancia o si aparece
+# un Seq Scan sobre una tabla que antes se leía por índice.
+# Con --analizar se usa EXPLAIN ANALYZE (tiempos reales); las sentencias que modifican datos
+# se ejecutan dentro de una transacción que se descarta con ROLLBACK.
+#
+# Uso:
+#   python benchmarks/capturar_planes.py
+#   python benchmarks/capturar_planes.py --analizar --tolerancia 0.3
+
+import argparse
+import glob
+import json
+import os
+import sys
+from datetime import datetime
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+parent_dir = os.path.dirname(current_dir)
+if parent_dir not in sys.path:
+    sys.path.append(parent_dir)
+
+from bd import conexion
+from services.alertas_service import SQL_ALERTAS_RESUELTAS, SQL_NUEVAS_ALERTAS
+from services.indice_salidas import SQL_PRODUCTOS, SQL_SERIALES
+from services.kpis_service import SQL_KPIS, SQL_PREDICCION_MES
+from services.sugerencias_service import SQL_SUGERENCIAS_CLIENTES, SQL_SUGERENCIAS_PRODUCTOS
+
+DIR_PLANES = os.path.join(current_dir, "planes")
+
+# (nombre, sql, parámetros). Las copias de consultas de pantallas indican su origen.
+CONSULTAS = [
+    ("alertas_nuevas_completo", SQL_NUEVAS_ALERTAS, {"ids": None}),
+    ("alertas_nuevas_por_ids", SQL_NUEVAS_ALERTAS, {"ids": [1, 2, 3]}),
+    ("alertas_resueltas", SQL_ALERTAS_RESUELTAS, {"ids": None}),
+    # modulos/historial_alertas._consultar_bd (búsqueda por texto y por estado)
+    ("historial_alertas_texto", """
+        SELECT id_alerta, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta
+        FROM desarrollo.alertas_stock
+        WHERE 1=1 AND descripcion_producto ILIKE %s
+        ORDER BY fecha_alerta DESC LIMIT 50
+    """, ("%cable%",)),
+    ("historial_alertas_activas", """
+        SELECT id_alerta, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta
+        FROM desarrollo.alertas_stock
+        WHERE 1=1 AND estado = %s
+        ORDER BY fecha_alerta DESC LIMIT 50
+    """, ("ACTIVA",)),
+    # modulos/stock.buscar_articulos (primera página y página siguiente por keyset)
+    ("stock_busqueda", """
+        SELECT id_articulo, descripcion, precio_unit, cant_inventario, categoria, precio_total, moneda, codigo_barras
+        FROM desarrollo.stock
+        WHERE 1=1 AND (descripcion ILIKE %s OR codigo_barras ILIKE %s)
+        ORDER BY id_articulo DESC
+        LIMIT %s
+    """, ("%cable%", "%cable%", 200)),
+    ("stock_pagina_siguiente", """
+        SELECT id_articulo, descripcion, precio_unit, cant_inventario, categoria, precio_total, moneda, codigo_barras
+        FROM desarrollo.stock
+        WHERE 1=1 AND id_articulo < %s
+        ORDER BY id_articulo DESC
+        LIMIT %s
+    """, (50000, 200)),
+    # sugerencias al tipear (índices trigram de la migración 005)
+    ("sugerencias_productos", SQL_SUGERENCIAS_PRODUCTOS, {"contiene": "%cable%", "prefijo": "cable%", "limite": 8}),
+    ("sugerencias_clientes", SQL_SUGERENCIAS_CLIENTES, {"contiene": "%perez%", "prefijo": "perez%", "limite": 5}),
+    # carga del índice de salidas (completa y por ids/seriales tras un aviso del trigger)
+    ("indice_salidas_productos", SQL_PRODUCTOS, {"ids": None}),
+    ("indice_salidas_productos_ids", SQL_PRODUCTOS, {"ids": [1, 2, 3]}),
+    ("indice_salidas_seriales", SQL_SERIALES, {"seriales": None}),
+    ("indice_salidas_seriales_lista", SQL_SERIALES, {"seriales": ["SN0001", "SN0002"]}),
+    # services/indice_salidas._buscar_exacto_bd (respaldo cuando el índice no está listo)
+    ("salidas_buscar_exacto", """
+        SELECT id_articulo, descripcion, cant_inventario, precio_unit, codigo_barras
+        FROM desarrollo.stock
+        WHERE id_articulo::text = %(c)s OR codigo_barras = %(c)s
+           OR id_articulo = (SELECT id_producto FROM desarrollo.movimientos
+                             WHERE serial::text = %(c)s AND tipo_movimiento = 'SALIDA'
+                             ORDER BY fecha_entrega DESC LIMIT 1)
+    """, {"c": "SN0001"}),
+    # services/indice_salidas.venta_de_serial (índice parcial de la migración 006)
+    ("movimientos_venta_de_serial", """
+        SELECT s.descripcion, m.fecha_entrega
+        FROM desarrollo.movimientos m
+        JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
+        WHERE m.serial = %s AND m.tipo_movimiento = 'SALIDA'
+        ORDER BY m.fecha_entrega DESC LIMIT 1
+    """, ("SN0001",)),
+    # modulos/movimientos.SQL_INSERTAR_SALIDAS (control de duplicados + alta por bloque)
+    ("movimientos_insertar_salidas", """
+        WITH nuevos AS (
+            SELECT serial, COUNT(*) OVER (PARTITION BY serial) AS repeticiones
+            FROM unnest(%(seriales)s::text[]) AS serial
+        ),
+        duplicados AS (
+            SELECT serial FROM nuevos WHERE repeticiones > 1
+            UNION
+            SELECT m.serial FROM desarrollo.movimientos m
+            WHERE m.serial = ANY(%(seriales)s::text[]) AND m.tipo_movimiento = 'SALIDA'
+        ),
+        insertados AS (
+            INSERT INTO desarrollo.movimientos (id_producto, tipo_movimiento, cantidad, motivo, id_usuario, serial, cliente, fecha_entrega)
+            SELECT %(id_producto)s, 'SALIDA', 1, %(motivo)s, %(id_usuario)s, n.serial, %(cliente)s, NOW()
+            FROM nuevos n
+            WHERE NOT EXISTS (SELECT 1 FROM duplicados)
+            RETURNING 1
+        )
+        SELECT (SELECT COUNT(*) FROM insertados), ARRAY(SELECT serial FROM duplicados)
+    """, {"seriales": ["SN0001", "SN0002"], "id_producto": 1, "motivo": "VENTA", "id_usuario": 1, "cliente": "BENCH"}),
+    # modulos/movimientos.consultar_ultimas_salidas (tabla de la pestaña de salida)
+    ("movimientos_ultimas_salidas", """
+        SELECT m.id_movimiento, TO_CHAR(m.fecha_entrega, 'DD/MM/YYYY HH24:MI'),
+               s.descripcion, m.motivo, m.cliente, m.serial
+        FROM desarrollo.movimientos m
+        JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
+        WHERE m.tipo_movimiento = 'SALIDA'
+        ORDER BY m.fecha_entrega DESC LIMIT %s
+    """, (10,)),
+    # resumen mensual que leen las pantallas predictivas
+    ("ventas_mensuales_categoria", """
+        SELECT mes AS fecha, SUM(cantidad) AS cantidad
+        FROM desarrollo.ventas_mensuales
+        WHERE categoria = %s AND mes >= MAKE_DATE(%s, 1, 1) AND mes < MAKE_DATE(%s + 1, 1, 1)
+        GROUP BY 1 ORDER BY 1
+    """, ("GENERAL", 2024, 2024)),
+    # foto de KPIs del inicio (se recalcula solo cuando vence)
+    ("kpis_inicio", SQL_KPIS.format(prediccion=SQL_PREDICCION_MES), {"mes": 1, "anio": 2024, "umbral": 10}),
+]
+
+
+def _nodos(plan):
+    """Recorre el árbol del plan y devuelve todos los nodos."""
+    nodos = [plan]
+    for hijo in plan.get("Plans", []):
+        nodos.extend(_nodos(hijo))
+    return nodos
+
+
+def resumir(plan):
+    raiz = plan["Plan"]
+    lecturas = sorted({
+        f"{n['Node Type']} {n.get('Relation Name', '')}".strip() + (f" ({n['Index Name']})" if n.get("Index Name") else "")
+        for n in _nodos(raiz) if "Relation Name" in n or "Index Name" in n
+    })
+    return {
+        "costo": raiz["Total Cost"],
+        "tiempo_ms": plan.get("Execution Time"),
+        "lecturas": lecturas,
+        "seq_scans": sorted({n["Relation Name"] for n in _nodos(raiz) if n["Node Type"] == "Seq Scan"}),
+    }
+
+
+def capturar(analizar):
+    opciones = "ANALYZE, BUFFERS, FORMAT JSON" if analizar else "FORMAT JSON"
+    planes = {}
+    with conexion() as conn:
+        for nombre, sql, params in CONSULTAS:
+            cur = conn.cursor()
+            try:
+                cur.execute(f"EXPLAIN ({opciones}) {sql}", params)
+                plan = cur.fetchone()[0][0]
+                planes[nombre] = {"plan": plan, "resumen": resumir(plan)}
+            except Exception as e:
+                planes[nombre] = {"error": str(e)}
+            finally:
+                conn.rollback()  # descarta lo que haya hecho un EXPLAIN ANALYZE de UPDATE/INSERT
+    return planes
+
+
+def ultima_captura():
+    archivos = sorted(glob.glob(os.path.join(DIR_PLANES, "*.json")))
+    if not archivos:
+        return None, None
+    with open(archivos[-1], "r", encoding="utf-8") as f:
+        return os.path.basename(archivos[-1]), json.load(f)
+
+
+def comparar(actual, anterior, tolerancia):
+    """Devuelve la lista de regresiones (nombre, motivo)."""
+    regresiones = []
+    for nombre, datos in actual.items():
+        previo = (anterior or {}).get(nombre, {})
+        if "resumen" not in datos or "resumen" not in previo:
+            continue
+        nuevo, viejo = datos["resumen"], previo["resumen"]
+        if viejo["costo"] > 0 and nuevo["costo"] > viejo["costo"] * (1 + tolerancia):
+            regresiones.append((nombre, f"costo {viejo['costo']:,.1f} -> {nuevo['costo']:,.1f}"))
+        nuevos_seq = set(nuevo["seq_scans"]) - set(viejo["seq_scans"])
+        if nuevos_seq:
+            regresiones.append((nombre, f"Seq Scan nuevo sobre {', '.join(sorted(nuevos_seq))}"))
+    return regresiones
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--analizar', action='store_true', help="EXPLAIN ANALYZE (ejecuta las consultas)")
+    parser.add_argument('--tolerancia', type=float, default=0.2, help="Aumento de costo aceptado (0.2 = 20%%)")
+    parser.add_argument('--no-guardar', action='store_true')
+    args = parser.parse_args()
+
+    nombre_anterior, anterior = ultima_captura()
+    actual = capturar(args.analizar)
+
+    print(f"{'consulta':<30} | {'costo':>10} | {'tiempo (ms)':>11} | lecturas")
+    print("-" * 102)
+    for nombre, datos in actual.items():
+        if "error" in datos:
+            print(f"{nombre:<30} | ❌ {datos['error'].strip()}")
+            continue
+        r = datos["resumen"]
+        tiempo = f"{r['tiempo_ms']:.2f}" if r["tiempo_ms"] is not None else "-"
+        print(f"{nombre:<30} | {r['costo']:>10,.1f} | {tiempo:>11} | {'; '.join(r['lecturas'])}")
+
+    regresiones = comparar(actual, anterior, args.tolerancia)
+    if anterior is not None:
+        print(f"\nComparado con {nombre_anterior}:")
+        for nombre, motivo in regresiones:
+            print(f"⚠️ REGRESIÓN {nombre}: {motivo}")
+        if not regresiones:
+            print("✅ Sin regresiones.")
+
+    if not args.no_guardar:
+        os.makedirs(DIR_PLANES, exist_ok=True)
+        ruta = os.path.join(DIR_PLANES, f"{datetime.now():%Y%m%d_%H%M%S}.json")
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(actual, f, ensure_ascii=False, indent=2)
+        print(f"💾 Planes guardados en {ruta}")
+
+    return 1 if regresiones else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,153 @@
+# Archivo: bulk_loader.py
+# Carga masiva de DataFrames a PostgreSQL con COPY FROM STDIN (psycopg2.copy_expert)
+
+import io
+import time
+
+FILAS_POR_BLOQUE = 200000
+NULO_CSV = '\\N'
+
+
+def _nombre_tabla(schema, tabla):
+    return f"{schema}.{tabla}" if schema else tabla
+
+
+def copiar_dataframe(conn, df, tabla, schema=None, columnas=None, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Inserta el DataFrame en la tabla con COPY ... FROM STDIN (formato CSV).
+    Se envía por bloques desde un buffer en memoria para no duplicar todo el DataFrame como texto.
+    No hace commit: la transacción queda a cargo de quien llama.
+    Devuelve la cantidad de filas copiadas e imprime el rendimiento (filas/s).
+    """
+    columnas = list(columnas) if columnas is not None else list(df.columns)
+    destino = _nombre_tabla(schema, tabla)
+    sql_copy = (
+        f"COPY {destino} ({', '.join(columnas)}) FROM STDIN "
+        f"WITH (FORMAT csv, NULL '{NULO_CSV}')"
+    )
+
+    inicio = time.perf_counter()
+    total = len(df)
+    datos = df[columnas]
+    with conn.cursor() as cur:
+        for desde in range(0, total, filas_por_bloque):
+            buffer = io.StringIO()
+            datos.iloc[desde:desde + filas_por_bloque].to_csv(
+                buffer, header=False, index=False, na_rep=NULO_CSV
+            )
+            buffer.seek(0)
+            cur.copy_expert(sql_copy, buffer)
+
+    duracion = time.perf_counter() - inicio
+    velocidad = total / duracion if duracion > 0 else float('inf')
+    print(f"🚚 COPY {total:,} filas -> {destino} en {duracion:.2f}s ({velocidad:,.0f} filas/s)", flush=True)
+    return total
+
+
+def _indices(cur, schema, tabla):
+    """Devuelve {definición sin nombre: nombre del índice} para la tabla."""
+    cur.execute(
+        "SELECT indexname, indexdef FROM pg_indexes WHERE schemaname = %s AND tablename = %s",
+        (schema, tabla)
+    )
+    return {definicion.split(" USING ", 1)[1]: nombre for nombre, definicion in cur.fetchall()}
+
+
+def _tiene_dependencias(cur, schema, tabla):
+    """True si hay vistas, triggers, claves foráneas entrantes o políticas atadas a la tabla."""
+    oid = f"{schema}.{tabla}"
+    cur.execute("""
+        SELECT EXISTS (SELECT 1 FROM pg_depend d JOIN pg_rewrite r ON r.oid = d.objid
+                       WHERE d.refobjid = %(t)s::regclass AND r.ev_class <> d.refobjid)
+            OR EXISTS (SELECT 1 FROM pg_trigger WHERE tgrelid = %(t)s::regclass AND NOT tgisinternal)
+            OR EXISTS (SELECT 1 FROM pg_constraint WHERE confrelid = %(t)s::regclass)
+            OR EXISTS (SELECT 1 FROM pg_policy WHERE polrelid = %(t)s::regclass)
+    """, {"t": oid})
+    return cur.fetchone()[0]
+
+
+def _intercambiar(cur, schema, tabla, staging):
+    """RENAME de staging sobre la tabla, con los permisos, dueño, índices y secuencias de la original."""
+    original = f"{schema}.{tabla}"
+    indices_originales = _indices(cur, schema, tabla)
+
+    # Permisos (GRANT) y dueño de la tabla original
+    cur.execute("""
+        SELECT CASE WHEN a.grantee = 0 THEN 'PUBLIC' ELSE quote_ident(r.rolname) END,
+               a.privilege_type, a.is_grantable
+        FROM pg_class c CROSS JOIN LATERAL aclexplode(c.relacl) a
+        LEFT JOIN pg_roles r ON r.oid = a.grantee
+        WHERE c.oid = %s::regclass AND a.grantee <> c.relowner
+    """, (original,))
+    permisos = cur.fetchall()
+    cur.execute("""
+        SELECT quote_ident(pg_get_userbyid(relowner)), relowner <> (SELECT oid FROM pg_roles WHERE rolname = current_user)
+        FROM pg_class WHERE oid = %s::regclass
+    """, (original,))
+    dueno, otro_dueno = cur.fetchone()
+
+    # Secuencias de columnas serial que pertenecen a la tabla vieja (se borrarían con ella)
+    cur.execute("""
+        SELECT seq.relname, col.attname
+        FROM pg_depend d
+        JOIN pg_class seq ON seq.oid = d.objid AND seq.relkind = 'S'
+        JOIN pg_attribute col ON col.attrelid = d.refobjid AND col.attnum = d.refobjsubid
+        WHERE d.refobjid = %s::regclass AND d.deptype = 'a'
+    """, (original,))
+    secuencias = cur.fetchall()
+
+    for secuencia, columna in secuencias:
+        cur.execute(f"ALTER SEQUENCE {schema}.{secuencia} OWNED BY NONE")
+    cur.execute(f"DROP TABLE {original}")
+    cur.execute(f"ALTER TABLE {schema}.{staging} RENAME TO {tabla}")
+    for secuencia, columna in secuencias:
+        cur.execute(f"ALTER SEQUENCE {schema}.{secuencia} OWNED BY {original}.{columna}")
+
+    for definicion, nombre_nuevo in _indices(cur, schema, tabla).items():
+        nombre_original = indices_originales.get(definicion)
+        if nombre_original and nombre_original != nombre_nuevo:
+            cur.execute(f"ALTER INDEX {schema}.{nombre_nuevo} RENAME TO {nombre_original}")
+
+    for rol, privilegio, con_opcion in permisos:
+        cur.execute(f"GRANT {privilegio} ON {original} TO {rol}" + (" WITH GRANT OPTION" if con_opcion else ""))
+    if otro_dueno:
+        cur.execute(f"ALTER TABLE {original} OWNER TO {dueno}")
+
+
+def reemplazar_tabla(conn, df, tabla, schema, columnas=None, filas_por_bloque=FILAS_POR_BLOQUE):
+    """
+    Reemplaza todo el contenido de schema.tabla con el DataFrame:
+      1. Crea <tabla>_staging con la misma estructura (LIKE ... INCLUDING ALL), la carga con
+         COPY y la analiza. Mientras tanto la tabla original sigue disponible para lectura.
+      2. En una transacción corta borra la original y renombra la staging en su lugar,
+         restaurando nombres de índices, permisos, dueño y secuencias (serial).
+    Los lectores solo esperan durante el intercambio y ven la tabla anterior o la nueva,
+    nunca una a medio cargar.
+    Si la tabla tiene vistas, triggers, claves foráneas entrantes o políticas (que quedarían
+    atadas a la tabla borrada), el contenido se pasa desde la staging con TRUNCATE + INSERT
+    sobre la misma tabla: es una copia dentro del servidor, pero bloquea a los lectores mientras dura.
+    Hace commit al terminar (o rollback si algo falla).
+    """
+    staging = f"{tabla}_staging"
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {schema}.{staging}")
+            cur.execute(f"CREATE TABLE {schema}.{staging} (LIKE {schema}.{tabla} INCLUDING ALL)")
+        filas = copiar_dataframe(conn, df, staging, schema, columnas, filas_por_bloque)
+        with conn.cursor() as cur:
+            cur.execute(f"ANALYZE {schema}.{staging}")
+        conn.commit()
+
+        with conn.cursor() as cur:
+            if _tiene_dependencias(cur, schema, tabla):
+                print(f"ℹ️ {schema}.{tabla} tiene objetos dependientes: se reemplaza el contenido en el lugar.")
+                cur.execute(f"TRUNCATE {schema}.{tabla}")
+                cur.execute(f"INSERT INTO {schema}.{tabla} SELECT * FROM {schema}.{staging}")
+                cur.execute(f"DROP TABLE {schema}.{staging}")
+            else:
+                _intercambiar(cur, schema, tabla, staging)
+        conn.commit()
+        return filas
+    except Exception:
+        conn.rollback()
+        raise
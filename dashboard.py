@@ -12,7 +12,8 @@ import tkinter as tk
 from tkinter import messagebox
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import datetime # Para manejar fechas en las consultas
+from services.ejecutor_consultas import ejecutor_consultas
+from services.kpis_service import servicio_kpis
 
 def abrir_dashboard(nombre_usuario, volver_callback, conexion, usuario_db):
     
@@ -249,67 +250,73 @@ def abrir_dashboard(nombre_usuario, volver_callback, conexion, usuario_db):
     contenido_frame.pack(side="right", expand=True, fill="both")
 
     def limpiar_contenido():
+        ejecutor_consultas.cancelar_dentro_de(contenido_frame)
         for widget in contenido_frame.winfo_children():
             widget.destroy()
 
+    def navegar(comando):
+        """Cambia de pantalla descartando las consultas que la anterior dejó en curso."""
+        ejecutor_consultas.cancelar_dentro_de(contenido_frame)
+        comando()
+
+    def kpis_por_nivel(foto):
+        """De la foto de KPIs, solo lo que muestra el inicio para el nivel del usuario (el resto en 0)."""
+        kpis = {"total_productos": 0, "valor_inventario": 0, "total_alertas": 0,
+                "venta_predicha": 0, "ventas_reales_mes": 0}
+        if foto is None:
+            return kpis
+
+        # A. DATOS COMUNES (Todos ven la cantidad de productos)
+        kpis["total_productos"] = foto["total_productos"]
+
+        # B. DATOS PARA ENCARGADO (Nivel 3): valor de inventario, alertas y predicción del mes
+        if nivel_usuario == NIVEL_ENCARGADO:
+            for clave in ("valor_inventario", "total_alertas", "venta_predicha"):
+                kpis[clave] = foto[clave]
+
+        # C. DATOS PARA VENTAS (Nivel 2): cuánto se vendió este mes realmente
+        elif nivel_usuario == NIVEL_VENTAS:
+            kpis["ventas_reales_mes"] = foto["ventas_reales_mes"]
+
+        # D. DATOS PARA DEPÓSITO (Nivel 1): alertas de stock bajo
+        elif nivel_usuario == NIVEL_DEPOSITO:
+            kpis["total_alertas"] = foto["total_alertas"]
+        return kpis
+
+    def obtener_kpis():
+        """KPIs del inicio (fuera del hilo de Tk): una sola consulta, solo si la foto venció."""
+        return kpis_por_nivel(servicio_kpis.obtener())
+
     def mostrar_inicio():
         limpiar_contenido()
-        
-        total_productos = 0
-        valor_inventario = 0
-        total_alertas = 0
-        venta_predicha = 0
-        ventas_reales_mes = 0
-        
-        try:
-            # A. DATOS COMUNES (Todos ven la cantidad de productos)
-            res_prod = ejecutar_consulta("SELECT COUNT(*) FROM desarrollo.stock")
-            total_productos = res_prod[0][0] if res_prod else 0
-            
-            # B. DATOS PARA ENCARGADO (Nivel 3)
-            if nivel_usuario == NIVEL_ENCARGADO:
-                # Valor Inventario
-                res_valor = ejecutar_consulta("SELECT SUM(cant_inventario * precio_unit) FROM desarrollo.stock")
-                valor_inventario = res_valor[0][0] if res_valor and res_valor[0][0] else 0
-                
-                # Alertas
-                res_alertas = ejecutar_consulta("SELECT COUNT(*) FROM desarrollo.stock WHERE cant_inventario <= 10")
-                total_alertas = res_alertas[0][0] if res_alertas else 0
-                
-                # Predicciones
-                mes_actual = datetime.datetime.now().month
-                anio_actual = datetime.datetime.now().year
-                res_pred = ejecutar_consulta("SELECT SUM(cantidad_predicha) FROM desarrollo.prediccion_mensual WHERE mes = %s AND anio = %s", (mes_actual, 2024))
-                venta_predicha = res_pred[0][0] if res_pred and res_pred[0][0] else 0
-
-            # C. DATOS PARA VENTAS (Nivel 2)
-            elif nivel_usuario == NIVEL_VENTAS:
-                # En lugar de predicciones o alertas, el vendedor quiere ver CUÁNTO SE VENDIÓ ESTE MES REALMENTE
-                # Asumimos que tienes una tabla 'desarrollo.ventas' con fecha y precio_total
-                res_ventas = ejecutar_consulta("""
-                    SELECT SUM(v_montous_total) 
-                    FROM desarrollo.ventas 
-                    WHERE EXTRACT(MONTH FROM v_fecha) = EXTRACT(MONTH FROM CURRENT_DATE)
-                    AND EXTRACT(YEAR FROM v_fecha) = 2024 
-                """)
-                ventas_reales_mes = res_ventas[0][0] if res_ventas and res_ventas[0][0] else 0
-
-            # D. DATOS PARA DEPÓSITO (Nivel 1)
-            elif nivel_usuario == NIVEL_DEPOSITO:
-                # Al depósito le importan las alertas de stock bajo
-                res_alertas = ejecutar_consulta("SELECT COUNT(*) FROM desarrollo.stock WHERE cant_inventario <= 10")
-                total_alertas = res_alertas[0][0] if res_alertas else 0
 
-        except Exception as e:
-            print(f"Error cargando datos dashboard: {e}")
-            total_productos, valor_inventario, total_alertas, venta_predicha = 0, 0, 0, 0
-
-        # --- 2. CONSTRUCCIÓN DE LA INTERFAZ ---
-        
         # Frame con Scroll para que se adapte a cualquier pantalla
         main_scroll = ctk.CTkScrollableFrame(contenido_frame, fg_color="transparent")
         main_scroll.pack(fill="both", expand=True, padx=10, pady=10)
 
+        # Si la foto de KPIs sigue al día se arma al instante, sin consultar
+        foto = servicio_kpis.vigente()
+        if foto is not None:
+            pintar_inicio(main_scroll, None, kpis_por_nivel(foto))
+            return
+
+        lbl_cargando = ctk.CTkLabel(main_scroll, text="⏳ Cargando resumen...", font=("Arial", 14), text_color="gray")
+        lbl_cargando.pack(pady=40)
+
+        # Los KPIs se consultan en segundo plano; la pantalla se arma cuando llegan
+        ejecutor_consultas.enviar(main_scroll, obtener_kpis, clave="dashboard.kpis",
+                                  al_terminar=lambda kpis: pintar_inicio(main_scroll, lbl_cargando, kpis))
+
+    def pintar_inicio(main_scroll, lbl_cargando, kpis):
+        if lbl_cargando is not None: lbl_cargando.destroy()
+        total_productos = kpis["total_productos"]
+        valor_inventario = kpis["valor_inventario"]
+        total_alertas = kpis["total_alertas"]
+        venta_predicha = kpis["venta_predicha"]
+        ventas_reales_mes = kpis["ventas_reales_mes"]
+
+        # --- 2. CONSTRUCCIÓN DE LA INTERFAZ ---
+
         # Título de Bienvenida mejorado
         header_frame = ctk.CTkFrame(main_scroll, fg_color="transparent")
         header_frame.pack(fill="x", pady=(10, 20), padx=10)
@@ -380,15 +387,15 @@ def abrir_dashboard(nombre_usuario, volver_callback, conexion, usuario_db):
         # SOLO MOSTRAR SI TIENE PERMISO (Ventas o Encargado)
         if nivel_usuario in [NIVEL_VENTAS, NIVEL_ENCARGADO]:
             ctk.CTkButton(actions_frame, text="Ver Ventas", fg_color="#2ecc71", width=200, height=40, font=("Arial", 12, "bold"),
-                          command=lambda: ventas.mostrar_ventas(contenido_frame)).pack(pady=5)
+                          command=lambda: navegar(lambda: ventas.mostrar_ventas(contenido_frame))).pack(pady=5)
             
             ctk.CTkButton(actions_frame, text="Ver Predicciones", fg_color="#3498db", width=200, height=40, font=("Arial", 12, "bold"),
-                          command=lambda: reportes.mostrar_reportes_predictivos(contenido_frame)).pack(pady=5)
+                          command=lambda: navegar(lambda: reportes.mostrar_reportes_predictivos(contenido_frame))).pack(pady=5)
 
         # SOLO MOSTRAR SI TIENE PERMISO (Depósito o Encargado)
         if nivel_usuario in [NIVEL_DEPOSITO, NIVEL_ENCARGADO]:                  
             ctk.CTkButton(actions_frame, text="Gestionar Productos", fg_color="#95a5a6", width=200, height=40, font=("Arial", 12, "bold"),
-                          command=lambda: stock.mostrar_productos(contenido_frame)).pack(pady=5)
+                          command=lambda: navegar(lambda: stock.mostrar_productos(contenido_frame))).pack(pady=5)
         
     
     def mostrar_modulo(nombre):
@@ -400,10 +407,20 @@ def abrir_dashboard(nombre_usuario, volver_callback, conexion, usuario_db):
         ).pack(pady=30)
         
         
-    # Iniciar servicio de alertas en segundo plano
+    # Migraciones de esquema pendientes (índices), servicio de alertas e índice de salidas, en segundo plano
+    import threading
+    from migraciones import aplicar_migraciones
     from services import alertas_service
+    from services.indice_salidas import indice_salidas
     servicio_alertas = alertas_service.ServicioAlertas()
-    servicio_alertas.iniciar_servicio(intervalo=30)
+
+    def iniciar_segundo_plano():
+        aplicar_migraciones()
+        servicio_alertas.iniciar_servicio(intervalo=30)
+        indice_salidas.iniciar()
+        servicio_kpis.iniciar()
+
+    threading.Thread(target=iniciar_segundo_plano, daemon=True).start()
     
     def cerrar_aplicacion_completa():
         """Destruye la app y mata cualquier hilo en segundo plano (como el de alertas)."""
@@ -462,7 +479,7 @@ def abrir_dashboard(nombre_usuario, volver_callback, conexion, usuario_db):
         ctk.CTkButton(
             menu_frame,
             text=texto,
-            command=comando,
+            command=lambda c=comando: navegar(c),
             font=("Arial", 14),
             width=180,
             height=40,
@@ -2,34 +2,72 @@
 
 import sqlalchemy
 import os
+import threading
 import urllib.parse
 from dotenv import load_dotenv
 
-def conectar_data_db():
+# Cargar las variables de entorno desde el archivo .env (una sola vez por proceso)
+load_dotenv()
+
+# Opciones del pool de SQLAlchemy (sobrescribibles por variables de entorno)
+POOL_DEFAULTS = {
+    'pool_size': int(os.getenv("DB_POOL_SIZE", 5)),
+    'max_overflow': int(os.getenv("DB_MAX_OVERFLOW", 10)),
+    'pool_pre_ping': os.getenv("DB_POOL_PRE_PING", "1").lower() not in ("0", "false", "no"),
+}
+
+# Registro de motores ya creados: { db_uri: Engine }
+_engines = {}
+_engines_lock = threading.Lock()
+
+
+def construir_uri():
     """
-    Función que crea y devuelve un motor (Engine) de SQLAlchemy.
+    Arma la cadena de conexión a partir de las variables de entorno.
     """
-    # Cargar las variables de entorno desde el archivo .env
-    load_dotenv()
-    
-    # Obtener los datos de conexión
-    # ... (variables de entorno como antes) ...
-    user = os.getenv("DB_USER") 
+    user = os.getenv("DB_USER")
     password = os.getenv("DB_PASSWORD")
     host = os.getenv("DB_HOST")
     port = os.getenv("DB_PORT")
     db = os.getenv("DB_NAME")
-    
+
     password_encoded = urllib.parse.quote_plus(password)
-    
-    # Crear la cadena de conexión
-    db_uri = f"postgresql+psycopg2://{user}:{password_encoded}@{host}:{port}/{db}"
-    
+
+    return f"postgresql+psycopg2://{user}:{password_encoded}@{host}:{port}/{db}"
+
+
+def conectar_data_db(db_uri=None, **opciones_pool):
+    """
+    Función que devuelve un motor (Engine) de SQLAlchemy.
+    El motor se crea una sola vez por URI y se reutiliza en llamadas posteriores,
+    así data_processor, model_trainer y el optimizador comparten el mismo pool.
+    Las opciones (pool_size, max_overflow, pool_pre_ping) solo aplican al crearlo.
+    """
     try:
-        # Crea y devuelve el motor de SQLAlchemy
-        # ESTA PARTE ES CRUCIAL: Debe devolver el objeto Engine.
-        engine = sqlalchemy.create_engine(db_uri)
-        return engine # ¡Asegúrate de devolver el ENGINE!
+        if db_uri is None:
+            db_uri = construir_uri()
+
+        engine = _engines.get(db_uri)
+        if engine is not None:
+            return engine
+
+        with _engines_lock:
+            engine = _engines.get(db_uri)
+            if engine is None:
+                config = {**POOL_DEFAULTS, **opciones_pool}
+                engine = sqlalchemy.create_engine(db_uri, **config)
+                _engines[db_uri] = engine
+        return engine
     except Exception as e:
         print(f"❌ Error al conectar a la base de datos: {e}")
-        return None
\ No newline at end of file
+        return None
+
+
+def cerrar_engines():
+    """
+    Libera los pools de todos los motores registrados.
+    """
+    with _engines_lock:
+        for engine in _engines.values():
+            engine.dispose()
+        _engines.clear()
@@ -6,7 +6,7 @@ import os
 import sys
 from sqlalchemy import text
 import numpy as np
-import sys
+import argparse
 # --- FIX DE CODIFICACIÓN PARA WINDOWS ---
 if sys.stdout.encoding != 'utf-8':
     sys.stdout.reconfigure(encoding='utf-8')
@@ -25,21 +25,25 @@ try:
 except ImportError:
     # Fallback si data_connector está en otro lado o tiene otro nombre
     from bd import conectar_db as conectar_data_db
+from bulk_loader import copiar_dataframe, reemplazar_tabla
+import feature_store
+from resumen_ventas import refrescar_resumen_ventas
 
 # --- Configuración general ---
 TABLA_TEMPORAL = 'prediccion_dataset'
 SCHEMA = 'desarrollo'
+FECHA_INICIO_HISTORIA = '2022-01-01'
+CUANTIL_CLIPPING = 0.999
 
-def obtener_datos_brutos(engine):
+def obtener_datos_brutos(engine, fecha_limite=FECHA_INICIO_HISTORIA):
     """
     Extrae el historial de ventas diarias agregado por producto.
     Se optimiza haciendo la primera agregación en SQL.
     Ahora incluye el PRECIO PROMEDIO como feature.
+    fecha_limite: primer día a leer (en modo incremental, el high-water mark).
+    Devuelve None si la consulta falla (distinto de un DataFrame vacío: no hay ventas nuevas).
     """
     try:
-        # Usamos 2 años completos hacia atrás desde hoy
-        fecha_limite = '2022-01-01'
-
         sql_query = f"""
             SELECT 
                 DATE(v.v_fecha) as v_fecha,
@@ -64,7 +68,7 @@ def obtener_datos_brutos(engine):
 
     except Exception as e:
         print(f"❌ Error al obtener datos de ventas: {e}")
-        return pd.DataFrame()
+        return None
 
 def obtener_maestro_productos(engine):
     """
@@ -90,52 +94,271 @@ def obtener_maestro_productos(engine):
         print(f"⚠️ Error al obtener maestro de productos: {e}")
         return pd.DataFrame(columns=['v_id_producto', 'categoria'])
 
+def _rellenar_huecos_eje0(matriz, hacia_atras=False):
+    """
+    ffill (o bfill) de NaN a lo largo del eje de fechas, columna por columna.
+    Usa el índice del último valor válido acumulado con maximum/minimum.accumulate.
+    """
+    n_filas = matriz.shape[0]
+    filas = np.arange(n_filas, dtype=np.int32)[:, None]
+    validos = ~np.isnan(matriz)
+    if hacia_atras:
+        idx = np.where(validos, filas, n_filas - 1).astype(np.int32, copy=False)
+        idx = np.minimum.accumulate(idx[::-1], axis=0)[::-1]
+    else:
+        idx = np.where(validos, filas, 0).astype(np.int32, copy=False)
+        np.maximum.accumulate(idx, axis=0, out=idx)
+    return np.take_along_axis(matriz, idx, axis=0)
+
 def rellenar_dias_sin_ventas(df_ventas, df_productos):
     """
     Genera un registro con venta 0 para los días que un producto no tuvo ventas.
     Fundamental para series temporales.
     IMPORTANTE: Ahora también maneja el precio de manera inteligente.
+
+    Trabaja sobre matrices densas (fecha x producto) con posiciones enteras
+    en lugar de producto cartesiano + merge + groupby, así la memoria pico
+    queda cerca del tamaño del resultado.
     """
     print("⏳ Rellenando días sin ventas (esto puede tardar)...")
     
-    # Rango completo de fechas
+    # Rango completo de fechas y catálogo (mismo orden que el producto cartesiano)
     fecha_min = df_ventas['v_fecha'].min()
     fecha_max = df_ventas['v_fecha'].max()
     todas_fechas = pd.date_range(start=fecha_min, end=fecha_max, freq='D')
+    productos = df_productos['v_id_producto'].unique()
+    n_fechas, n_productos = len(todas_fechas), len(productos)
     
-    # Crear un DataFrame con todas las combinaciones posibles (producto x fecha)
-    # Usamos MultiIndex para hacer esto eficientemente
-    idx = pd.MultiIndex.from_product(
-        [todas_fechas, df_productos['v_id_producto'].unique()],
-        names=['v_fecha', 'v_id_producto']
-    )
-    df_completo = pd.DataFrame(index=idx).reset_index()
-    
-    # Unir con las ventas reales
-    df_final = pd.merge(
-        df_completo, 
-        df_ventas, 
-        on=['v_fecha', 'v_id_producto'], 
-        how='left'
-    )
+    # Posición (fila, columna) de cada venta real; las que no están en el catálogo se descartan (left join)
+    pos_fecha = todas_fechas.get_indexer(df_ventas['v_fecha'])
+    pos_prod = pd.Index(productos).get_indexer(df_ventas['v_id_producto'])
+    validas = (pos_fecha >= 0) & (pos_prod >= 0)
+    pos_fecha, pos_prod = pos_fecha[validas], pos_prod[validas]
     
     # Rellenar con 0 las ventas faltantes
-    df_final['cantidad_vendida'] = df_final['cantidad_vendida'].fillna(0)
+    cantidad = np.zeros((n_fechas, n_productos), dtype=np.float64)
+    cantidad[pos_fecha, pos_prod] = df_ventas['cantidad_vendida'].to_numpy(dtype=np.float64)[validas]
+    np.nan_to_num(cantidad, copy=False, nan=0.0)
     
     # Para el precio, usamos forward fill por producto (mantener último precio conocido)
-    # Esto es MUY IMPORTANTE: si no hay venta un día, mantenemos el último precio del producto
-    df_final['precio_promedio'] = df_final.groupby('v_id_producto')['precio_promedio'].ffill()
-    
-    # Si aún hay NaN al principio (producto sin ventas al inicio), usamos backfill
-    df_final['precio_promedio'] = df_final.groupby('v_id_producto')['precio_promedio'].bfill()
+    # y backfill para los días previos a la primera venta
+    precio = np.full((n_fechas, n_productos), np.nan, dtype=np.float64)
+    precio[pos_fecha, pos_prod] = df_ventas['precio_promedio'].to_numpy(dtype=np.float64)[validas]
+    precio = _rellenar_huecos_eje0(precio)
+    precio = _rellenar_huecos_eje0(precio, hacia_atras=True)
     
     # Si todavía hay NaN (producto sin ventas nunca), ponemos 0
-    df_final['precio_promedio'] = df_final['precio_promedio'].fillna(0)
+    np.nan_to_num(precio, copy=False, nan=0.0)
+    
+    # Aplanar en orden fecha-mayor (igual que MultiIndex.from_product([fechas, productos]))
+    df_final = pd.DataFrame({
+        'v_fecha': todas_fechas.repeat(n_productos),
+        'v_id_producto': np.tile(productos, n_fechas),
+        'cantidad_vendida': cantidad.ravel(),
+        'precio_promedio': precio.ravel(),
+    }, copy=False)
     
     print(f"📈 Dataset expandido: {len(df_ventas)} -> {len(df_final)} registros")
     return df_final
 
-def preparar_y_guardar_dataset():
+def obtener_estado_dataset(engine):
+    """
+    Devuelve (primer día, último día procesado) de la tabla del dataset.
+    El último día es el high-water mark del modo incremental.
+    Si la tabla no existe o está vacía devuelve (None, None).
+    """
+    try:
+        with engine.connect() as conn:
+            fila = conn.execute(text(f"SELECT MIN(v_fecha), MAX(v_fecha) FROM {SCHEMA}.{TABLA_TEMPORAL}")).fetchone()
+        if fila is None or fila[1] is None:
+            return None, None
+        return pd.Timestamp(fila[0]).normalize(), pd.Timestamp(fila[1]).normalize()
+    except Exception:
+        return None, None
+
+def enriquecer_dataset(df_completo, df_productos):
+    """
+    Agrega la categoría y las columnas de calendario al dataset diario.
+    """
+    df_final = pd.merge(df_completo, df_productos, on='v_id_producto', how='left')
+    df_final['categoria'] = df_final['categoria'].fillna('Sin categoría')
+
+    df_final['anio'] = df_final['v_fecha'].dt.year
+    df_final['mes'] = df_final['v_fecha'].dt.month
+    df_final['dia_del_mes'] = df_final['v_fecha'].dt.day
+    df_final['dia_de_la_semana'] = df_final['v_fecha'].dt.dayofweek
+    return df_final
+
+def sincronizar_feature_store(engine, df_final, desde=None):
+    """
+    Replica en el feature store Parquet lo que se acaba de guardar en la tabla.
+    desde=None: reconstrucción total. Con 'desde' se reescriben solo las particiones afectadas;
+    si el store no existe o quedó atrasado se exporta la tabla completa una vez.
+    Un error acá no invalida el dataset en PostgreSQL (model_trainer vuelve a leer de la BD).
+    """
+    if not feature_store.disponible():
+        print("ℹ️ pyarrow no está instalado: se omite el feature store Parquet.")
+        return
+    try:
+        if desde is None:
+            feature_store.escribir_completo(df_final, TABLA_TEMPORAL)
+            return
+        ultima = feature_store.leer_estado(TABLA_TEMPORAL)
+        if ultima is None or ultima < desde:
+            print("🗂️ Feature store inexistente o desactualizado: exportando la tabla completa...")
+            df_tabla = pd.read_sql(f"SELECT * FROM {SCHEMA}.{TABLA_TEMPORAL}", engine)
+            df_tabla['v_fecha'] = pd.to_datetime(df_tabla['v_fecha'])
+            feature_store.escribir_completo(df_tabla, TABLA_TEMPORAL)
+        else:
+            feature_store.actualizar_desde(df_final, TABLA_TEMPORAL, desde)
+    except Exception as e:
+        feature_store.invalidar(TABLA_TEMPORAL)
+        print(f"⚠️ No se pudo actualizar el feature store ({e}). Se reconstruirá en la próxima ejecución.")
+
+def construir_dataset_completo(engine, df_productos):
+    """
+    Reconstrucción total: lee todo el historial y recrea la tabla con 'replace'.
+    Solo se usa a pedido (--completo) o cuando la tabla todavía no existe.
+    """
+    # 1️⃣ Obtener datos
+    df_ventas = obtener_datos_brutos(engine)
+    if df_ventas is None or df_ventas.empty:
+        print("❌ Error: Datos insuficientes para continuar.")
+        return False
+
+    # 2️⃣ Rellenar días sin ventas (CRÍTICO para time series)
+    # Filtramos df_productos para usar solo los que tienen ventas alguna vez
+    productos_activos = df_ventas['v_id_producto'].unique()
+    df_productos_activos = df_productos[df_productos['v_id_producto'].isin(productos_activos)]
+    
+    df_completo = rellenar_dias_sin_ventas(df_ventas, df_productos_activos)
+
+    # 3️⃣ Enriquecer con categorías y 4️⃣ columnas de fecha
+    df_final = enriquecer_dataset(df_completo, df_productos)
+
+    # 5️⃣ Filtrado de Outliers (Opcional pero recomendado hacerlo POR PRODUCTO)
+    # Un enfoque simple es eliminar solo extremos absurdos globalmente para no distorsionar
+    # O mejor, usar clipping en lugar de eliminar filas.
+    print("✂️ Aplicando clipping de outliers extremos...")
+    limite_superior = df_final['cantidad_vendida'].quantile(CUANTIL_CLIPPING) # Muy conservador
+    df_final['cantidad_vendida'] = df_final['cantidad_vendida'].clip(upper=limite_superior)
+
+    # 6️⃣ Guardar en BD
+    print(f"💾 Guardando {len(df_final)} registros en {SCHEMA}.{TABLA_TEMPORAL}...")
+    
+    # La primera vez creamos la tabla con la estructura del DataFrame (y el índice por fecha
+    # que usa el modo incremental). Después reemplazamos su contenido con COPY a una tabla
+    # staging e intercambio por RENAME, en lugar de DROP/CREATE e INSERTs por lotes.
+    fecha_inicio, _ = obtener_estado_dataset(engine)
+    if fecha_inicio is None:
+        with engine.begin() as conn:
+            df_final.head(0).to_sql(TABLA_TEMPORAL, con=conn, schema=SCHEMA, if_exists='replace', index=False)
+            conn.execute(text(f"CREATE INDEX IF NOT EXISTS idx_{TABLA_TEMPORAL}_fecha ON {SCHEMA}.{TABLA_TEMPORAL} (v_fecha)"))
+
+    conn = engine.raw_connection()
+    try:
+        reemplazar_tabla(conn, df_final, TABLA_TEMPORAL, SCHEMA)
+    finally:
+        conn.close()
+
+    sincronizar_feature_store(engine, df_final)
+    
+    print("✅ Dataset preparado y guardado exitosamente (con precios incluidos).")
+    return True
+
+def actualizar_dataset_incremental(engine, df_productos, fecha_inicio, high_water_mark):
+    """
+    Procesa solo los días desde el high-water mark (inclusive, por si llegaron
+    ventas tardías de ese día) y reemplaza esa ventana en la tabla.
+    El último precio de cada producto se toma del día anterior ya guardado,
+    así el forward fill da el mismo resultado que una reconstrucción total.
+    """
+    desde = high_water_mark
+    dia_semilla = desde - pd.Timedelta(days=1)
+
+    df_ventas = obtener_datos_brutos(engine, desde.strftime('%Y-%m-%d'))
+    if df_ventas is None:
+        # Un error de lectura no es "sin ventas nuevas": el dataset queda sin actualizar
+        return False
+    if df_ventas.empty:
+        print(f"ℹ️ Sin ventas nuevas desde {desde.date()}. Nada que actualizar.")
+        return True
+
+    # La grilla es densa (una fila por producto y día): el día anterior tiene el último precio conocido
+    df_semilla = pd.read_sql(
+        text(f"SELECT v_id_producto, precio_promedio FROM {SCHEMA}.{TABLA_TEMPORAL} WHERE v_fecha = :dia"),
+        engine,
+        params={"dia": dia_semilla.to_pydatetime()}
+    )
+    df_semilla['v_fecha'] = dia_semilla
+    df_semilla['cantidad_vendida'] = 0.0
+
+    productos_existentes = set(df_semilla['v_id_producto'])
+    productos_ventana = set(df_ventas['v_id_producto'].unique())
+    productos_nuevos = productos_ventana - productos_existentes
+    df_productos_activos = df_productos[df_productos['v_id_producto'].isin(productos_existentes | productos_ventana)]
+    print(f"📌 High-water mark: {desde.date()} | {len(productos_nuevos)} productos nuevos")
+
+    # Rellenar la ventana usando el día semilla para arrastrar precios, y descartarlo después
+    df_entrada = pd.concat([df_semilla[df_ventas.columns], df_ventas], ignore_index=True)
+    df_ventana = rellenar_dias_sin_ventas(df_entrada, df_productos_activos)
+    df_ventana = df_ventana[df_ventana['v_fecha'] >= desde]
+
+    # Productos que venden por primera vez: en una reconstrucción total tendrían filas en 0
+    # desde el inicio del dataset con su primer precio (backfill), así que las generamos
+    nuevos = df_productos_activos['v_id_producto'][df_productos_activos['v_id_producto'].isin(productos_nuevos)].to_numpy()
+    partes = []
+    if len(nuevos) and fecha_inicio < desde:
+        fechas_previas = pd.date_range(start=fecha_inicio, end=dia_semilla, freq='D')
+        primer_dia = df_ventana[df_ventana['v_fecha'] == df_ventana['v_fecha'].min()]
+        precios_iniciales = primer_dia.set_index('v_id_producto')['precio_promedio'].reindex(nuevos).fillna(0).to_numpy()
+        partes.append(pd.DataFrame({
+            'v_fecha': fechas_previas.repeat(len(nuevos)),
+            'v_id_producto': np.tile(nuevos, len(fechas_previas)),
+            'cantidad_vendida': 0.0,
+            'precio_promedio': np.tile(precios_iniciales, len(fechas_previas)),
+        }))
+    partes.append(df_ventana)
+    df_final = enriquecer_dataset(pd.concat(partes, ignore_index=True), df_productos)
+
+    # Re-clipping de la ventana afectada con el límite del historial ya guardado
+    print("✂️ Aplicando clipping de outliers extremos a la ventana...")
+    with engine.connect() as conn:
+        limite_superior = conn.execute(
+            text(f"""
+                SELECT percentile_cont(:q) WITHIN GROUP (ORDER BY cantidad_vendida)
+                FROM {SCHEMA}.{TABLA_TEMPORAL} WHERE v_fecha < :desde
+            """),
+            {"q": CUANTIL_CLIPPING, "desde": desde.to_pydatetime()}
+        ).scalar()
+    if limite_superior is None:
+        limite_superior = df_final['cantidad_vendida'].quantile(CUANTIL_CLIPPING)
+    df_final['cantidad_vendida'] = df_final['cantidad_vendida'].clip(upper=limite_superior)
+
+    # Reemplazar la ventana en una sola transacción (upsert por rango de fechas)
+    print(f"💾 Actualizando {len(df_final)} registros en {SCHEMA}.{TABLA_TEMPORAL} (desde {desde.date()})...")
+    conn = engine.raw_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"DELETE FROM {SCHEMA}.{TABLA_TEMPORAL} WHERE v_fecha >= %s", (desde.to_pydatetime(),))
+        copiar_dataframe(conn, df_final, TABLA_TEMPORAL, SCHEMA)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    sincronizar_feature_store(engine, df_final, desde)
+
+    print("✅ Dataset actualizado incrementalmente.")
+    return True
+
+def preparar_y_guardar_dataset(completo=False):
+    """
+    Por defecto actualiza el dataset de forma incremental desde el último día procesado.
+    completo=True fuerza la reconstrucción total (también se usa si la tabla no existe).
+    """
     engine = conectar_data_db()
     if engine is None:
         print("❌ No se pudo conectar a la base de datos")
@@ -144,66 +367,41 @@ def preparar_y_guardar_dataset():
     try:
         print("🚀 Iniciando procesador de datos...")
 
-        # 1️⃣ Obtener datos
-        df_ventas = obtener_datos_brutos(engine)
         df_productos = obtener_maestro_productos(engine)
-
-        if df_ventas.empty or df_productos.empty:
+        if df_productos.empty:
             print("❌ Error: Datos insuficientes para continuar.")
             return False
 
-        # 2️⃣ Rellenar días sin ventas (CRÍTICO para time series)
-        # Filtramos df_productos para usar solo los que tienen ventas alguna vez
-        productos_activos = df_ventas['v_id_producto'].unique()
-        df_productos_activos = df_productos[df_productos['v_id_producto'].isin(productos_activos)]
-        
-        df_completo = rellenar_dias_sin_ventas(df_ventas, df_productos_activos)
-
-        # 3️⃣ Enriquecer con categorías
-        df_final = pd.merge(df_completo, df_productos, on='v_id_producto', how='left')
-        df_final['categoria'] = df_final['categoria'].fillna('Sin categoría')
-
-        # 4️⃣ Crear columnas de fecha
-        df_final['anio'] = df_final['v_fecha'].dt.year
-        df_final['mes'] = df_final['v_fecha'].dt.month
-        df_final['dia_del_mes'] = df_final['v_fecha'].dt.day
-        df_final['dia_de_la_semana'] = df_final['v_fecha'].dt.dayofweek
-
-        # 5️⃣ Filtrado de Outliers (Opcional pero recomendado hacerlo POR PRODUCTO)
-        # Un enfoque simple es eliminar solo extremos absurdos globalmente para no distorsionar
-        # O mejor, usar clipping en lugar de eliminar filas.
-        print("✂️ Aplicando clipping de outliers extremos...")
-        limite_superior = df_final['cantidad_vendida'].quantile(0.999) # Muy conservador
-        df_final['cantidad_vendida'] = df_final['cantidad_vendida'].clip(upper=limite_superior)
-
-        # 6️⃣ Guardar en BD
-        print(f"💾 Guardando {len(df_final)} registros en {SCHEMA}.{TABLA_TEMPORAL}...")
-        
-        # Usamos 'replace' para que recree la tabla con las columnas nuevas (como v_fecha y precio_promedio)
-        # Ya no es necesario el TRUNCATE previo si usamos replace, pero el engine.begin() es bueno mantenerlo.
-        with engine.begin() as conn:
-            df_final.to_sql(
-                TABLA_TEMPORAL,
-                con=conn,
-                schema=SCHEMA,
-                if_exists='replace',  # <--- CAMBIO CLAVE: 'replace' en lugar de 'append'
-                index=False,
-                chunksize=10000
-            )
-        
-        print("✅ Dataset preparado y guardado exitosamente (con precios incluidos).")
-        return True
+        fecha_inicio, high_water_mark = (None, None) if completo else obtener_estado_dataset(engine)
+
+        if high_water_mark is None:
+            print("🧱 Reconstrucción completa del dataset...")
+            ok = construir_dataset_completo(engine, df_productos)
+        else:
+            print("🔁 Actualización incremental del dataset...")
+            ok = actualizar_dataset_incremental(engine, df_productos, fecha_inicio, high_water_mark)
+
+        if not ok:
+            # Sin dataset nuevo no se publica un resumen que no le corresponde
+            print("❌ El dataset no se actualizó: no se refresca el resumen mensual de ventas.")
+            return False
+
+        # Resumen mensual de ventas que leen las pantallas predictivas
+        conn = engine.raw_connection()
+        try:
+            return refrescar_resumen_ventas(conn, completo=completo)
+        finally:
+            conn.close()
 
     except Exception as e:
         print(f"❌ Error crítico en data_processor: {e}")
         import traceback
         traceback.print_exc()
         return False
-    finally:
-        try:
-            engine.dispose()
-        except:
-            pass
 
 if __name__ == "__main__":
-    preparar_y_guardar_dataset()
\ No newline at end of file
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--completo', action='store_true', help="Reconstruye todo el dataset en lugar de actualizarlo")
+    args = parser.parse_args()
+    # Código de salida distinto de 0 si falló: monthly_service no entrena sobre datos viejos
+    sys.exit(0 if preparar_y_guardar_dataset(completo=args.completo) else 1)
\ No newline at end of file
@@ -0,0 +1,127 @@
+# Archivo: feature_store.py
+# Feature store local en Parquet para el pipeline de entrenamiento.
+# data_processor escribe el dataset diario particionado por anio/mes (formato hive)
+# y model_trainer lo lee sin tener que escanear la tabla completa en PostgreSQL.
+
+import json
+import os
+import shutil
+
+import pandas as pd
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+except ImportError:
+    pa = ds = None
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+RUTA_FEATURE_STORE = os.getenv("FEATURE_STORE_DIR", os.path.join(current_dir, "feature_store"))
+ARCHIVO_ESTADO = "_estado.json"   # los archivos con prefijo "_" no se leen como datos
+
+
+def disponible():
+    """True si pyarrow está instalado (sin él se sigue leyendo desde PostgreSQL)."""
+    return ds is not None
+
+
+def _ruta(tabla):
+    return os.path.join(RUTA_FEATURE_STORE, tabla)
+
+
+def _particionado():
+    return ds.partitioning(pa.schema([("anio", pa.int32()), ("mes", pa.int32())]), flavor="hive")
+
+
+def _a_tabla_arrow(df):
+    """DataFrame -> tabla Arrow con tipos fijos (categoria como diccionario) para que todas las particiones coincidan."""
+    tabla = pa.Table.from_pandas(df, preserve_index=False)
+    esquema = pa.schema([
+        pa.field(campo.name, pa.dictionary(pa.int32(), pa.string()))
+        if campo.name == "categoria" else
+        pa.field(campo.name, pa.int32()) if campo.name in ("anio", "mes") else campo
+        for campo in tabla.schema
+    ])
+    return tabla.cast(esquema)
+
+
+def leer_estado(tabla):
+    """Último día guardado en el feature store (None si no existe o quedó inconsistente)."""
+    try:
+        with open(os.path.join(_ruta(tabla), ARCHIVO_ESTADO), "r", encoding="utf-8") as f:
+            return pd.Timestamp(json.load(f)["ultima_fecha"])
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+
+def _guardar_estado(tabla, ultima_fecha):
+    with open(os.path.join(_ruta(tabla), ARCHIVO_ESTADO), "w", encoding="utf-8") as f:
+        json.dump({"ultima_fecha": str(pd.Timestamp(ultima_fecha).date())}, f)
+
+
+def invalidar(tabla):
+    """Borra la marca de estado: la próxima sincronización vuelve a exportar todo."""
+    try:
+        os.remove(os.path.join(_ruta(tabla), ARCHIVO_ESTADO))
+    except FileNotFoundError:
+        pass
+
+
+def escribir_completo(df, tabla):
+    """
+    Reescribe todo el dataset. Se escribe en un directorio temporal y se reemplaza al final,
+    así un lector nunca ve el store a medio escribir.
+    """
+    destino = _ruta(tabla)
+    staging = f"{destino}__staging"
+    shutil.rmtree(staging, ignore_errors=True)
+    ds.write_dataset(
+        _a_tabla_arrow(df), staging, format="parquet",
+        partitioning=_particionado(), basename_template="parte-{i}.parquet"
+    )
+    shutil.rmtree(destino, ignore_errors=True)
+    os.replace(staging, destino)
+    _guardar_estado(tabla, df["v_fecha"].max())
+    print(f"🗂️ Feature store: {len(df):,} filas escritas en {destino}", flush=True)
+
+
+def actualizar_desde(df_nuevo, tabla, desde):
+    """
+    Reemplaza las filas con v_fecha >= desde. Parquet no se edita en el lugar: se reescriben
+    solo las particiones (anio/mes) que aparecen en df_nuevo, conservando sus filas anteriores a 'desde'.
+    """
+    meses = df_nuevo[["anio", "mes"]].drop_duplicates()
+    claves = set(zip(meses["anio"].astype(int), meses["mes"].astype(int)))
+
+    existentes = leer(
+        tabla,
+        filtro=ds.field("anio").isin(sorted({a for a, _ in claves}))
+        & ds.field("mes").isin(sorted({m for _, m in claves}))
+        & (ds.field("v_fecha") < pd.Timestamp(desde))
+    ).to_pandas()
+    existentes = existentes[[(a, m) in claves for a, m in zip(existentes["anio"], existentes["mes"])]]
+
+    combinado = pd.concat([existentes[df_nuevo.columns], df_nuevo], ignore_index=True)
+    combinado["categoria"] = combinado["categoria"].astype(str)
+    ds.write_dataset(
+        _a_tabla_arrow(combinado), _ruta(tabla), format="parquet",
+        partitioning=_particionado(), basename_template="parte-{i}.parquet",
+        existing_data_behavior="delete_matching"
+    )
+    _guardar_estado(tabla, df_nuevo["v_fecha"].max())
+    print(f"🗂️ Feature store: {len(claves)} particiones reescritas ({len(combinado):,} filas)", flush=True)
+
+
+def leer(tabla, columnas=None, filtro=None, desde=None):
+    """
+    Lee el dataset como tabla Arrow, solo con las columnas pedidas.
+    'desde' se traduce en un filtro sobre la partición anio (descarta directorios enteros)
+    y sobre v_fecha (usa las estadísticas de cada archivo), así no se lee lo que no se usa.
+    """
+    if desde is not None:
+        desde = pd.Timestamp(desde)
+        filtro_desde = (ds.field("anio") >= desde.year) & (ds.field("v_fecha") >= desde)
+        filtro = filtro_desde if filtro is None else filtro & filtro_desde
+    dataset = ds.dataset(_ruta(tabla), format="parquet", partitioning=_particionado())
+    return dataset.to_table(columns=columnas, filter=filtro)
@@ -0,0 +1,412 @@
+# Archivo: migraciones.py
+# Migraciones de esquema versionadas (índices de soporte para las consultas críticas y los
+# triggers de LISTEN/NOTIFY que usan los servicios en segundo plano).
+# Cada migración se aplica una sola vez, en orden, y queda registrada en desarrollo.schema_migraciones.
+#
+# Uso:
+#   python migraciones.py            # aplica las pendientes
+#   python migraciones.py --estado   # lista aplicadas / pendientes
+#
+# También las aplica cada terminal al abrir el dashboard: un advisory lock hace que una sola
+# a la vez las ejecute (las demás esperan y después encuentran todo aplicado).
+
+import argparse
+import re
+import time
+
+import psycopg2
+
+from bd import conexion, DB_CONFIG
+
+SCHEMA = "desarrollo"
+
+
+def _triggers_por_sentencia(tabla, funcion):
+    """Triggers FOR EACH STATEMENT con tablas de transición (uno por operación) para los KPIs."""
+    return [
+        f"DROP TRIGGER IF EXISTS trg_{tabla}_kpis_ins ON {SCHEMA}.{tabla}",
+        f"""CREATE TRIGGER trg_{tabla}_kpis_ins AFTER INSERT ON {SCHEMA}.{tabla}
+            REFERENCING NEW TABLE AS nuevas
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{funcion}()""",
+        f"DROP TRIGGER IF EXISTS trg_{tabla}_kpis_upd ON {SCHEMA}.{tabla}",
+        f"""CREATE TRIGGER trg_{tabla}_kpis_upd AFTER UPDATE ON {SCHEMA}.{tabla}
+            REFERENCING OLD TABLE AS viejas NEW TABLE AS nuevas
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{funcion}()""",
+        f"DROP TRIGGER IF EXISTS trg_{tabla}_kpis_del ON {SCHEMA}.{tabla}",
+        f"""CREATE TRIGGER trg_{tabla}_kpis_del AFTER DELETE ON {SCHEMA}.{tabla}
+            REFERENCING OLD TABLE AS viejas
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.{funcion}()""",
+        f"DROP TRIGGER IF EXISTS trg_{tabla}_kpis_trunc ON {SCHEMA}.{tabla}",
+        f"""CREATE TRIGGER trg_{tabla}_kpis_trunc AFTER TRUNCATE ON {SCHEMA}.{tabla}
+            FOR EACH STATEMENT EXECUTE FUNCTION {SCHEMA}.notificar_kpis_recalcular()""",
+    ]
+
+
+# (versión, descripción, sentencias). Agregar siempre al final: las versiones no se reordenan.
+MIGRACIONES = [
+    ("001", "Índice parcial de alertas ACTIVAS por producto", [
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alertas_stock_activa
+            ON {SCHEMA}.alertas_stock (id_producto) WHERE estado = 'ACTIVA'""",
+    ]),
+    ("002", "Índice sobre el umbral de stock bajo (cant_inventario <= mínimo x 1.25)", [
+        # Índice parcial cuyo predicado es exactamente la condición del servicio de alertas:
+        # solo contiene los artículos en zona de alerta, así la revisión no recorre todo el stock
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_umbral_alerta
+            ON {SCHEMA}.stock (id_articulo) WHERE cant_inventario <= COALESCE(stock_minimo, 5) * 1.25""",
+    ]),
+    ("003", "pg_trgm + GIN para ILIKE en el historial de alertas", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alertas_stock_descripcion_trgm
+            ON {SCHEMA}.alertas_stock USING gin (descripcion_producto gin_trgm_ops)""",
+    ]),
+    ("004", "Orden por fecha del historial de alertas", [
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_alertas_stock_fecha
+            ON {SCHEMA}.alertas_stock (fecha_alerta DESC)""",
+    ]),
+    ("005", "GIN trigram para la búsqueda de artículos (descripción, código de barras, categoría)", [
+        "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_descripcion_trgm
+            ON {SCHEMA}.stock USING gin (descripcion gin_trgm_ops)""",
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_codigo_barras_trgm
+            ON {SCHEMA}.stock USING gin (codigo_barras gin_trgm_ops)""",
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_stock_categoria_trgm
+            ON {SCHEMA}.stock USING gin (categoria gin_trgm_ops)""",
+    ]),
+    ("006", "Seriales vendidos (control de duplicados y consulta de garantía)", [
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_movimientos_serial_salida
+            ON {SCHEMA}.movimientos (serial) WHERE tipo_movimiento = 'SALIDA'""",
+    ]),
+    ("007", "Resumen mensual de ventas (ventas_mensuales) con clave primaria", [
+        f"""CREATE TABLE IF NOT EXISTS {SCHEMA}.ventas_mensuales (
+            categoria     text    NOT NULL,   -- TRIM(UPPER(stock.categoria)), igual que el combo de las pantallas
+            mes           date    NOT NULL,   -- primer día del mes
+            v_id_producto integer NOT NULL,
+            cantidad      numeric NOT NULL
+        )""",
+        # Es un resumen derivado: se vacía (puede tener meses duplicados de refrescos simultáneos)
+        # y el próximo refresco lo reconstruye entero
+        f"TRUNCATE {SCHEMA}.ventas_mensuales",
+        f"""ALTER TABLE {SCHEMA}.ventas_mensuales
+            ADD CONSTRAINT ventas_mensuales_pkey PRIMARY KEY (categoria, mes, v_id_producto)""",
+        # La clave primaria ya cubre las búsquedas por (categoria, mes)
+        f"DROP INDEX IF EXISTS {SCHEMA}.idx_ventas_mensuales_categoria_mes",
+    ]),
+    ("008", "Ventas por fecha (refresco incremental del resumen mensual)", [
+        f"""CREATE INDEX CONCURRENTLY IF NOT EXISTS idx_ventas_fecha
+            ON {SCHEMA}.ventas (v_fecha)""",
+    ]),
+    ("009", "Predicción por TRIM(UPPER(categoria)) para las pantallas predictivas", [
+        # reemplazar_tabla lo copia a la tabla staging (LIKE ... INCLUDING ALL) y le devuelve el nombre al intercambiarla
+        f"""CREATE INDEX IF NOT EXISTS idx_prediccion_mensual_categoria
+            ON {SCHEMA}.prediccion_mensual ((TRIM(UPPER(categoria))), v_fecha)""",
+    ]),
+    ("010", "Trigger de avisos de stock para el servicio de alertas", [
+        # Canal 'stock_cambios' = CANAL_STOCK de services/alertas_service.py
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_cambio_stock() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('stock_cambios', NEW.id_articulo::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS trg_stock_notificar ON {SCHEMA}.stock",
+        f"""CREATE TRIGGER trg_stock_notificar
+            AFTER INSERT OR UPDATE OF cant_inventario, stock_minimo ON {SCHEMA}.stock
+            FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.notificar_cambio_stock()""",
+    ]),
+    ("011", "Triggers del índice de salidas (stock y movimientos)", [
+        # Canal 'indice_salidas' = CANAL_INDICE de services/indice_salidas.py
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_indice_stock() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('indice_salidas', 's' || COALESCE(NEW.id_articulo, OLD.id_articulo)::text);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_indice_movimiento() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP <> 'INSERT' AND OLD.serial IS NOT NULL THEN
+                    PERFORM pg_notify('indice_salidas', 'm' || OLD.serial::text);
+                END IF;
+                IF TG_OP <> 'DELETE' AND NEW.serial IS NOT NULL THEN
+                    PERFORM pg_notify('indice_salidas', 'm' || NEW.serial::text);
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+        f"DROP TRIGGER IF EXISTS trg_stock_indice ON {SCHEMA}.stock",
+        f"""CREATE TRIGGER trg_stock_indice
+            AFTER INSERT OR UPDATE OR DELETE ON {SCHEMA}.stock
+            FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.notificar_indice_stock()""",
+        f"DROP TRIGGER IF EXISTS trg_movimientos_indice ON {SCHEMA}.movimientos",
+        f"""CREATE TRIGGER trg_movimientos_indice
+            AFTER INSERT OR UPDATE OF serial, tipo_movimiento, fecha_entrega OR DELETE ON {SCHEMA}.movimientos
+            FOR EACH ROW EXECUTE FUNCTION {SCHEMA}.notificar_indice_movimiento()""",
+    ]),
+    ("012", "Triggers de los KPIs del inicio (diferencias por sentencia en stock y ventas)", [
+        # Canal 'kpis_inicio' = CANAL_KPIS y umbral 10 = UMBRAL_STOCK_BAJO de services/kpis_service.py.
+        # <n> de cada aviso sale de esta secuencia (ver el formato en kpis_service)
+        f"CREATE SEQUENCE IF NOT EXISTS {SCHEMA}.kpis_avisos_seq",
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_kpis_recalcular() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify('kpis_inicio', concat_ws(':', 'x', txid_current(), nextval('{SCHEMA}.kpis_avisos_seq')));
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_kpis_stock() RETURNS trigger AS $$
+            DECLARE
+                d_total bigint := 0; d_valor numeric := 0; d_bajo bigint := 0;
+                n bigint; v numeric; b bigint;
+            BEGIN
+                -- Las tablas de transición solo existen para su operación: cada consulta en su rama
+                IF TG_OP <> 'DELETE' THEN
+                    SELECT COUNT(*), COALESCE(SUM(cant_inventario * precio_unit), 0),
+                           COUNT(*) FILTER (WHERE cant_inventario <= 10)
+                    INTO n, v, b FROM nuevas;
+                    d_total := d_total + n; d_valor := d_valor + v; d_bajo := d_bajo + b;
+                END IF;
+                IF TG_OP <> 'INSERT' THEN
+                    SELECT COUNT(*), COALESCE(SUM(cant_inventario * precio_unit), 0),
+                           COUNT(*) FILTER (WHERE cant_inventario <= 10)
+                    INTO n, v, b FROM viejas;
+                    d_total := d_total - n; d_valor := d_valor - v; d_bajo := d_bajo - b;
+                END IF;
+                IF d_total <> 0 OR d_valor <> 0 OR d_bajo <> 0 THEN
+                    PERFORM pg_notify('kpis_inicio', concat_ws(':', 's', txid_current(), nextval('{SCHEMA}.kpis_avisos_seq'),
+                                                                d_total, d_valor, d_bajo));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+        f"""CREATE OR REPLACE FUNCTION {SCHEMA}.notificar_kpis_ventas() RETURNS trigger AS $$
+            DECLARE
+                deltas text;
+            BEGIN
+                IF TG_OP = 'INSERT' THEN
+                    SELECT string_agg(mes || '=' || monto, ';') INTO deltas FROM (
+                        SELECT to_char(v_fecha, 'YYYY-MM') AS mes, SUM(v_montous_total) AS monto
+                        FROM nuevas GROUP BY 1 HAVING COALESCE(SUM(v_montous_total), 0) <> 0) d;
+                ELSIF TG_OP = 'DELETE' THEN
+                    SELECT string_agg(mes || '=' || monto, ';') INTO deltas FROM (
+                        SELECT to_char(v_fecha, 'YYYY-MM') AS mes, -SUM(v_montous_total) AS monto
+                        FROM viejas GROUP BY 1 HAVING COALESCE(SUM(v_montous_total), 0) <> 0) d;
+                ELSE
+                    SELECT string_agg(mes || '=' || monto, ';') INTO deltas FROM (
+                        SELECT mes, SUM(monto) AS monto FROM (
+                            SELECT to_char(v_fecha, 'YYYY-MM') AS mes, v_montous_total AS monto FROM nuevas
+                            UNION ALL
+                            SELECT to_char(v_fecha, 'YYYY-MM'), -v_montous_total FROM viejas) c
+                        GROUP BY 1 HAVING COALESCE(SUM(monto), 0) <> 0) d;
+                END IF;
+                IF deltas IS NOT NULL THEN
+                    -- Un aviso de NOTIFY no puede pasar de 8000 bytes: si no entra, que se recalcule
+                    IF length(deltas) > 7000 THEN deltas := '*'; END IF;
+                    PERFORM pg_notify('kpis_inicio', concat_ws(':', 'v', txid_current(), nextval('{SCHEMA}.kpis_avisos_seq'), deltas));
+                END IF;
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql""",
+    ] + _triggers_por_sentencia("stock", "notificar_kpis_stock")
+      + _triggers_por_sentencia("ventas", "notificar_kpis_ventas")),
+    ("013", "Una sola alerta ACTIVA por producto (índice único para INSERT ... ON CONFLICT)", [
+        # Duplicados que dejaron reconciliaciones simultáneas: queda activa la más reciente
+        f"""UPDATE {SCHEMA}.alertas_stock a
+            SET estado = 'RESUELTA', fecha_resolucion = NOW()
+            WHERE a.estado = 'ACTIVA'
+              AND EXISTS (SELECT 1 FROM {SCHEMA}.alertas_stock b
+                          WHERE b.id_producto = a.id_producto AND b.estado = 'ACTIVA'
+                            AND b.id_alerta > a.id_alerta)""",
+        f"""CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS idx_alertas_stock_activa_unica
+            ON {SCHEMA}.alertas_stock (id_producto) WHERE estado = 'ACTIVA'""",
+        # Mismas columnas y predicado que el de la 001: el único lo reemplaza
+        f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.idx_alertas_stock_activa",
+    ]),
+]
+
+# Dependen de algo externo (p. ej. que el servidor tenga instalada la extensión pg_trgm):
+# si fallan se saltean y se reintentan en la próxima ejecución, sin frenar las siguientes.
+# La 009 necesita que exista prediccion_mensual (la crea el primer entrenamiento).
+MIGRACIONES_OPCIONALES = {"003", "005", "009"}
+
+# Índices sobre tablas con escrituras constantes (stock, alertas_stock, movimientos): se crean
+# con CREATE INDEX CONCURRENTLY, que no bloquea las escrituras pero no puede ir dentro de una
+# transacción. Estas migraciones corren en autocommit, sentencia por sentencia.
+MIGRACIONES_CONCURRENTES = {"001", "002", "003", "004", "005", "006", "008", "013"}
+
+# Llave del pg_advisory_lock que serializa a las terminales que migran a la vez
+LLAVE_MIGRACIONES = 8150019
+
+_INDICE_CONCURRENTE = re.compile(r"CREATE (?:UNIQUE )?INDEX CONCURRENTLY IF NOT EXISTS (\w+)")
+
+
+def _asegurar_tabla_versiones(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SCHEMA}.schema_migraciones (
+            version     text PRIMARY KEY,
+            descripcion text NOT NULL,
+            aplicada    timestamptz NOT NULL DEFAULT NOW()
+        )
+    """)
+
+
+def _leer_aplicadas(conn):
+    cur = conn.cursor()
+    _asegurar_tabla_versiones(cur)
+    cur.execute(f"SELECT version, aplicada FROM {SCHEMA}.schema_migraciones")
+    aplicadas = dict(cur.fetchall())
+    conn.commit()
+    return aplicadas
+
+
+def migraciones_aplicadas():
+    """Devuelve {versión: fecha de aplicación}."""
+    with conexion() as conn:
+        return _leer_aplicadas(conn)
+
+
+def triggers_instalados(nombres):
+    """
+    True si existen todos los triggers indicados en el esquema. Los servicios solo lo consultan
+    al arrancar: crearlos es tarea de las migraciones (si faltan, pasan a revisión periódica).
+    """
+    try:
+        with conexion() as conn:
+            cur = conn.cursor()
+            cur.execute("""
+                SELECT COUNT(DISTINCT t.tgname) FROM pg_trigger t
+                JOIN pg_class c ON c.oid = t.tgrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND t.tgname = ANY(%s) AND NOT t.tgisinternal
+            """, (SCHEMA, list(nombres)))
+            return cur.fetchone()[0] == len(set(nombres))
+    except Exception as e:
+        print(f"Error consultando triggers: {e}")
+        return False
+
+
+def _registrar(cur, version, descripcion):
+    cur.execute(
+        f"INSERT INTO {SCHEMA}.schema_migraciones (version, descripcion) VALUES (%s, %s)",
+        (version, descripcion)
+    )
+
+
+def _aplicar_concurrente(conn, version, descripcion, sentencias):
+    """Cada sentencia en autocommit. Si una falla, borra los índices que quedaron a medio crear (INVALID)."""
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        try:
+            for sentencia in sentencias:
+                cur.execute(sentencia)
+        except Exception:
+            # Un CREATE INDEX CONCURRENTLY interrumpido deja el índice INVALID, y con
+            # IF NOT EXISTS el reintento no lo repararía: se borra para crearlo de nuevo.
+            for nombre in _INDICE_CONCURRENTE.findall(" ".join(sentencias)):
+                cur.execute("""
+                    SELECT 1 FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                    JOIN pg_namespace n ON n.oid = c.relnamespace
+                    WHERE n.nspname = %s AND c.relname = %s AND NOT i.indisvalid
+                """, (SCHEMA, nombre))
+                if cur.fetchone():
+                    cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {SCHEMA}.{nombre}")
+            raise
+        _registrar(cur, version, descripcion)
+    finally:
+        conn.autocommit = False
+
+
+def _aplicar_en_transaccion(conn, version, descripcion, sentencias):
+    try:
+        cur = conn.cursor()
+        for sentencia in sentencias:
+            cur.execute(sentencia)
+        _registrar(cur, version, descripcion)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def _tomar_lock(conn, espera=1.0):
+    """
+    Toma el advisory lock de sesión. Mientras otra terminal lo tenga se reintenta en autocommit
+    en lugar de esperar con pg_advisory_lock: una sentencia bloqueada conserva su snapshot, y
+    CREATE INDEX CONCURRENTLY de la otra terminal esperaría por ella (deadlock).
+    """
+    conn.autocommit = True
+    try:
+        cur = conn.cursor()
+        avisado = False
+        while True:
+            cur.execute("SELECT pg_try_advisory_lock(%s)", (LLAVE_MIGRACIONES,))
+            if cur.fetchone()[0]:
+                return
+            if not avisado:
+                print("⏳ Otra terminal está migrando el esquema, esperando...")
+                avisado = True
+            time.sleep(espera)
+    finally:
+        conn.autocommit = False
+
+
+def aplicar_migraciones():
+    """
+    Aplica en orden las migraciones pendientes: cada una en su propia transacción, salvo
+    las de MIGRACIONES_CONCURRENTES (autocommit, ver arriba).
+    Si una falla se informa y se detiene: las siguientes quedan pendientes para la próxima
+    ejecución. Las opcionales (MIGRACIONES_OPCIONALES) que fallan solo se saltean.
+    Usa una conexión dedicada que mantiene el advisory lock mientras migra; las versiones
+    aplicadas se leen después de tomarlo, así dos terminales nunca aplican la misma.
+    Devuelve la cantidad de migraciones aplicadas.
+    """
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+    except Exception as e:
+        print(f"❌ Error conectando para migrar el esquema: {e}")
+        return 0
+
+    nuevas = 0
+    try:
+        _tomar_lock(conn)
+
+        try:
+            aplicadas = _leer_aplicadas(conn)
+        except Exception as e:
+            conn.rollback()
+            print(f"❌ Error leyendo versiones de esquema: {e}")
+            return 0
+
+        for version, descripcion, sentencias in MIGRACIONES:
+            if version in aplicadas:
+                continue
+            try:
+                if version in MIGRACIONES_CONCURRENTES:
+                    _aplicar_concurrente(conn, version, descripcion, sentencias)
+                else:
+                    _aplicar_en_transaccion(conn, version, descripcion, sentencias)
+                nuevas += 1
+                print(f"🧱 Migración {version} aplicada: {descripcion}")
+            except Exception as e:
+                if version in MIGRACIONES_OPCIONALES:
+                    print(f"⚠️ Migración opcional {version} omitida ({descripcion}): {e}")
+                    continue
+                print(f"❌ Migración {version} falló ({descripcion}): {e}")
+                break
+        return nuevas
+    finally:
+        # Cerrar la sesión libera también el advisory lock
+        conn.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--estado', action='store_true', help="Lista las migraciones aplicadas y pendientes")
+    args = parser.parse_args()
+
+    if args.estado:
+        aplicadas = migraciones_aplicadas()
+        for version, descripcion, _ in MIGRACIONES:
+            estado = f"aplicada {aplicadas[version]:%Y-%m-%d %H:%M}" if version in aplicadas else "PENDIENTE"
+            print(f"{version} | {estado:<22} | {descripcion}")
+    else:
+        n = aplicar_migraciones()
+        print(f"✅ Esquema al día ({n} migraciones nuevas).")
@@ -0,0 +1,112 @@
+# Archivo: model_store.py
+# Persistencia del modelo XGBoost en el formato nativo del Booster (UBJ/JSON) + manifiesto
+
+import json
+import os
+import threading
+from datetime import datetime
+
+import xgboost as xgb
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+
+NOMBRE_MODELO = "modelo_xgboost"
+FORMATO_MODELO = os.getenv("MODELO_FORMATO", "ubj").lower()   # "ubj" (binario, más rápido) o "json"
+RUTA_MANIFIESTO = os.path.join(current_dir, f"{NOMBRE_MODELO}.manifest.json")
+
+# Cache del Booster cargado: { ruta: (mtime, booster) }
+_boosters = {}
+_boosters_lock = threading.Lock()
+
+
+def ruta_modelo(formato=None):
+    formato = (formato or FORMATO_MODELO).lower()
+    if formato not in ("ubj", "json"):
+        raise ValueError(f"Formato de modelo no soportado: {formato}")
+    return os.path.join(current_dir, f"{NOMBRE_MODELO}.{formato}")
+
+
+def _escribir_atomico(ruta, escribir):
+    """Escribe en un temporal y lo renombra, así nadie lee un archivo a medio escribir."""
+    raiz, extension = os.path.splitext(ruta)
+    temporal = f"{raiz}.tmp{extension}"   # se conserva la extensión: XGBoost elige el formato por ella
+    escribir(temporal)
+    os.replace(temporal, ruta)
+
+
+def guardar_modelo(booster, features, fecha_corte, horizonte, metricas=None, extra=None, formato=None):
+    """
+    Guarda el Booster en formato nativo y, junto a él, el manifiesto con todo lo
+    necesario para predecir sin re-entrenar ni deserializar el wrapper de sklearn:
+    columnas de entrada, fecha de corte del entrenamiento, horizonte y métricas.
+    Devuelve la ruta del modelo guardado (None si falla).
+    """
+    try:
+        ruta = ruta_modelo(formato)
+        _escribir_atomico(ruta, booster.save_model)
+        manifiesto = {
+            "archivo": os.path.basename(ruta),
+            "formato": os.path.splitext(ruta)[1][1:],
+            "xgboost_version": xgb.__version__,
+            "fecha_entrenamiento": datetime.now().isoformat(timespec="seconds"),
+            "features": list(features),
+            "feature_types": booster.feature_types,
+            "objetivo": "log1p",
+            "n_arboles": booster.num_boosted_rounds(),
+            "fecha_corte": str(fecha_corte.date() if hasattr(fecha_corte, "date") else fecha_corte),
+            "horizonte": int(horizonte),
+            "metricas": metricas or {},
+            **(extra or {}),
+        }
+
+        def escribir_manifiesto(temporal):
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(manifiesto, f, ensure_ascii=False, indent=2, default=str)
+
+        _escribir_atomico(RUTA_MANIFIESTO, escribir_manifiesto)
+        print(f"💾 Modelo guardado en {os.path.basename(ruta)} (+ manifiesto)", flush=True)
+        return ruta
+    except Exception as e:
+        print(f"❌ Error al guardar el modelo: {e}", flush=True)
+        return None
+
+
+def cargar_manifiesto():
+    """Devuelve el manifiesto del último modelo entrenado (None si no existe)."""
+    try:
+        with open(RUTA_MANIFIESTO, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"❌ Error al leer el manifiesto del modelo: {e}")
+        return None
+
+
+def cargar_modelo_nativo():
+    """
+    Carga el Booster indicado por el manifiesto. Queda en memoria y solo se vuelve
+    a leer del disco si el archivo cambió (fecha de modificación distinta).
+    Devuelve (booster, manifiesto) o (None, None).
+    """
+    manifiesto = cargar_manifiesto()
+    if manifiesto is None:
+        print("❌ No hay un modelo entrenado (falta el manifiesto). Ejecute model_trainer.py.")
+        return None, None
+    try:
+        ruta = os.path.join(current_dir, manifiesto["archivo"])
+        mtime = os.path.getmtime(ruta)
+
+        en_cache = _boosters.get(ruta)
+        if en_cache is None or en_cache[0] != mtime:
+            with _boosters_lock:
+                en_cache = _boosters.get(ruta)
+                if en_cache is None or en_cache[0] != mtime:
+                    booster = xgb.Booster()
+                    booster.load_model(ruta)
+                    en_cache = (mtime, booster)
+                    _boosters[ruta] = en_cache
+        return en_cache[1], manifiesto
+    except Exception as e:
+        print(f"❌ Error al cargar el modelo: {e}")
+        return None, None
@@ -4,9 +4,11 @@ import xgboost as xgb
 import os
 import sys
 from datetime import datetime, timedelta
-import psycopg2.extras 
 import warnings
 import argparse
+import time
+from sqlalchemy import text
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 # --- FIX DE CODIFICACIÓN ---
 if sys.stdout.encoding != 'utf-8':
@@ -24,37 +26,175 @@ if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
 from bd import conectar_db
+from data_connector import conectar_data_db
+from bulk_loader import copiar_dataframe, reemplazar_tabla
+from model_store import guardar_modelo
+from predictor import predecir_mensual
+from services.kpis_service import avisar_recalculo
+import feature_store
 
 # --- CONSTANTES ---
-RUTA_MODELO = os.path.join(current_dir, "modelo_xgboost.json")
 TABLA_TEMPORAL = "prediccion_dataset"
 TABLA_PREDICCION = "prediccion_mensual"
 SCHEMA = "desarrollo"
 
+def _env_bool(nombre, defecto):
+    return os.getenv(nombre, defecto).lower() not in ("0", "false", "no")
+
+# --- CONFIGURACIÓN DE ENTRENAMIENTO ---
+# Prioridad: flags de línea de comandos > variables de entorno > estos valores
+CONFIG_ENTRENAMIENTO = {
+    "n_jobs": int(os.getenv("XGB_N_JOBS", -1)),                    # -1 = todos los núcleos
+    "tree_method": os.getenv("XGB_TREE_METHOD", "hist"),
+    "max_bin": int(os.getenv("XGB_MAX_BIN", 256)),
+    "n_estimators": int(os.getenv("XGB_N_ESTIMATORS", 500)),
+    "early_stopping": int(os.getenv("XGB_EARLY_STOPPING", 0)),     # rondas sin mejora (0 = desactivado)
+    "meses_validacion": int(os.getenv("XGB_MESES_VALIDACION", 3)), # últimos meses usados como validación
+    "quantile_dmatrix": _env_bool("XGB_QUANTILE_DMATRIX", "1"),
+}
+
+# --- ENTRENAMIENTO POR CATEGORÍA (SHARDS) ---
+CONFIG_SHARDS = {
+    "por_categoria": _env_bool("XGB_POR_CATEGORIA", "0"),  # un modelo por categoría en vez de uno global
+    "workers": int(os.getenv("XGB_WORKERS", 0)),           # procesos en paralelo (0 = núcleos disponibles)
+}
+
 # ================================================
 # 🔹 1. Cargar y Transformar
 # ================================================
-def cargar_y_agrupar_mensual():
-    engine = conectar_db()
-    if engine is None: return None
+# Filas por viaje al leer el dataset mensual con cursor del lado del servidor
+FILAS_POR_BLOQUE_BD = 50000
+
+def _agrupar_desde_feature_store(fecha_desde=None):
+    """
+    Lee del feature store Parquet solo las columnas necesarias (y solo las particiones
+    desde fecha_desde) y agrupa por mes en Arrow, sin pasar las filas diarias a pandas.
+    """
+    print("📥 Cargando datos diarios desde el feature store (Parquet)...", flush=True)
+    tabla = feature_store.leer(
+        TABLA_TEMPORAL,
+        columnas=["anio", "mes", "v_id_producto", "categoria", "cantidad_vendida", "precio_promedio"],
+        desde=fecha_desde
+    )
+    if tabla.num_rows == 0:
+        return pd.DataFrame()
+    
+    print("📅 Agrupando datos por MES...", flush=True)
+    df_mensual = tabla.group_by(["anio", "mes", "v_id_producto", "categoria"]).aggregate([
+        ("cantidad_vendida", "sum"), ("precio_promedio", "mean")
+    ]).to_pandas()
+    df_mensual["fecha_mes"] = pd.to_datetime(dict(year=df_mensual["anio"], month=df_mensual["mes"], day=1))
+    df_mensual["categoria"] = df_mensual["categoria"].astype(str)
+    df_mensual = df_mensual.rename(columns={
+        "cantidad_vendida_sum": "cantidad_vendida", "precio_promedio_mean": "v_precio"
+    })
+    return df_mensual[["fecha_mes", "v_id_producto", "categoria", "cantidad_vendida", "v_precio"]] \
+        .sort_values(["fecha_mes", "v_id_producto", "categoria"], ignore_index=True)
+
+def _agrupar_desde_bd(engine, fecha_desde=None, filas_por_bloque=FILAS_POR_BLOQUE_BD):
+    """
+    Agrupa por mes en el servidor (date_trunc + GROUP BY): viajan ~30 veces menos filas
+    que el dataset diario. Se leen con un cursor con nombre (server-side) por bloques y cada
+    bloque se pasa enseguida a arreglos tipados (int32, datetime64, float64 y la categoría como
+    código), así solo hay tuplas de Python para un bloque a la vez y el resultado ocupa ~30 bytes por fila.
+    """
+    print("📥 Cargando datos mensuales (agrupados en la base de datos)...", flush=True)
+    filtro = "WHERE v_fecha >= %(desde)s" if fecha_desde is not None else ""
+    sql = f"""
+        SELECT date_trunc('month', v_fecha)::date AS fecha_mes,
+               v_id_producto,
+               categoria,
+               SUM(cantidad_vendida) AS cantidad_vendida,
+               AVG(precio_promedio) AS v_precio
+        FROM {SCHEMA}.{TABLA_TEMPORAL}
+        {filtro}
+        GROUP BY 1, 2, 3
+    """
+    params = {"desde": pd.Timestamp(fecha_desde).to_pydatetime()} if fecha_desde is not None else None
+    columnas = ["fecha_mes", "v_id_producto", "categoria", "cantidad_vendida", "v_precio"]
+    
+    partes = {col: [] for col in columnas}
+    codigos_categoria = {}   # categoría -> código (int32)
+    n_bloques = 0
+    conn = engine.raw_connection()
     try:
-        print("📥 Cargando datos diarios...", flush=True)
-        sql = f"SELECT * FROM {SCHEMA}.{TABLA_TEMPORAL} ORDER BY v_fecha"
-        df = pd.read_sql(sql, engine)
-        
-        if df.empty: return None
+        with conn.cursor(name="cursor_dataset_mensual") as cur:
+            cur.itersize = filas_por_bloque
+            cur.execute(sql, params)
+            while True:
+                filas = cur.fetchmany(filas_por_bloque)
+                if not filas: break
+                fechas, productos, categorias, cantidades, precios = zip(*filas)
+                del filas
+                partes["fecha_mes"].append(np.array(fechas, dtype="datetime64[D]"))
+                partes["v_id_producto"].append(np.array(productos, dtype=np.int32))
+                partes["categoria"].append(np.array(
+                    [codigos_categoria.setdefault(c, len(codigos_categoria)) for c in categorias], dtype=np.int32))
+                partes["cantidad_vendida"].append(np.array(cantidades, dtype=np.float64))
+                partes["v_precio"].append(np.array(precios, dtype=np.float64))
+                n_bloques += 1
+        conn.rollback()  # solo lectura: cierra la transacción del cursor
+    finally:
+        conn.close()
+    
+    if n_bloques == 0:
+        return pd.DataFrame(columns=columnas)
+    # Una sola copia por columna; cada lista de bloques se suelta apenas se concatena
+    datos = {col: np.concatenate(partes.pop(col)) for col in columnas}
+    # Códigos renumerados en orden alfabético, así ordenar por código es ordenar por nombre
+    nombres = np.array(list(codigos_categoria), dtype=object)
+    orden_nombres = np.argsort(nombres.astype(str), kind="stable")
+    rango = np.empty(len(nombres), dtype=np.int32)
+    rango[orden_nombres] = np.arange(len(nombres), dtype=np.int32)
+    datos["categoria"] = rango[datos["categoria"]]
+    # Orden (fecha_mes, v_id_producto, categoria) sobre los arreglos, una columna a la vez,
+    # en lugar de sort_values sobre el DataFrame (que copia todo el resultado)
+    orden = np.lexsort((datos["categoria"], datos["v_id_producto"], datos["fecha_mes"]))
+    for col in columnas:
+        datos[col] = datos[col][orden]
+    del orden
+    datos["categoria"] = nombres[orden_nombres][datos["categoria"]]
+    datos["fecha_mes"] = pd.to_datetime(datos["fecha_mes"])
+    df_mensual = pd.DataFrame(datos, columns=columnas, copy=False)
+    print(f"📅 {len(df_mensual):,} filas mensuales recibidas en {n_bloques} bloques.", flush=True)
+    return df_mensual
 
-        df["v_fecha"] = pd.to_datetime(df["v_fecha"])
-        
-        print("📅 Agrupando datos por MES...", flush=True)
-        df["fecha_mes"] = df["v_fecha"].dt.to_period("M").dt.to_timestamp()
+def _feature_store_al_dia(engine, ultima_store):
+    """
+    True si el último día del feature store coincide con MAX(v_fecha) de la tabla del dataset.
+    Si difieren (tabla reconstruida en otro equipo, data_processor falló después de escribir
+    en la BD, etc.) el store está desactualizado y no se usa.
+    """
+    with engine.connect() as conn:
+        ultima_bd = conn.execute(text(f"SELECT MAX(v_fecha) FROM {SCHEMA}.{TABLA_TEMPORAL}")).scalar()
+    if ultima_bd is None or pd.Timestamp(ultima_bd).normalize() != ultima_store.normalize():
+        print(f"⚠️ Feature store desactualizado (store: {ultima_store.date()}, "
+              f"BD: {pd.Timestamp(ultima_bd).date() if ultima_bd is not None else 'vacía'}), se usa la base de datos.", flush=True)
+        return False
+    return True
+
+def cargar_y_agrupar_mensual(fecha_desde=None):
+    """
+    Dataset mensual para entrenar. Usa el feature store Parquet que escribe data_processor
+    si está al día con la tabla (mismo último día); si no existe, está desactualizado o pyarrow
+    no está instalado, agrupa por mes directamente en PostgreSQL.
+    """
+    try:
+        engine = conectar_data_db()
+        if engine is None: return None
+
+        df_mensual = None
+        ultima_store = feature_store.leer_estado(TABLA_TEMPORAL) if feature_store.disponible() else None
+        if ultima_store is not None and _feature_store_al_dia(engine, ultima_store):
+            try:
+                df_mensual = _agrupar_desde_feature_store(fecha_desde)
+            except Exception as e:
+                print(f"⚠️ No se pudo leer el feature store ({e}), se usa la base de datos.", flush=True)
         
-        df_mensual = df.groupby(["fecha_mes", "v_id_producto", "categoria"]).agg({
-            "cantidad_vendida": "sum",
-            "precio_promedio": "mean" 
-        }).reset_index()
+        if df_mensual is None:
+            df_mensual = _agrupar_desde_bd(engine, fecha_desde)
         
-        df_mensual.rename(columns={"precio_promedio": "v_precio"}, inplace=True)
+        if df_mensual.empty: return None
         if "v_precio" not in df_mensual.columns: df_mensual["v_precio"] = 1.0
         
         # --- CORRECCIÓN CRÍTICA: GARANTIZAR CONTINUIDAD TEMPORAL ---
@@ -66,9 +206,6 @@ def cargar_y_agrupar_mensual():
     except Exception as e:
         print(f"❌ Error carga: {e}", flush=True)
         return None
-    finally:
-        try: engine.dispose() 
-        except: pass
 
 def garantizar_continuidad_mensual(df):
     """
@@ -117,6 +254,51 @@ def garantizar_continuidad_mensual(df):
 # ================================================
 # 🔹 2. Feature Engineering
 # ================================================
+def media_de_ventana(columnas):
+    """
+    Media de una ventana dada como lista de columnas (de la más vieja a la más nueva).
+    Suma siempre en ese orden, columna por columna: entrenamiento (medias_moviles_desplazadas)
+    y predicción (EstadoRecursivo) usan esta misma función, así las features son idénticas.
+    Un NaN en la ventana (mes sin historia) da NaN, igual que rolling(w) con min_periods=w.
+    """
+    suma = np.array(columnas[0], dtype=np.float64)
+    for columna in columnas[1:]:
+        suma = suma + columna
+    return suma / len(columnas)
+
+def medias_moviles_desplazadas(valores, grupos, ventanas=(3, 6, 12)):
+    """
+    Media de las `w` filas anteriores del mismo grupo, para todas las ventanas
+    y todos los grupos a la vez. Equivale a
+    groupby(grupos).transform(lambda x: x.shift(1).rolling(w).mean()).
+
+    Las filas deben venir ordenadas (contiguas por grupo). Cada grupo se ubica
+    en una fila de una matriz con `max(ventanas)` columnas de NaN a la izquierda,
+    así la ventana de cada fila se toma con índices, sin salir de su grupo.
+    Devuelve {ventana: np.ndarray}.
+    """
+    valores = np.asarray(valores, dtype=np.float64)
+    codigos, _ = pd.factorize(np.asarray(grupos), use_na_sentinel=True)
+    n_filas = len(valores)
+    resultado = {w: np.full(n_filas, np.nan) for w in ventanas}
+    if n_filas == 0: return resultado
+
+    # Posición de cada fila dentro de su grupo (los grupos son bloques contiguos)
+    nuevo_bloque = np.r_[True, codigos[1:] != codigos[:-1]]
+    inicio_bloque = np.maximum.accumulate(np.where(nuevo_bloque, np.arange(n_filas), 0))
+    posicion = np.arange(n_filas) - inicio_bloque
+    bloque = np.cumsum(nuevo_bloque) - 1
+
+    # Matriz (bloque x posición) con relleno NaN: la fila en posición p está en la columna margen + p
+    margen = max(ventanas)
+    matriz = np.full((bloque[-1] + 1, margen + posicion.max() + 1), np.nan)
+    matriz[bloque, margen + posicion] = valores
+
+    for w in ventanas:
+        columnas = [matriz[bloque, margen + posicion - w + j] for j in range(w)]
+        resultado[w] = np.where(codigos >= 0, media_de_ventana(columnas), np.nan)
+    return resultado
+
 def generar_features_mensuales(df):
     df = df.copy()
     df = df.sort_values(["v_id_producto", "fecha_mes"])
@@ -137,9 +319,9 @@ def generar_features_mensuales(df):
     df["lag_3"] = grouped.shift(3)
     
     # Tendencias
-    df["rm_3"] = grouped.transform(lambda x: x.shift(1).rolling(window=3).mean())
-    df["rm_6"] = grouped.transform(lambda x: x.shift(1).rolling(window=6).mean())
-    df["rm_12"] = grouped.transform(lambda x: x.shift(1).rolling(window=12).mean())
+    medias = medias_moviles_desplazadas(df["cantidad_vendida"], df["v_id_producto"], ventanas=(3, 6, 12))
+    for w, media in medias.items():
+        df[f"rm_{w}"] = media
     
     df["delta_precio"] = df.groupby("v_id_producto")["v_precio"].pct_change().fillna(0)
     
@@ -156,7 +338,29 @@ def generar_features_mensuales(df):
 # ================================================
 # 🔹 3. Entrenamiento
 # ================================================
-def entrenar_modelo(df_train):
+def _pico_memoria_mb():
+    """Pico de memoria residente del proceso en MB (None si no se puede medir)."""
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return pico / 1024 ** 2 if sys.platform == "darwin" else pico / 1024
+    except ImportError:
+        pass
+    try:
+        import psutil
+        info = psutil.Process().memory_info()
+        return getattr(info, "peak_wset", info.rss) / 1024 ** 2
+    except ImportError:
+        return None
+
+def _crear_dmatrix(X, y, config, referencia=None):
+    """QuantileDMatrix (cuantiza una sola vez, menos memoria) si el método es hist; DMatrix si no."""
+    if config["quantile_dmatrix"] and config["tree_method"] == "hist":
+        return xgb.QuantileDMatrix(X, y, max_bin=config["max_bin"], ref=referencia, enable_categorical=True)
+    return xgb.DMatrix(X, y, enable_categorical=True)
+
+def entrenar_modelo(df_train, config=None):
+    config = {**CONFIG_ENTRENAMIENTO, **(config or {})}
     print(f"🚀 Entrenando modelo con {len(df_train)} registros...", flush=True)
     
     features = [
@@ -170,63 +374,166 @@ def entrenar_modelo(df_train):
     X = df_train[features]
     y = np.log1p(df_train["cantidad_vendida"])
     
-    modelo = xgb.XGBRegressor(
-        objective="reg:squarederror",    
-        n_estimators=500,           
-        learning_rate=0.02,         
-        max_depth=6,
-        min_child_weight=1,
-        subsample=0.8,
-        colsample_bytree=0.8,
-        enable_categorical=True,
-        n_jobs=1,
-        random_state=42
-    )
+    params = {
+        "objective": "reg:squarederror",
+        "learning_rate": 0.02,
+        "max_depth": 6,
+        "min_child_weight": 1,
+        "subsample": 0.8,
+        "colsample_bytree": 0.8,
+        "tree_method": config["tree_method"],
+        "max_bin": config["max_bin"],
+        "nthread": config["n_jobs"] if config["n_jobs"] > 0 else (os.cpu_count() or 1),
+        "seed": 42,
+    }
+    n_arboles = config["n_estimators"]
+    print(f"⚙️ n_jobs={params['nthread']} | tree_method={params['tree_method']} | max_bin={params['max_bin']} | "
+          f"árboles={n_arboles} | early_stopping={config['early_stopping']}", flush=True)
+    inicio = time.perf_counter()
     
-    modelo.fit(X, y)
-    print("✅ Modelo entrenado.", flush=True)
+    # Early stopping con validación temporal: los últimos N meses validan, el resto entrena.
+    # Con el número de árboles encontrado se re-entrena con todos los meses.
+    if config["early_stopping"] > 0:
+        fecha_corte = df_train["fecha_mes"].max() - pd.DateOffset(months=config["meses_validacion"] - 1)
+        es_validacion = (df_train["fecha_mes"] >= fecha_corte).to_numpy()
+        if es_validacion.all() or not es_validacion.any():
+            print("⚠️ No hay meses suficientes para validar, se entrena sin early stopping.", flush=True)
+        else:
+            d_entreno = _crear_dmatrix(X[~es_validacion], y[~es_validacion], config)
+            d_validacion = _crear_dmatrix(X[es_validacion], y[es_validacion], config, referencia=d_entreno)
+            booster = xgb.train(
+                params, d_entreno, num_boost_round=n_arboles,
+                evals=[(d_validacion, "validacion")],
+                early_stopping_rounds=config["early_stopping"], verbose_eval=False
+            )
+            n_arboles = booster.best_iteration + 1
+            print(f"🛑 Early stopping: {n_arboles} árboles (RMSE validación {booster.best_score:.4f}, "
+                  f"desde {fecha_corte.date()})", flush=True)
+    
+    modelo = xgb.train(params, _crear_dmatrix(X, y, config), num_boost_round=n_arboles)
+    
+    duracion = time.perf_counter() - inicio
+    pico = _pico_memoria_mb()
+    pico_txt = f"{pico:,.0f} MB" if pico is not None else "n/d"
+    print(f"✅ Modelo entrenado. ⏱️ {duracion:.1f}s | RSS pico: {pico_txt}", flush=True)
     return modelo, features
 
 # ================================================
 # 🔹 4. Predicción (HÍBRIDO ROBUSTO)
 # ================================================
+class EstadoRecursivo:
+    """
+    Estado por producto para la predicción recursiva: buffer circular con las
+    últimas 12 ventas mensuales (lags 1/2/3/12), suma para el promedio
+    histórico y último precio. Cada paso calcula las features del mes
+    siguiente en O(productos), sin volver a concatenar ni recalcular toda la
+    historia. Las medias 3/6/12 se recalculan del buffer con media_de_ventana,
+    la misma función que usa el entrenamiento: no acumulan error de redondeo.
+    """
+    VENTANA = 12
+
+    def __init__(self, df_historia):
+        hist = df_historia.sort_values(["v_id_producto", "fecha_mes"])
+        ultimos = hist.groupby("v_id_producto", observed=True).tail(1)
+
+        self.productos = ultimos[["v_id_producto", "categoria", "v_precio"]].reset_index(drop=True)
+        self.precio = self.productos["v_precio"].to_numpy(dtype=np.float64)
+        n_productos = len(self.productos)
+
+        # Matriz (producto x mes) alineada a la derecha: la última columna es el último mes de cada producto
+        fila = pd.Index(self.productos["v_id_producto"]).get_indexer(hist["v_id_producto"])
+        antiguedad = hist.groupby("v_id_producto", observed=True).cumcount(ascending=False).to_numpy()
+        largo = np.bincount(fila, minlength=n_productos)
+        n_meses = int(largo.max())
+        historia = np.full((n_productos, n_meses), np.nan)
+        historia[fila, n_meses - 1 - antiguedad] = hist["cantidad_vendida"].to_numpy(dtype=np.float64)
+
+        # Buffer circular (NaN = mes sin historia, igual que shift() fuera de rango)
+        self.buffer = np.full((n_productos, self.VENTANA), np.nan)
+        ultimos_meses = historia[:, -self.VENTANA:]
+        self.buffer[:, self.VENTANA - ultimos_meses.shape[1]:] = ultimos_meses
+        self.cabeza = self.VENTANA - 1
+
+        # promedio_historico = groupby.mean (suma de Kahan en el orden de las filas)
+        self.suma = np.zeros(n_productos)
+        self.comp = np.zeros(n_productos)
+        self.cuenta = np.zeros(n_productos, dtype=np.int64)
+        for col in range(n_meses):
+            self._sumar_promedio(historia[:, col])
+
+    def _sumar_promedio(self, valores, guardar=True):
+        m = ~np.isnan(valores)
+        y = valores - self.comp
+        t = self.suma + y
+        comp = t - self.suma - y
+        comp = np.where(np.isnan(comp), 0.0, comp)
+        suma = np.where(m, t, self.suma)
+        if guardar:
+            self.comp = np.where(m, comp, self.comp)
+            self.suma = suma
+            self.cuenta += m
+        return suma
+
+    def lag(self, k):
+        return self.buffer[:, (self.cabeza - (k - 1)) % self.VENTANA]
+
+    def media(self, w):
+        """Media de los últimos w meses (NaN si alguno no existe)."""
+        return media_de_ventana([self.lag(k) for k in range(w, 0, -1)])
+
+    def features(self, fecha_mes):
+        """Features del mes siguiente, con la misma semántica que generar_features_mensuales."""
+        mes = fecha_mes.month
+        n_productos = len(self.productos)
+        df = pd.DataFrame({
+            "mes": np.full(n_productos, mes),
+            "anio": np.full(n_productos, fecha_mes.year),
+            "mes_sin": np.sin(2 * np.pi * np.full(n_productos, mes) / 12),
+            "mes_cos": np.cos(2 * np.pi * np.full(n_productos, mes) / 12),
+            "v_precio": self.precio,
+            # El precio futuro es el último conocido, así que pct_change siempre da 0 (o NaN -> 0)
+            "delta_precio": 0.0,
+            "lag_12": self.lag(12),
+            "lag_1": self.lag(1),
+            "lag_2": self.lag(2),
+            "lag_3": self.lag(3),
+            "rm_3": self.media(3),
+            "rm_6": self.media(6),
+            "rm_12": self.media(12),
+            # La fila del mes a predecir entra al promedio con cantidad 0
+            "promedio_historico": self._sumar_promedio(np.zeros(n_productos), guardar=False) / (self.cuenta + 1),
+        })
+        cols_fillna = ["lag_12", "lag_1", "lag_2", "lag_3", "rm_3", "rm_6", "rm_12"]
+        df[cols_fillna] = df[cols_fillna].fillna(0)
+        return df
+
+    def avanzar(self, cantidades):
+        """Registra la predicción del mes como nueva venta (buffer y promedio)."""
+        self.cabeza = (self.cabeza + 1) % self.VENTANA
+        self.buffer[:, self.cabeza] = cantidades
+        self._sumar_promedio(cantidades)
+
 def predecir_futuro_recursivo(modelo, df_historia_con_features, features_cols, meses_a_predecir=12):
     print(f"🔮 Predicción sobre dataset continuo ({meses_a_predecir} meses)...", flush=True)
     
-    df_actual = df_historia_con_features.copy()
-    ultima_fecha = df_actual["fecha_mes"].max()
+    ultima_fecha = df_historia_con_features["fecha_mes"].max()
+    estado = EstadoRecursivo(df_historia_con_features)
     predicciones_futuras = []
     
-    cols_prod = ["v_id_producto", "categoria", "v_precio"]
-    if "promedio_historico" in df_actual.columns: cols_prod.append("promedio_historico")
-    
-    # Tomamos la info del último mes conocido para cada producto
-    productos = df_actual.sort_values("fecha_mes").groupby("v_id_producto").tail(1)[cols_prod]
-    
     for i in range(1, meses_a_predecir + 1):
         siguiente_mes = ultima_fecha + pd.DateOffset(months=i)
         
-        df_mes_futuro = productos.copy()
-        df_mes_futuro["fecha_mes"] = siguiente_mes
-        df_mes_futuro["cantidad_vendida"] = 0 
-        
-        # Concatenar
-        df_temp = pd.concat([df_actual, df_mes_futuro], ignore_index=True)
-        df_temp = df_temp.sort_values(["v_id_producto", "fecha_mes"])
-        
-        # Recalcular features (Ahora los lags son perfectos porque no hay huecos)
-        df_temp = generar_features_mensuales(df_temp)
-        
-        df_target = df_temp[df_temp["fecha_mes"] == siguiente_mes].copy()
+        df_target = estado.features(siguiente_mes)
         X_target = df_target[features_cols]
         
-        # A. IA
-        preds_log = modelo.predict(X_target)
-        preds_xgb = np.expm1(preds_log)
+        # A. IA: todos los productos del mes en una sola llamada (mismo camino que predictor)
+        preds_xgb = predecir_mensual(X_target, modelo, {"features": features_cols, "objetivo": "log1p"})
+        if len(preds_xgb) != len(X_target):
+            raise RuntimeError(f"La predicción de {siguiente_mes:%Y-%m} no devolvió resultados")
         
         # B. Red de Seguridad (Ahora rm_6 y lag_12 son datos reales, no basura)
-        trend_recente = df_target["rm_6"].fillna(0).values
-        seasonal_history = df_target["lag_12"].fillna(0).values
+        trend_recente = df_target["rm_6"].values
+        seasonal_history = df_target["lag_12"].values
         
         # Base Sólida
         base_solida = (trend_recente * 0.7) + (seasonal_history * 0.3)
@@ -236,68 +543,211 @@ def predecir_futuro_recursivo(modelo, df_historia_con_features, features_cols, m
         preds_finales = np.round(preds_finales)
         preds_finales = np.clip(preds_finales, 0, None)
         
+        df_target.insert(0, "fecha_mes", siguiente_mes)
+        for col in ["categoria", "v_id_producto"]:
+            df_target.insert(0, col, estado.productos[col].values)
         df_target["cantidad_predicha"] = preds_finales
         df_target["cantidad_vendida"] = preds_finales
         
         predicciones_futuras.append(df_target)
         
-        # Actualizar historia
-        # Solo guardamos lo necesario para no explotar memoria, pero mantenemos continuidad
-        cols_clave = ["fecha_mes", "v_id_producto", "categoria", "v_precio", "cantidad_vendida"]
-        df_actual = pd.concat([df_actual, df_target[cols_clave]], ignore_index=True)
+        # Actualizar estado (lags, medias móviles y promedio) con la predicción
+        estado.avanzar(preds_finales)
     
-    return pd.concat(predicciones_futuras, ignore_index=True)
+    df_futuro = pd.concat(predicciones_futuras, ignore_index=True)
+    for col in ["v_id_producto", "categoria"]:
+        df_futuro[col] = df_futuro[col].astype("category")
+    return df_futuro.sort_values(["fecha_mes", "v_id_producto"], ignore_index=True)
 
 # ================================================
-# 🔹 5. Guardar
+# 🔹 4b. Entrenamiento por Categoría (en paralelo)
 # ================================================
-def expandir_y_guardar(df_mensual_pred):
-    print("⚡ Distribuyendo a diario...", flush=True)
-    filas_diarias = []
+def calcular_wmape(real, pred):
+    """WMAPE en % (None si no hay ventas reales)."""
+    real = np.asarray(real, dtype=float)
+    total = real.sum()
+    if total <= 0:
+        return None
+    return float(np.abs(real - np.asarray(pred, dtype=float)).sum() / total * 100)
+
+def _entrenar_shard(categoria, df_train, df_base, meses_pred, config, df_real=None):
+    """
+    Entrena y predice una sola categoría. Se ejecuta en un proceso del pool,
+    por eso es una función de módulo y devuelve todo lo que necesita el proceso principal.
+    """
+    resultado = {"categoria": categoria, "filas": len(df_train), "productos": df_base["v_id_producto"].nunique()}
+    inicio = time.perf_counter()
+    modelo, features_col = entrenar_modelo(df_train, config)
+    resultado["t_entreno"] = time.perf_counter() - inicio
     
-    for _, row in df_mensual_pred.iterrows():
-        total_mes = row["cantidad_predicha"]
-        if total_mes < 1: continue 
-        
-        mes = row["fecha_mes"]
-        dias_en_mes = pd.Period(mes, freq='M').days_in_month
-        cantidad_diaria = total_mes / dias_en_mes
+    inicio = time.perf_counter()
+    df_futuro = predecir_futuro_recursivo(modelo, df_base, features_col, meses_a_predecir=meses_pred)
+    resultado["t_prediccion"] = time.perf_counter() - inicio
+    
+    resultado["wmape"] = None
+    if df_real is not None:
+        merged = pd.merge(
+            df_real[["fecha_mes", "v_id_producto", "cantidad_vendida"]].astype({"v_id_producto": "int64"}),
+            df_futuro[["fecha_mes", "v_id_producto", "cantidad_predicha"]].astype({"v_id_producto": "int64"}),
+            on=["fecha_mes", "v_id_producto"], how="outer"
+        ).fillna(0)
+        resultado["wmape"] = calcular_wmape(merged["cantidad_vendida"], merged["cantidad_predicha"])
+    
+    resultado["df_futuro"] = df_futuro
+    return resultado
+
+def _imprimir_resumen_shards(resultados, fallidos, duracion_total):
+    print("\n📋 RESUMEN POR CATEGORÍA (shards)", flush=True)
+    print("-" * 96, flush=True)
+    print(f"{'CATEGORÍA':<25} | {'FILAS':>9} | {'PROD.':>6} | {'ENTRENO (s)':>11} | {'PREDIC. (s)':>11} | {'WMAPE':>8}", flush=True)
+    print("-" * 96, flush=True)
+    for r in sorted(resultados, key=lambda r: r["t_entreno"] + r["t_prediccion"], reverse=True):
+        wmape = f"{r['wmape']:.1f}%" if r["wmape"] is not None else "n/d"
+        print(f"{str(r['categoria'])[:25]:<25} | {r['filas']:>9,} | {r['productos']:>6,} | "
+              f"{r['t_entreno']:>11.1f} | {r['t_prediccion']:>11.1f} | {wmape:>8}", flush=True)
+    for categoria, error in fallidos:
+        print(f"{str(categoria)[:25]:<25} | ❌ {error}", flush=True)
+    print("-" * 96, flush=True)
+    suma = sum(r["t_entreno"] + r["t_prediccion"] for r in resultados)
+    print(f"⏱️ Tiempo total: {duracion_total:.1f}s (suma de shards {suma:.1f}s, "
+          f"{len(resultados)} ok / {len(fallidos)} con error)", flush=True)
+
+def entrenar_por_categoria(df_train, df_base, meses_pred, config=None, workers=0, df_real=None):
+    """
+    Parte el dataset mensual por categoría y entrena/predice cada parte en un ProcessPoolExecutor.
+    Las categorías se envían de mayor a menor cantidad de filas (las más pesadas arrancan primero
+    y las chicas rellenan los huecos al final). Si una categoría falla, las demás siguen.
+    Devuelve (df_futuro, fallidas): las predicciones de las categorías que terminaron, unidas y con
+    el mismo formato que predecir_futuro_recursivo, y la lista de categorías cuyo shard falló
+    (df_futuro es None si no terminó ninguna).
+    """
+    config = {**CONFIG_ENTRENAMIENTO, **(config or {})}
+    claves_train = df_train["categoria"].astype(str)
+    claves_base = df_base["categoria"].astype(str)
+    claves_real = df_real["categoria"].astype(str) if df_real is not None else None
+    
+    tamanos = claves_train.value_counts()
+    sin_entreno = sorted(set(claves_base.unique()) - set(tamanos.index))
+    if sin_entreno:
+        print(f"⚠️ Categorías sin historia suficiente para entrenar (se omiten): {sin_entreno}", flush=True)
+    
+    n_shards = len(tamanos)
+    if n_shards == 0:
+        print("⚠️ No hay datos para entrenar.", flush=True)
+        return None, []
+    workers = workers if workers > 0 else min(n_shards, os.cpu_count() or 1)
+    # Repartir los núcleos entre procesos para no sobre-suscribir la CPU
+    if config["n_jobs"] <= 0:
+        config["n_jobs"] = max(1, (os.cpu_count() or 1) // workers)
+    print(f"🧩 Entrenamiento por categoría: {n_shards} shards | {workers} procesos | "
+          f"{config['n_jobs']} hilos por proceso", flush=True)
+    
+    inicio = time.perf_counter()
+    resultados, fallidos = [], []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futuros = {}
+        # value_counts ya viene ordenado de mayor a menor: los shards grandes se programan primero
+        for categoria in tamanos.index:
+            futuro = executor.submit(
+                _entrenar_shard, categoria,
+                df_train[claves_train == categoria],
+                df_base[claves_base == categoria],
+                meses_pred, config,
+                df_real[claves_real == categoria] if df_real is not None else None
+            )
+            futuros[futuro] = categoria
         
-        for d in range(1, dias_en_mes + 1):
-            fecha_dia = datetime(mes.year, mes.month, d)
-            filas_diarias.append({
-                "v_id_producto": row["v_id_producto"],
-                "v_fecha": fecha_dia,
-                "anio": mes.year,
-                "mes": mes.month,
-                "dia_del_mes": d,
-                "dia_de_la_semana": fecha_dia.weekday(),
-                "categoria": row["categoria"],
-                "cantidad_predicha": cantidad_diaria,
-                "cantidad_vendida_real": 0,
-                "fecha_entrenamiento": datetime.now()
-            })
-            
-    if not filas_diarias: return
+        for futuro in as_completed(futuros):
+            categoria = futuros[futuro]
+            try:
+                r = futuro.result()
+                resultados.append(r)
+                print(f"✅ Shard '{categoria}' listo ({r['t_entreno'] + r['t_prediccion']:.1f}s)", flush=True)
+            except Exception as e:
+                fallidos.append((categoria, str(e)))
+                print(f"❌ Shard '{categoria}' falló: {e}", flush=True)
+    
+    _imprimir_resumen_shards(resultados, fallidos, time.perf_counter() - inicio)
+    fallidas = [categoria for categoria, _ in fallidos]
+    if not resultados:
+        return None, fallidas
+    
+    df_futuro = pd.concat([r["df_futuro"] for r in resultados], ignore_index=True)
+    for col in ["v_id_producto", "categoria"]:
+        df_futuro[col] = df_futuro[col].astype(df_base[col].dtype)
+    return df_futuro.sort_values(["fecha_mes", "v_id_producto"], ignore_index=True), fallidas
+
+# ================================================
+# 🔹 5. Guardar
+# ================================================
+def expandir_mensual_a_diario(df_mensual_pred, fecha_entrenamiento=None):
+    """
+    Reparte cada mes predicho en partes iguales entre sus días.
+    Vectorizado: repite cada fila días_del_mes veces con NumPy y deriva el
+    calendario con operaciones de arreglos (sin iterrows ni un dict por fila).
+    """
+    total_mes = df_mensual_pred["cantidad_predicha"].to_numpy(dtype=np.float64)
+    validos = ~(total_mes < 1)
+    df_mes, total_mes = df_mensual_pred[validos], total_mes[validos]
+    if df_mes.empty: return pd.DataFrame()
+
+    periodos = pd.PeriodIndex(df_mes["fecha_mes"], freq="M")
+    dias_en_mes = periodos.days_in_month.to_numpy()
+    inicio_mes = periodos.to_timestamp().to_numpy()
+
+    # Índice de la fila mensual de origen y día (0..n-1) dentro del mes para cada fila diaria
+    origen = np.repeat(np.arange(len(df_mes)), dias_en_mes)
+    desplazamiento = np.arange(len(origen)) - np.repeat(np.cumsum(dias_en_mes) - dias_en_mes, dias_en_mes)
+    fechas = pd.DatetimeIndex(inicio_mes[origen] + desplazamiento.astype("timedelta64[D]"))
+
+    return pd.DataFrame({
+        "v_id_producto": df_mes["v_id_producto"].to_numpy()[origen],
+        "v_fecha": fechas,
+        "anio": fechas.year,
+        "mes": fechas.month,
+        "dia_del_mes": desplazamiento + 1,
+        "dia_de_la_semana": fechas.dayofweek,
+        "categoria": df_mes["categoria"].to_numpy()[origen],
+        "cantidad_predicha": (total_mes / dias_en_mes)[origen],
+        "cantidad_vendida_real": 0,
+        "fecha_entrenamiento": fecha_entrenamiento or datetime.now(),
+    })
+
+def expandir_y_guardar(df_mensual_pred, categorias=None):
+    """
+    Guarda la predicción diaria. categorias=None reemplaza toda la tabla; con una lista solo se
+    reemplazan las filas de esas categorías (DELETE + COPY en una transacción) y las demás
+    conservan su predicción anterior (p. ej. shards que fallaron en el modo por categoría).
+    """
+    print("⚡ Distribuyendo a diario...", flush=True)
+    df_save = expandir_mensual_a_diario(df_mensual_pred)
+    if df_save.empty: return
 
-    df_save = pd.DataFrame(filas_diarias)
     print(f"💾 Guardando {len(df_save)} registros...", flush=True)
 
     cols_db = ["v_id_producto", "v_fecha", "anio", "mes", "dia_del_mes", "dia_de_la_semana", 
                "categoria", "cantidad_predicha", "cantidad_vendida_real", "fecha_entrenamiento"]
     
-    lista_valores = [tuple(x) for x in df_save[cols_db].to_numpy()]
-    
     conn = conectar_db()
     if conn is None: return
 
     try:
-        with conn.cursor() as cur:
-            cur.execute(f"DELETE FROM {SCHEMA}.{TABLA_PREDICCION};") 
-            query = f"INSERT INTO {SCHEMA}.{TABLA_PREDICCION} ({', '.join(cols_db)}) VALUES %s"
-            psycopg2.extras.execute_values(cur, query, lista_valores, page_size=10000)
-        conn.commit()
+        if categorias is None:
+            # COPY a una tabla staging + intercambio (reemplaza el DELETE + INSERTs por lotes)
+            reemplazar_tabla(conn, df_save, TABLA_PREDICCION, SCHEMA, columnas=cols_db)
+        else:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute(f"DELETE FROM {SCHEMA}.{TABLA_PREDICCION} WHERE categoria = ANY(%s)",
+                                (list(categorias),))
+                copiar_dataframe(conn, df_save, TABLA_PREDICCION, SCHEMA, columnas=cols_db)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
         print("✅ Guardado exitoso.", flush=True)
+        # Los dashboards abiertos tienen la predicción del mes en su foto de KPIs
+        avisar_recalculo(conn)
     except Exception as e:
         print(f"❌ Error DB: {e}", flush=True)
     finally:
@@ -310,15 +760,33 @@ def main():
     parser = argparse.ArgumentParser()
     parser.add_argument('--horizonte', type=int, default=12)
     parser.add_argument('--modo', type=str, default='demo')
+    parser.add_argument('--desde', type=str, default=None, help="Primer día de historia a leer (YYYY-MM-DD)")
+    # Entrenamiento (si no se pasan, se usan CONFIG_ENTRENAMIENTO / variables XGB_*)
+    parser.add_argument('--n-jobs', type=int, help="Hilos de XGBoost (-1 = todos los núcleos)")
+    parser.add_argument('--tree-method', type=str, choices=['hist', 'approx', 'exact'])
+    parser.add_argument('--max-bin', type=int)
+    parser.add_argument('--n-estimators', type=int)
+    parser.add_argument('--early-stopping', type=int, help="Rondas sin mejora en validación (0 = desactivado)")
+    parser.add_argument('--meses-validacion', type=int)
+    parser.add_argument('--quantile-dmatrix', action=argparse.BooleanOptionalAction, default=None)
+    # Un modelo por categoría entrenado en procesos paralelos
+    parser.add_argument('--por-categoria', action=argparse.BooleanOptionalAction, default=CONFIG_SHARDS["por_categoria"])
+    parser.add_argument('--workers', type=int, default=CONFIG_SHARDS["workers"], help="Procesos para --por-categoria (0 = núcleos disponibles)")
     args = parser.parse_args()
     
+    config_cli = {
+        clave: getattr(args, clave)
+        for clave in CONFIG_ENTRENAMIENTO
+        if getattr(args, clave) is not None
+    }
+    
     meses_pred = args.horizonte
     es_modo_demo = (args.modo == 'demo')
     
     print(f"🏁 INICIANDO (H={meses_pred}m | M={args.modo})", flush=True)
 
     try:
-        df_mensual_hist = cargar_y_agrupar_mensual()
+        df_mensual_hist = cargar_y_agrupar_mensual(args.desde)
         if df_mensual_hist is None: return
         
         df_full_features = generar_features_mensuales(df_mensual_hist)
@@ -333,20 +801,34 @@ def main():
             df_train = df_train[df_train["fecha_mes"] >= min_date]
             
             df_real_2024 = df_full_features[df_full_features["fecha_mes"] >= fecha_corte].copy()
-            
-            modelo, features_col = entrenar_modelo(df_train)
-            
             df_base_prediccion = df_full_features[df_full_features["fecha_mes"] < fecha_corte].copy()
-            df_futuro = predecir_futuro_recursivo(modelo, df_base_prediccion, features_col, meses_a_predecir=meses_pred)
             
         else:
             print("🏭 MODO PRODUCCIÓN", flush=True)
             df_train = df_full_features[df_full_features["fecha_mes"] >= df_full_features["fecha_mes"].min() + pd.DateOffset(months=12)]
-            modelo, features_col = entrenar_modelo(df_train)
-            df_futuro = predecir_futuro_recursivo(modelo, df_full_features, features_col, meses_a_predecir=meses_pred)
+            df_base_prediccion = df_full_features
             df_real_2024 = None
+            fecha_corte = df_full_features["fecha_mes"].max() + pd.DateOffset(months=1)
+
+        if args.por_categoria:
+            df_futuro, fallidas = entrenar_por_categoria(
+                df_train, df_base_prediccion, meses_pred, config_cli,
+                workers=args.workers, df_real=df_real_2024
+            )
+            if df_futuro is None: return
+        else:
+            modelo, features_col = entrenar_modelo(df_train, config_cli)
+            df_futuro = predecir_futuro_recursivo(modelo, df_base_prediccion, features_col, meses_a_predecir=meses_pred)
+            fallidas = []
 
-        expandir_y_guardar(df_futuro)
+        if fallidas:
+            # Una categoría que falló no borra su predicción anterior: solo se reemplazan las que terminaron
+            print(f"⚠️ Se conserva la predicción anterior de {len(fallidas)} categorías con error: {fallidas}", flush=True)
+            categorias_ok = set(df_base_prediccion["categoria"].astype(str).unique()) - set(fallidas)
+            expandir_y_guardar(df_futuro, categorias=sorted(categorias_ok))
+        else:
+            expandir_y_guardar(df_futuro)
+        metricas = {"filas_entreno": len(df_train), "productos": int(df_base_prediccion["v_id_producto"].nunique())}
         
         # VALIDACIÓN POR CATEGORÍA
         if es_modo_demo and df_real_2024 is not None:
@@ -380,10 +862,16 @@ def main():
                 # TOTAL GLOBAL
                 print(f"📦 Total Real Global: {merged[col_real].sum():,.0f}")
                 print(f"📦 Total Pred Global: {merged[col_pred].sum():,.0f} (¡Esto debe subir!)")
+                metricas["wmape_global"] = calcular_wmape(merged[col_real], merged[col_pred])
+                metricas["wmape_por_categoria"] = dict(zip(reporte["categoria"].astype(str), reporte["WMAPE"].round(2)))
 
             else:
                 print("⚠️ Sin datos.", flush=True)
 
+        # Persistencia en formato nativo (el modo por categoría no tiene un modelo global que guardar)
+        if not args.por_categoria:
+            guardar_modelo(modelo, features_col, fecha_corte, meses_pred, metricas, extra={"modo": args.modo})
+
         print("🏆 PROCESO TERMINADO.", flush=True)
 
     except Exception as e:
@@ -4,6 +4,7 @@ from datetime import datetime
 from bd import conectar_db
 import tkinter as tk
 from modulos.historial_alertas import mostrar_historial_alertas
+from services.ejecutor_consultas import ejecutor_consultas
 
 # --- SEMÁFORO DE COLORES (NUEVO) ---
 COLOR_AGOTADO = "#c0392b"   # Rojo Oscuro
@@ -24,19 +25,26 @@ def mostrar_alertas(contenido_frame):
     btn_frame = ctk.CTkFrame(header_frame, fg_color="transparent")
     btn_frame.pack(side="right")
 
-    ctk.CTkButton(btn_frame, text="🔄 Actualizar Alertas", command=lambda: actualizar_alertas(contenido_frame), 
-                  font=("Arial", 12, "bold"), fg_color="#3498db", width=160, height=35).pack(side="left", padx=5)
+    btn_actualizar = ctk.CTkButton(btn_frame, text="🔄 Actualizar Alertas", command=lambda: actualizar_alertas(contenido_frame, btn_actualizar), 
+                  font=("Arial", 12, "bold"), fg_color="#3498db", width=160, height=35)
+    btn_actualizar.pack(side="left", padx=5)
     
     ctk.CTkButton(btn_frame, text="📜 Historial Completo", command=lambda: mostrar_historial_alertas(contenido_frame), 
                   font=("Arial", 12, "bold"), fg_color="#9b59b6", width=160, height=35).pack(side="left", padx=5)
 
-    alertas = obtener_alertas_activas()
+    lbl_cargando = ctk.CTkLabel(contenido_frame, text="⏳ Cargando alertas...", font=("Arial", 14), text_color="gray")
+    lbl_cargando.pack(pady=40)
 
-    # --- SECCIÓN DE KPIs ---
-    crear_kpis_superiores(contenido_frame, alertas)
+    def pintar(alertas):
+        lbl_cargando.destroy()
 
-    # --- LISTADO DE TARJETAS ---
-    mostrar_listado_tarjetas(contenido_frame, alertas)
+        # --- SECCIÓN DE KPIs ---
+        crear_kpis_superiores(contenido_frame, alertas)
+
+        # --- LISTADO DE TARJETAS ---
+        mostrar_listado_tarjetas(contenido_frame, alertas)
+
+    ejecutor_consultas.enviar(lbl_cargando, obtener_alertas_activas, clave="alertas.activas", al_terminar=pintar)
 
 
 def crear_kpis_superiores(parent, alertas):
@@ -257,25 +265,26 @@ def marcar_alerta_leida(id_alerta, frame_widget):
     except Exception as e:
         messagebox.showerror("Error", f"Excepción: {e}")
 
-def actualizar_alertas(contenido_frame):
+def actualizar_alertas(contenido_frame, origen=None):
     """
     Fuerza la ejecución inmediata de la verificación de stock
-    y refresca la pantalla.
+    y refresca la pantalla. 'origen' es el widget de la pantalla que lo pidió:
+    si se cambia de pantalla antes de que termine, no se repinta.
     """
-    try:
-        from services.alertas_service import servicio_alertas
-        
+    from services.alertas_service import servicio_alertas
+
+    def verificar():
         # 1. Primero LIMPIAMOS: Forzamos la resolución de alertas que ya tienen stock
         resueltas = servicio_alertas.verificar_alertas_resueltas()
         
         # 2. Luego BUSCAMOS: Forzamos la búsqueda de nuevos problemas
         nuevas = servicio_alertas.verificar_nuevas_alertas()
-        
-        # 3. Finalmente repintamos la pantalla con la data fresca de la DB
-        mostrar_alertas(contenido_frame) 
+        return resueltas, nuevas
 
-    except Exception as e:
-        messagebox.showerror("Error", f"Error al actualizar: {str(e)}")
+    # La verificación corre en segundo plano; al terminar se repinta con la data fresca de la DB
+    ejecutor_consultas.enviar(origen or contenido_frame, verificar, clave="alertas.verificar",
+                              al_terminar=lambda _: mostrar_alertas(contenido_frame),
+                              al_fallar=lambda e: messagebox.showerror("Error", f"Error al actualizar: {str(e)}"))
 
 def limpiar_contenido(frame):
     for widget in frame.winfo_children():
@@ -1,6 +1,6 @@
 import customtkinter as ctk
-from bd import conectar_db
-import threading
+from bd import conexion
+from services.ejecutor_consultas import ejecutor_consultas
 import tkinter as tk
 from datetime import datetime
 
@@ -88,12 +88,19 @@ def buscar_alertas(parent, status_label, filtros):
     for w in parent.winfo_children(): w.destroy()
     status_label.configure(text="⏳ Cargando historial...")
     
-    # Hilo para no congelar interfaz
-    threading.Thread(target=lambda: _consultar_bd(parent, status_label, filtros), daemon=True).start()
+    # En segundo plano para no congelar la interfaz; una búsqueda nueva reemplaza a la anterior
+    ejecutor_consultas.enviar(
+        parent, _consultar_bd, filtros, clave="historial_alertas",
+        al_terminar=lambda resultados: _renderizar_tarjetas(parent, status_label, resultados),
+        al_fallar=lambda e: _error_consulta(status_label, e)
+    )
 
-def _consultar_bd(parent, status_label, filtros):
-    try:
-        conn = conectar_db()
+def _error_consulta(status_label, error):
+    print(error)
+    status_label.configure(text="❌ Error de conexión")
+
+def _consultar_bd(filtros):
+    with conexion() as conn:
         cur = conn.cursor()
         
         # Construcción de Query Dinámica
@@ -120,14 +127,8 @@ def _consultar_bd(parent, status_label, filtros):
         
         cur.execute(sql, tuple(params))
         resultados = cur.fetchall()
-        conn.close()
-        
-        # Renderizar en hilo principal (necesario para Tkinter)
-        parent.after(0, lambda: _renderizar_tarjetas(parent, status_label, resultados))
-        
-    except Exception as e:
-        print(e)
-        parent.after(0, lambda: status_label.configure(text="❌ Error de conexión"))
+        cur.close()
+    return resultados
 
 def _renderizar_tarjetas(parent, status_label, resultados):
     if not resultados:
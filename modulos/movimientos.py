@@ -1,7 +1,10 @@
 import customtkinter as ctk
 from tkinter import ttk
 from tkinter import messagebox
-from bd import conectar_db
+from bd import conectar_db, conexion
+from services.sugerencias_service import sugerencias_productos, sugerencias_clientes
+from services.indice_salidas import indice_salidas
+from services.ejecutor_consultas import ejecutor_consultas
 import datetime
 
 # Variables globales para mantener estado en la pestaña de salida
@@ -13,6 +16,101 @@ current_prod_desc = ""
 current_prod_price = 0
 current_movimiento_id = None
 
+
+# Alta de un bloque de seriales en una sola sentencia. Si alguno ya tiene una SALIDA
+# (o viene repetido) no se inserta nada y se devuelven los conflictivos.
+SQL_INSERTAR_SALIDAS = """
+    WITH nuevos AS (
+        SELECT serial, COUNT(*) OVER (PARTITION BY serial) AS repeticiones
+        FROM unnest(%(seriales)s::text[]) AS serial
+    ),
+    duplicados AS (
+        SELECT serial FROM nuevos WHERE repeticiones > 1
+        UNION
+        SELECT m.serial FROM desarrollo.movimientos m
+        WHERE m.serial = ANY(%(seriales)s::text[]) AND m.tipo_movimiento = 'SALIDA'
+    ),
+    insertados AS (
+        INSERT INTO desarrollo.movimientos (id_producto, tipo_movimiento, cantidad, motivo, id_usuario, serial, cliente, fecha_entrega)
+        SELECT %(id_producto)s, 'SALIDA', 1, %(motivo)s, %(id_usuario)s, n.serial, %(cliente)s, NOW()
+        FROM nuevos n
+        WHERE NOT EXISTS (SELECT 1 FROM duplicados)
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM insertados), ARRAY(SELECT serial FROM duplicados)
+"""
+
+SERIALES_POR_BLOQUE = 100
+
+
+def guardar_salidas(id_producto, motivo, id_usuario, cliente, seriales, progreso=None):
+    """
+    Registra una salida por serial y descuenta el stock, todo en una transacción.
+    Los seriales se envían en bloques de SERIALES_POR_BLOQUE (una sentencia por bloque);
+    progreso(guardados, total) se llama después de cada uno.
+    Devuelve la lista de seriales duplicados (vacía si se guardó todo); si hay alguno
+    no se guarda nada. Lanza la excepción si falla la base o no alcanza el stock.
+    """
+    total = len(seriales)
+    with conexion() as conn:
+        cur = conn.cursor()
+        for inicio in range(0, total, SERIALES_POR_BLOQUE):
+            bloque = seriales[inicio:inicio + SERIALES_POR_BLOQUE]
+            cur.execute(SQL_INSERTAR_SALIDAS, {
+                "seriales": bloque, "id_producto": id_producto, "motivo": motivo,
+                "id_usuario": id_usuario, "cliente": cliente,
+            })
+            _, duplicados = cur.fetchone()
+            if duplicados:
+                conn.rollback()
+                return duplicados
+            if progreso:
+                progreso(inicio + len(bloque), total)
+
+        cur.execute("""
+            UPDATE desarrollo.stock SET cant_inventario = cant_inventario - %s, precio_total = precio_unit * (cant_inventario - %s)
+            WHERE id_articulo = %s AND cant_inventario >= %s
+        """, (total, total, id_producto, total))
+        if cur.rowcount == 0:
+            conn.rollback()
+            raise ValueError("Stock insuficiente para registrar la salida.")
+        conn.commit()
+    return []
+
+
+def consultar_ultimas_salidas(limite=10):
+    """Últimas salidas registradas, para la tabla de la pestaña de salida."""
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT m.id_movimiento, TO_CHAR(m.fecha_entrega, 'DD/MM/YYYY HH24:MI'), 
+                   s.descripcion, m.motivo, m.cliente, m.serial
+            FROM desarrollo.movimientos m
+            JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
+            WHERE m.tipo_movimiento = 'SALIDA'
+            ORDER BY m.fecha_entrega DESC LIMIT %s
+        """, (limite,))
+        filas = cur.fetchall()
+        cur.close()
+    return filas
+
+
+def pintar_sugerencias(frame, botones, opciones):
+    """
+    Muestra las opciones [(texto, comando), ...] en el frame reutilizando los botones
+    ya creados: solo se crean los que falten y los sobrantes se ocultan.
+    """
+    for i, (texto, comando) in enumerate(opciones):
+        if i < len(botones):
+            botones[i].configure(text=texto, command=comando)
+        else:
+            botones.append(ctk.CTkButton(frame, text=texto, anchor="w", fg_color="transparent", text_color="black",
+                                         hover_color="#e0e0e0", height=25, command=comando))
+        if not botones[i].winfo_manager():
+            botones[i].pack(fill="x", pady=1)
+    for btn in botones[len(opciones):]:
+        btn.pack_forget()
+
 def mostrar_movimientos(frame_destino, usuario_id_actual):
     # Limpiar frame anterior
     for widget in frame_destino.winfo_children():
@@ -191,6 +289,8 @@ def setup_pestana_salida(parent, usuario_recibido):
         entry_cod_manual.configure(state="disabled")
         btn_registrar.configure(state="disabled")
         
+        sugerencias_productos.cancelar()
+        sugerencias_clientes.cancelar()
         suggestion_frame.place_forget()
         suggestion_frame_cliente.place_forget()
         
@@ -273,110 +373,77 @@ def setup_pestana_salida(parent, usuario_recibido):
 
     # --- LÓGICA DE BÚSQUEDA Y SUGERENCIAS ---
     def seleccionar_sugerencia(id_prod):
+        sugerencias_productos.cancelar()
         suggestion_frame.place_forget()
         try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            query = """
-                SELECT DISTINCT ON (s.id_articulo) 
-                    s.id_articulo, s.descripcion, s.cant_inventario, s.precio_unit, m.serial
-                FROM desarrollo.stock s
-                LEFT JOIN desarrollo.movimientos m ON s.id_articulo = m.id_producto
-                WHERE s.id_articulo = %s
-                ORDER BY s.id_articulo, m.fecha_entrega DESC
-            """
-            cur.execute(query, (id_prod,))
-            res = cur.fetchone()
-            conn.close()
+            res = indice_salidas.producto(id_prod)
             if res: cargar_datos_producto(res)
         except Exception as e: print(e)
 
+    botones_sugerencia = []
+    botones_sugerencia_cliente = []
+
+    def mostrar_sugerencias(resultados):
+        if not resultados:
+            suggestion_frame.place_forget()
+            return
+        pintar_sugerencias(suggestion_frame, botones_sugerencia,
+                           [(f"{desc}", lambda i=id_art: seleccionar_sugerencia(i)) for id_art, desc, _ in resultados])
+        suggestion_frame.place(x=280, y=55)
+        suggestion_frame.lift()
+
     def actualizar_sugerencias(event):
         texto = entry_buscar.get().strip()
         if len(texto) < 2:
+            sugerencias_productos.cancelar()
             suggestion_frame.place_forget()
             return
-
-        for widget in suggestion_frame.winfo_children(): widget.destroy()
-
-        try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            # 🚀 MEJORA: Ahora también busca mientras escribes/escaneas el código de barras
-            cur.execute("""
-                SELECT id_articulo, descripcion 
-                FROM desarrollo.stock 
-                WHERE descripcion ILIKE %s OR id_articulo::text ILIKE %s OR codigo_barras ILIKE %s 
-                LIMIT 8
-            """, (f"%{texto}%", f"{texto}%", f"{texto}%"))
-            resultados = cur.fetchall()
-            conn.close()
-
-            if resultados:
-                suggestion_frame.place(x=280, y=55)
-                suggestion_frame.lift()
-                for id_art, desc in resultados:
-                    btn = ctk.CTkButton(suggestion_frame, text=f"{desc}", anchor="w", fg_color="transparent", text_color="black", hover_color="#e0e0e0", height=25, command=lambda i=id_art: seleccionar_sugerencia(i))
-                    btn.pack(fill="x", pady=1)
-            else:
-                suggestion_frame.place_forget()
-        except: pass
+        # 🚀 Con debounce: una ráfaga del lector de códigos termina en una sola consulta
+        sugerencias_productos.buscar(entry_buscar, texto, mostrar_sugerencias)
 
     def seleccionar_cliente_sugerido(nombre_cliente):
         entry_cliente.delete(0, "end")
         entry_cliente.insert(0, nombre_cliente)
         suggestion_frame_cliente.place_forget()
 
+    def mostrar_sugerencias_cliente(resultados):
+        if not resultados or entry_cliente.cget("state") == "disabled":
+            suggestion_frame_cliente.place_forget()
+            return
+        pintar_sugerencias(suggestion_frame_cliente, botones_sugerencia_cliente,
+                           [(nombre, lambda n=nombre: seleccionar_cliente_sugerido(n)) for nombre, _ in resultados])
+        suggestion_frame_cliente.place(x=150, y=240)
+        suggestion_frame_cliente.lift()
+
     def actualizar_sugerencias_cliente(event):
         texto = entry_cliente.get().strip()
         if entry_cliente.cget("state") == "disabled" or len(texto) < 2:
+            sugerencias_clientes.cancelar()
             suggestion_frame_cliente.place_forget()
             return
-
-        for widget in suggestion_frame_cliente.winfo_children(): widget.destroy()
-
-        try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            # Ajustado a tu columna 'nombre'
-            query = "SELECT nombre FROM desarrollo.clientes WHERE nombre ILIKE %s OR id_cliente::text ILIKE %s LIMIT 5"
-            cur.execute(query, (f"%{texto}%", f"{texto}%"))
-            resultados = cur.fetchall()
-            conn.close()
-
-            if resultados:
-                suggestion_frame_cliente.place(x=150, y=240) 
-                suggestion_frame_cliente.lift()
-                for row in resultados:
-                    nombre_encontrado = row[0]
-                    btn = ctk.CTkButton(suggestion_frame_cliente, text=nombre_encontrado, anchor="w", 
-                                        fg_color="transparent", text_color="black", hover_color="#e0e0e0", height=25,
-                                        command=lambda n=nombre_encontrado: seleccionar_cliente_sugerido(n))
-                    btn.pack(fill="x", pady=1)
-            else:
-                suggestion_frame_cliente.place_forget()
-        except: suggestion_frame_cliente.place_forget()
+        sugerencias_clientes.buscar(entry_cliente, texto, mostrar_sugerencias_cliente)
 
     def buscar_prod(event=None):
         criterio = entry_buscar.get().strip()
         if not criterio: return
+        sugerencias_productos.cancelar()
         suggestion_frame.place_forget()
 
         try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            # 🚀 MEJORA: Agregamos "OR s.codigo_barras = %s" para encontrar el producto exacto al escanear
-            query = """
-                SELECT DISTINCT ON (s.id_articulo) 
-                    s.id_articulo, s.descripcion, s.cant_inventario, s.precio_unit, m.serial
-                FROM desarrollo.stock s
-                LEFT JOIN desarrollo.movimientos m ON s.id_articulo = m.id_producto
-                WHERE s.id_articulo::text = %s OR m.serial::text = %s OR s.descripcion ILIKE %s OR s.codigo_barras = %s
-                ORDER BY s.id_articulo, m.fecha_entrega DESC LIMIT 50
-            """
-            cur.execute(query, (criterio, criterio, f"%{criterio}%", criterio))
-            resultados = cur.fetchall()
-            conn.close()
+            # 🚀 Escaneo (id, código de barras o serial exacto): se resuelve en memoria
+            resultados = indice_salidas.buscar_exacto(criterio)
+            if not resultados:
+                conn = conectar_db()
+                cur = conn.cursor()
+                query = """
+                    SELECT id_articulo, descripcion, cant_inventario, precio_unit, codigo_barras
+                    FROM desarrollo.stock
+                    WHERE descripcion ILIKE %s
+                    ORDER BY id_articulo LIMIT 50
+                """
+                cur.execute(query, (f"%{criterio}%",))
+                resultados = cur.fetchall()
+                conn.close()
 
             if not resultados:
                 lbl_info.configure(text=f"❌ Sin resultados", text_color="red")
@@ -422,30 +489,41 @@ def setup_pestana_salida(parent, usuario_recibido):
         # =======================================================
         # 1. FUNCIONES AUXILIARES INTERNAS (Para guardar y validar)
         # =======================================================
-        def procesar_guardado_db(conn, cur, cant_total, lista_seriales, stock_db):
-            try:
-                for serial in lista_seriales:
-                    cur.execute("""
-                        INSERT INTO desarrollo.movimientos (id_producto, tipo_movimiento, cantidad, motivo, id_usuario, serial, cliente, fecha_entrega)
-                        VALUES (%s, 'SALIDA', 1, %s, %s, %s, %s, NOW())
-                    """, (current_product_id, motivo, current_user_id, serial, cliente))
-
-                cur.execute("""
-                    UPDATE desarrollo.stock SET cant_inventario = cant_inventario - %s, precio_total = precio_unit * (cant_inventario - %s)
-                    WHERE id_articulo = %s
-                """, (cant_total, cant_total, current_product_id))
-                
-                conn.commit()
-                conn.close()
-                
-                # 🛡️ FIX 2: Usamos tu función para resetear TODO el formulario
-                limpiar_form_salida(borrar_busqueda=True)
-                cargar_tabla_historial()
+        def procesar_guardado_db(cant_total, lista_seriales):
+            # El guardado corre en el ejecutor de fondo: la ventana sigue respondiendo y muestra el avance
+            id_producto = current_product_id
+
+            def mostrar_progreso(guardados, total):
+                try:
+                    parent.after(0, lambda: var_prod_info.set(f"💾 Guardando salidas... {guardados} de {total}"))
+                except Exception:
+                    pass  # se cambió de pantalla: el guardado sigue igual
+
+            def fallar(error):
+                messagebox.showerror("Error DB", str(error))
+                if btn_registrar.winfo_exists():
+                    btn_registrar.configure(state="normal") # Reactivar si falla la BD
+
+            def terminar(duplicados):
+                if duplicados:
+                    messagebox.showerror("❌ ERROR DE INVENTARIO",
+                                         "No se guardó ninguna salida. Estos seriales YA FUERON VENDIDOS o están repetidos:\n\n"
+                                         + "\n".join(duplicados[:20]))
+                    if btn_registrar.winfo_exists():
+                        btn_registrar.configure(state="normal")
+                    return
+
+                indice_salidas.registrar_salida(id_producto, lista_seriales, datetime.datetime.now())
+                if btn_registrar.winfo_exists():
+                    # 🛡️ FIX 2: Usamos tu función para resetear TODO el formulario
+                    limpiar_form_salida(borrar_busqueda=True)
+                    cargar_tabla_historial()
                 messagebox.showinfo("Éxito", f"Se registraron {cant_total} salidas correctamente.")
-                
-            except Exception as e:
-                messagebox.showerror("Error DB", str(e))
-                btn_registrar.configure(state="normal") # Reactivar si falla la BD
+
+            # Va asociado a la ventana principal y sin clave: cambiar de pantalla o pedir otra
+            # consulta nunca cancela un guardado ya confirmado
+            ejecutor_consultas.enviar(parent.winfo_toplevel(), guardar_salidas, id_producto, motivo, current_user_id,
+                                      cliente, lista_seriales, mostrar_progreso, al_terminar=terminar, al_fallar=fallar)
 
         def recolectar_multiples_seriales(cantidad_total, primer_serial, stock_db):
             seriales = []
@@ -483,16 +561,7 @@ def setup_pestana_salida(parent, usuario_recibido):
                 codigo = entry_scan.get().strip()
                 if not codigo: return
 
-                conn_val = conectar_db()
-                cur_val = conn_val.cursor()
-                cur_val.execute("""
-                    SELECT s.descripcion, m.fecha_entrega 
-                    FROM desarrollo.movimientos m
-                    JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
-                    WHERE m.serial = %s AND m.tipo_movimiento = 'SALIDA'
-                """, (codigo,))
-                ya_vendido = cur_val.fetchone()
-                conn_val.close()
+                ya_vendido = indice_salidas.venta_de_serial(codigo)
 
                 if ya_vendido:
                     fecha_str = ya_vendido[1].strftime("%d/%m/%Y %H:%M")
@@ -514,9 +583,7 @@ def setup_pestana_salida(parent, usuario_recibido):
                 if len(seriales) == cantidad_total:
                     entry_scan.configure(state="disabled") # Bloquea el campo para evitar que el usuario siga escaneando
                     modal.destroy()
-                    conn_fin = conectar_db()
-                    cur_fin = conn_fin.cursor()
-                    procesar_guardado_db(conn_fin, cur_fin, cantidad_total, seriales, stock_db)
+                    procesar_guardado_db(cantidad_total, seriales)
 
             entry_scan.bind("<Return>", registrar_scan)
 
@@ -544,13 +611,7 @@ def setup_pestana_salida(parent, usuario_recibido):
 
             # Validación del primer serial
             if serial_manual:
-                cur.execute("""
-                    SELECT s.descripcion, m.fecha_entrega 
-                    FROM desarrollo.movimientos m
-                    JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
-                    WHERE m.serial = %s AND m.tipo_movimiento = 'SALIDA'
-                """, (serial_manual,))
-                ya_vendido = cur.fetchone()
+                ya_vendido = indice_salidas.venta_de_serial(serial_manual)
                 
                 if ya_vendido:
                     fecha_str = ya_vendido[1].strftime("%d/%m/%Y %H:%M")
@@ -568,10 +629,8 @@ def setup_pestana_salida(parent, usuario_recibido):
                     messagebox.showwarning("Falta Serial", "⚠️ Escanee el código de la caja en el campo 'Nro. Serial'.")
                     entry_cod_manual.focus()
                     btn_registrar.configure(state="normal"); return
-                    
-                conn_directo = conectar_db()
-                cur_directo = conn_directo.cursor()
-                procesar_guardado_db(conn_directo, cur_directo, cant, [serial_manual], stock_db)
+
+                procesar_guardado_db(cant, [serial_manual])
             else:
                 recolectar_multiples_seriales(cant, serial_manual, stock_db)
 
@@ -609,21 +668,12 @@ def setup_pestana_salida(parent, usuario_recibido):
     tree.grid(row=0, column=0, sticky="nsew", padx=5, pady=(30, 5))
 
     def cargar_tabla_historial():
+        ejecutor_consultas.enviar(tree, consultar_ultimas_salidas, clave="movimientos.historial",
+                                  al_terminar=pintar_tabla_historial)
+
+    def pintar_tabla_historial(filas):
         for i in tree.get_children(): tree.delete(i)
-        try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            cur.execute("""
-                SELECT m.id_movimiento, TO_CHAR(m.fecha_entrega, 'DD/MM/YYYY HH24:MI'), 
-                       s.descripcion, m.motivo, m.cliente, m.serial
-                FROM desarrollo.movimientos m
-                JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
-                WHERE m.tipo_movimiento = 'SALIDA'
-                ORDER BY m.fecha_entrega DESC LIMIT 10
-            """)
-            for row in cur.fetchall(): tree.insert("", "end", values=row)
-            conn.close()
-        except: pass
+        for row in filas: tree.insert("", "end", values=row)
 
     # --- BINDINGS ---
     entry_buscar.bind("<KeyRelease>", actualizar_sugerencias)
@@ -8,7 +8,8 @@ from matplotlib import ticker
 import numpy as np
 import pandas as pd
 from modulos.exportar_excel import exportar_a_excel
-from bd import conectar_db
+from bd import conectar_db, conexion
+from services.ejecutor_consultas import ejecutor_consultas
 from modulos.exportar_pdf import exportar_a_pdf 
 from tkcalendar import Calendar, DateEntry
 import matplotlib.pyplot as plt
@@ -32,6 +33,16 @@ try:
 except ImportError:
     print("⚠️ Advertencia: No se encontró el módulo optimization.inventory_optimizer")
 
+try:
+    from model_store import cargar_manifiesto
+except ImportError:
+    def cargar_manifiesto(): return None
+
+try:
+    from resumen_ventas import refrescar_resumen_ventas
+except ImportError:
+    def refrescar_resumen_ventas(conn=None, completo=False): return False
+
 
 def mostrar_menu_reportes(contenido_frame):
     for widget in contenido_frame.winfo_children():
@@ -94,6 +105,14 @@ def obtener_categorias_prediccion():
     finally:
         if conn: conn.close()
 
+def preparar_pantalla_predictiva():
+    """
+    Trabajo de apertura del dashboard predictivo (corre en segundo plano): trae al día el
+    resumen mensual de ventas (solo recalcula el último mes) y devuelve las categorías.
+    """
+    refrescar_resumen_ventas()
+    return obtener_categorias_prediccion()
+
 def calcular_precision_modelo(df_real, df_pred):
     """
     Calcula la precisión usando WMAPE.
@@ -159,15 +178,14 @@ def consultar_datos_mensuales_predictivos(categoria: str, tabla: str, anio: int
 
     try:
         if tabla == 'desarrollo.ventas':
-            # --- VENTAS HISTÓRICAS (Por año específico) ---
+            # --- VENTAS HISTÓRICAS (Por año específico, desde el resumen mensual indexado) ---
             sql = """
-                SELECT DATE_TRUNC('month', v.v_fecha)::date AS fecha, SUM(v.v_cantidad) AS cantidad
-                FROM desarrollo.ventas v
-                JOIN desarrollo.stock s ON v.v_id_producto = s.id_articulo
-                WHERE TRIM(UPPER(s.categoria)) = %s AND EXTRACT(YEAR FROM v.v_fecha) = %s
+                SELECT mes AS fecha, SUM(cantidad) AS cantidad
+                FROM desarrollo.ventas_mensuales
+                WHERE categoria = %s AND mes >= MAKE_DATE(%s, 1, 1) AND mes < MAKE_DATE(%s + 1, 1, 1)
                 GROUP BY 1 ORDER BY 1;
             """
-            params = [categoria.strip().upper(), anio]
+            params = [categoria.strip().upper(), anio, anio]
             df = pd.read_sql(sql, conn, params=params)
 
         else:
@@ -193,6 +211,50 @@ def consultar_datos_mensuales_predictivos(categoria: str, tabla: str, anio: int
     finally:
         if conn: conn.close()
 
+def consultar_escenario_predictivo(categoria: str, anio_historico: int = 2023, anio_real: int = 2024):
+    """
+    Historia, predicción y ventas reales de una categoría en UNA sola consulta,
+    sobre una conexión del pool. Devuelve (df_historia, df_prediccion, df_real),
+    cada uno con columnas fecha y cantidad (mismo formato que consultar_datos_mensuales_predictivos).
+    """
+    vacio = pd.DataFrame(columns=["fecha", "cantidad"])
+    sql = """
+        SELECT 'historia' AS serie, mes AS fecha, SUM(cantidad) AS cantidad
+        FROM desarrollo.ventas_mensuales
+        WHERE categoria = %(cat)s AND mes >= MAKE_DATE(%(anio_hist)s, 1, 1) AND mes < MAKE_DATE(%(anio_hist)s + 1, 1, 1)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'real', mes, SUM(cantidad)
+        FROM desarrollo.ventas_mensuales
+        WHERE categoria = %(cat)s AND mes >= MAKE_DATE(%(anio_real)s, 1, 1) AND mes < MAKE_DATE(%(anio_real)s + 1, 1, 1)
+        GROUP BY 2
+        UNION ALL
+        SELECT 'prediccion', DATE_TRUNC('month', v_fecha)::date, SUM(cantidad_predicha)
+        FROM desarrollo.prediccion_mensual
+        WHERE TRIM(UPPER(categoria)) = %(cat)s
+        GROUP BY 2
+        ORDER BY 1, 2;
+    """
+    params = {"cat": categoria.strip().upper(), "anio_hist": anio_historico, "anio_real": anio_real}
+
+    try:
+        with conexion() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql, params)
+                filas = cur.fetchall()
+    except Exception as e:
+        print(f"❌ Error consulta escenario predictivo: {e}")
+        return vacio, vacio.copy(), vacio.copy()
+
+    df = pd.DataFrame(filas, columns=["serie", "fecha", "cantidad"])
+    df["fecha"] = pd.to_datetime(df["fecha"])
+    df["cantidad"] = pd.to_numeric(df["cantidad"])
+
+    def serie(nombre):
+        return df.loc[df["serie"] == nombre, ["fecha", "cantidad"]].reset_index(drop=True)
+
+    return serie("historia"), serie("prediccion"), serie("real")
+
 class PanelGraficoPredictivo:
     def __init__(self, parent_frame):
         self.parent = parent_frame
@@ -312,6 +374,24 @@ def abrir_ventana_configuracion(parent):
     combo_horizonte.pack(fill="x", padx=10, pady=5)
     combo_horizonte.set("1 Año (12 Meses)")
     
+    # Datos del modelo vigente (manifiesto escrito por model_trainer)
+    manifiesto = cargar_manifiesto()
+    if manifiesto:
+        horizonte_actual = manifiesto.get("horizonte")
+        for opcion in ("6 Meses", "1 Año (12 Meses)", "2 Años (24 Meses)"):
+            if f"{horizonte_actual} Meses" in opcion:
+                combo_horizonte.set(opcion)
+        wmape = manifiesto.get("metricas", {}).get("wmape_global")
+        texto_modelo = (
+            f"Modelo actual: entrenado el {manifiesto['fecha_entrenamiento'][:10]} | "
+            f"corte {manifiesto['fecha_corte']} | {horizonte_actual} meses"
+        )
+        if wmape is not None:
+            texto_modelo += f" | precisión {max(0, 100 - wmape):.1f}%"
+    else:
+        texto_modelo = "Modelo actual: sin entrenar"
+    ctk.CTkLabel(frame_params, text=texto_modelo, font=("Arial", 11), text_color="gray").pack(anchor="w", padx=10, pady=(0, 5))
+    
     ctk.CTkLabel(frame_params, text="Visualización en Reporte (Meses):", font=("Arial", 12, "bold")).pack(anchor="w", padx=10, pady=(10,5))
     
     # Slider para seleccionar entre 12 y 24 meses
@@ -493,10 +573,11 @@ def mostrar_reportes_predictivos(contenido_frame):
     ).pack(side="right", padx=(5, 20), pady=15)
     
     # Selector de Categoría
-    categorias = obtener_categorias_prediccion()
-    combo_cat = ctk.CTkOptionMenu(top_bar, values=categorias, width=200, fg_color="#3498db", button_color="#2980b9")
+    # Se llena cuando terminan de cargar las categorías (ver más abajo)
+    combo_cat = ctk.CTkOptionMenu(top_bar, values=[], width=200, fg_color="#3498db", button_color="#2980b9",
+                                  state="disabled")
+    combo_cat.set("⏳ Cargando...")
     combo_cat.pack(side="right", padx=10, pady=15)
-    if categorias: combo_cat.set(categorias[0])
     ctk.CTkLabel(top_bar, text="Categoría:", font=("Arial", 12, "bold")).pack(side="right", padx=5)
 
     # --- ÁREA DE CONTENIDO CON SCROLL (EL CAMBIO CLAVE) ---
@@ -563,19 +644,37 @@ def mostrar_reportes_predictivos(contenido_frame):
 
 
     # --- LÓGICA DE NEGOCIO ---
+    def preparar_analisis(cat):
+        # Se ejecuta en el ejecutor de fondo: la ventana no se congela
+        # Histórico 2023 (contexto), predicción completa (12 o 24 meses) y real 2024 (precisión)
+        df_2023, df_pred_futuro, df_real_2024 = consultar_escenario_predictivo(cat, 2023, 2024)
+        
+        precision = None
+        if not df_real_2024.empty:
+            precision = calcular_precision_modelo(df_real_2024, df_pred_futuro)
+        return df_2023, df_pred_futuro, df_real_2024, precision
+
+    def pintar_categorias(categorias):
+        combo_cat.configure(values=categorias, state="normal")
+        combo_cat.set(categorias[0] if categorias else "")
+
     def ejecutar_analisis():
+        if combo_cat.cget("state") == "disabled": return
         cat = combo_cat.get()
         if not cat: return
         
-        # 1. Obtener datos
-        # Histórico 2023 (Fijo para contexto)
-        df_2023 = consultar_datos_mensuales_predictivos(cat, 'desarrollo.ventas', 2023)
-        
-        # Predicción (Trae TODO lo que generó el modelo: 12 o 24 meses)
-        df_pred_futuro = consultar_datos_mensuales_predictivos(cat, 'desarrollo.prediccion_mensual')
-        
-        # Real 2024 (Para validar precisión)
-        df_real_2024 = consultar_datos_mensuales_predictivos(cat, 'desarrollo.ventas', 2024)
+        btn_analizar.configure(text="⏳ Analizando...")
+        # Si el usuario cambia de categoría antes de que termine, el pedido viejo se descarta
+        ejecutor_consultas.enviar(btn_analizar, preparar_analisis, cat, clave="reportes.analisis",
+                                  al_terminar=lambda datos: mostrar_analisis(cat, *datos),
+                                  al_fallar=error_analisis)
+
+    def error_analisis(e):
+        print(f"❌ Error en el análisis predictivo: {e}")
+        btn_analizar.configure(text="⚡ Analizar Ahora")
+
+    def mostrar_analisis(cat, df_2023, df_pred_futuro, df_real_2024, precision):
+        btn_analizar.configure(text="⚡ Analizar Ahora")
 
         # 2. Actualizar Gráfico
         # Pasamos df_pred_futuro que ahora puede tener datos de 2025
@@ -602,8 +701,7 @@ def mostrar_reportes_predictivos(contenido_frame):
             lbl_tendencia.configure(text="N/A", text_color="gray")
 
         # Precisión (Sigue comparando contra 2024 real)
-        if df_real_2024 is not None and not df_real_2024.empty:
-            precision = calcular_precision_modelo(df_real_2024, df_pred_futuro)
+        if precision is not None:
             if precision >= 80: color_prec = "#27ae60"
             elif precision >= 60: color_prec = "#f39c12"
             else: color_prec = "#e74c3c"
@@ -678,6 +776,10 @@ def mostrar_reportes_predictivos(contenido_frame):
         txt_insight.insert("0.0", msg)
         txt_insight.configure(state="disabled")
 
+    # Refresco del resumen y categorías en segundo plano: la pantalla se dibuja enseguida
+    ejecutor_consultas.enviar(combo_cat, preparar_pantalla_predictiva, clave="reportes.categorias",
+                              al_terminar=pintar_categorias)
+
 #-------------------------------------------------------------------------------------------------------------------
 # FIN DEL CODIGO DE PREDICCION INTEGRADO
 #-------------------------------------------------------------------------------------------------------------------
@@ -836,7 +938,7 @@ def mostrar_reporte(contenido_frame):
     formato_seleccionado.pack(pady=(5, 25))
     formato_seleccionado.set("Excel")
 
-    ctk.CTkButton(col3, text="🚀 GENERAR REPORTE", width=200, height=50, fg_color="#2ecc71", hover_color="#27ae60", font=("Arial", 14, "bold"),
+    btn_generar = ctk.CTkButton(col3, text="🚀 GENERAR REPORTE", width=200, height=50, fg_color="#2ecc71", hover_color="#27ae60", font=("Arial", 14, "bold"),
         command=lambda: generar_reporte_varios(
             reporte_seleccionado.get(),
             categoria_menu.get(),
@@ -845,9 +947,11 @@ def mostrar_reporte(contenido_frame):
             fecha_inicio_entry.get() if reporte_seleccionado.get() == "Ventas" else mv_fecha_inicio.get(), 
             fecha_fin_entry.get() if reporte_seleccionado.get() == "Ventas" else mv_fecha_fin.get(),
             None,
-            combo_limite.get()  # Le pedimos el valor directamente al widget
+            combo_limite.get(),  # Le pedimos el valor directamente al widget
+            widget=btn_generar
         )
-    ).pack(side="bottom")
+    )
+    btn_generar.pack(side="bottom")
 
     # ==========================================
     # EVENTOS E INICIALIZACIÓN
@@ -966,88 +1070,83 @@ def calcular_optimizacion_interna(categoria, fecha_simulada):
     return pd.DataFrame(resultados)
 
 
-def generar_reporte_varios(tipo_reporte, categoria, formato_salida, id_producto, fecha_inicio, fecha_fin, fecha_simulada=None, limite="Los 10 peores"):
+def obtener_datos_reporte(tipo_reporte, categoria, id_producto, fecha_inicio, fecha_fin, fecha_simulada=None, limite="Los 10 peores"):
     """
-    Función principal que maneja la lógica de obtención de datos y exportación.
+    Consultas del reporte (se ejecuta en el ejecutor de fondo, sin tocar widgets).
+    Devuelve (df_reporte, filtros, aviso): aviso es el mensaje a mostrar si no hay datos.
+    Lanza ValueError con el mensaje para el usuario si los filtros tienen mal formato.
     """
-    root = None
-    try:
-        root = Tk()
-        root.withdraw()
-    except Exception: pass 
-
     filtros = {'categoria': categoria}
     df_reporte = None
     fecha_sql = datetime.now().strftime('%Y-%m-%d')
-    
-    try:
-        # 1. LÓGICA SEGÚN TIPO DE REPORTE
-        if tipo_reporte == "Inventario":
-            df_reporte = consultar_stock(categoria)
+    aviso = "No se generaron datos para el reporte."
 
-        elif tipo_reporte == "Optimización de Inventario":
-            print("🔮 Ejecutando motor de optimización (Lógica Interna)...")
-            
-            # 1. Usamos la lógica interna con los nombres de columna ya corregidos
-            df_reporte = calcular_optimizacion_interna(categoria, fecha_simulada)
-            
-            if df_reporte.empty:
-                try:
-                    print("⚠️ Datos internos vacíos, intentando módulo externo...")
-                    from optimization.inventory_optimizer import generar_dataset_reporte
-                    df_reporte = generar_dataset_reporte(categoria, fecha_sql)
-                except ImportError:
-                    pass
+    # 1. LÓGICA SEGÚN TIPO DE REPORTE
+    if tipo_reporte == "Inventario":
+        df_reporte = consultar_stock(categoria)
 
-            if df_reporte is None or df_reporte.empty:
-                messagebox.showinfo("Resultado", "No hay datos para generar recomendaciones.")
-                return
-
-        elif tipo_reporte == "Ventas":
-            try:
-                id_prod_filter = int(id_producto.strip()) if id_producto.strip() else None
-                fecha_inicio_sql = datetime.strptime(fecha_inicio.strip(), '%d-%m-%Y').strftime('%Y-%m-%d') if fecha_inicio.strip() else '2000-01-01'
-                fecha_fin_sql = datetime.strptime(fecha_fin.strip(), '%d-%m-%Y').strftime('%Y-%m-%d') if fecha_fin.strip() else datetime.now().strftime('%Y-%m-%d')
-                
-                filtros['id_producto'] = id_prod_filter if id_prod_filter else 'Todos'
-                filtros['fecha_inicio'] = fecha_inicio if fecha_inicio else 'Inicio'
-                filtros['fecha_fin'] = fecha_fin if fecha_fin else 'Hoy'
-                
-                df_reporte = consultar_ventas(id_prod_filter, fecha_inicio_sql, fecha_fin_sql, categoria)
-            except ValueError:
-                messagebox.showerror("Error", "Revise formatos (Fecha DD-MM-YYYY, ID numérico).")
-                return
+    elif tipo_reporte == "Optimización de Inventario":
+        print("🔮 Ejecutando motor de optimización (Lógica Interna)...")
+        aviso = "No hay datos para generar recomendaciones."
         
-        elif tipo_reporte == "Productos Menos Vendidos":
-            try:
-                # 🚀 El FIX: Le agregamos 00:00:00 al inicio y 23:59:59 al final
-                fecha_in = datetime.strptime(fecha_inicio.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 00:00:00') if fecha_inicio.strip() else '2000-01-01 00:00:00'
-                fecha_out = datetime.strptime(fecha_fin.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 23:59:59') if fecha_fin.strip() else datetime.now().strftime('%Y-%m-%d 23:59:59')
-                
-                df_reporte = consultar_menores_ventas(categoria, limite, fecha_in, fecha_out)
-                filtros['Rango'] = f"{fecha_inicio} a {fecha_fin}"
-                filtros['Criterio'] = limite
-            except ValueError:
-                messagebox.showerror("Error", "Revise formatos de fecha (DD-MM-YYYY).")
-                return
+        # 1. Usamos la lógica interna con los nombres de columna ya corregidos
+        df_reporte = calcular_optimizacion_interna(categoria, fecha_simulada)
         
-        elif tipo_reporte == "Mayor Tasa de Fallas":
+        if df_reporte.empty:
             try:
-                # 🚀 El FIX: Mismo ajuste de reloj para las fallas
-                fecha_in = datetime.strptime(fecha_inicio.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 00:00:00') if fecha_inicio.strip() else '2000-01-01 00:00:00'
-                fecha_out = datetime.strptime(fecha_fin.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 23:59:59') if fecha_fin.strip() else datetime.now().strftime('%Y-%m-%d 23:59:59')
-                
-                df_reporte = consultar_tasa_fallas(categoria, limite, fecha_in, fecha_out)
-                filtros['Rango'] = f"{fecha_inicio} a {fecha_fin}"
-                filtros['Criterio'] = limite
-            except ValueError:
-                messagebox.showerror("Error", "Revise formatos de fecha (DD-MM-YYYY).")
-                return
+                print("⚠️ Datos internos vacíos, intentando módulo externo...")
+                from optimization.inventory_optimizer import generar_dataset_reporte
+                df_reporte = generar_dataset_reporte(categoria, fecha_sql)
+            except ImportError:
+                pass
+
+    elif tipo_reporte == "Ventas":
+        try:
+            id_prod_filter = int(id_producto.strip()) if id_producto.strip() else None
+            fecha_inicio_sql = datetime.strptime(fecha_inicio.strip(), '%d-%m-%Y').strftime('%Y-%m-%d') if fecha_inicio.strip() else '2000-01-01'
+            fecha_fin_sql = datetime.strptime(fecha_fin.strip(), '%d-%m-%Y').strftime('%Y-%m-%d') if fecha_fin.strip() else datetime.now().strftime('%Y-%m-%d')
+        except ValueError:
+            raise ValueError("Revise formatos (Fecha DD-MM-YYYY, ID numérico).") from None
         
-        if df_reporte is None or df_reporte.empty:
-            messagebox.showinfo("Resultado", "No se generaron datos para el reporte.")
-            return
+        filtros['id_producto'] = id_prod_filter if id_prod_filter else 'Todos'
+        filtros['fecha_inicio'] = fecha_inicio if fecha_inicio else 'Inicio'
+        filtros['fecha_fin'] = fecha_fin if fecha_fin else 'Hoy'
+        
+        df_reporte = consultar_ventas(id_prod_filter, fecha_inicio_sql, fecha_fin_sql, categoria)
+    
+    elif tipo_reporte in ("Productos Menos Vendidos", "Mayor Tasa de Fallas"):
+        try:
+            # 🚀 El FIX: Le agregamos 00:00:00 al inicio y 23:59:59 al final
+            fecha_in = datetime.strptime(fecha_inicio.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 00:00:00') if fecha_inicio.strip() else '2000-01-01 00:00:00'
+            fecha_out = datetime.strptime(fecha_fin.strip(), '%d-%m-%Y').strftime('%Y-%m-%d 23:59:59') if fecha_fin.strip() else datetime.now().strftime('%Y-%m-%d 23:59:59')
+        except ValueError:
+            raise ValueError("Revise formatos de fecha (DD-MM-YYYY).") from None
+        
+        if tipo_reporte == "Productos Menos Vendidos":
+            df_reporte = consultar_menores_ventas(categoria, limite, fecha_in, fecha_out)
+        else:
+            df_reporte = consultar_tasa_fallas(categoria, limite, fecha_in, fecha_out)
+        filtros['Rango'] = f"{fecha_inicio} a {fecha_fin}"
+        filtros['Criterio'] = limite
+
+    if tipo_reporte == "Optimización de Inventario":
+        filtros['simulado_en'] = fecha_sql
+    return df_reporte, filtros, aviso
+
+
+def exportar_reporte(tipo_reporte, categoria, formato_salida, df_reporte, filtros, aviso):
+    """Pide dónde guardar y exporta (hilo de Tk)."""
+    if df_reporte is None or df_reporte.empty:
+        messagebox.showinfo("Resultado", aviso)
+        return
 
+    root = None
+    try:
+        root = Tk()
+        root.withdraw()
+    except Exception: pass 
+
+    try:
         nombre_base = f"{tipo_reporte.replace(' ', '_')}_{categoria.replace(' ', '_')}"[:30]
         extension = ".xlsx" if formato_salida == "Excel" else ".pdf"
         
@@ -1068,19 +1167,46 @@ def generar_reporte_varios(tipo_reporte, categoria, formato_salida, id_producto,
             titulo_pdf = tipo_reporte
             if tipo_reporte == "Optimización de Inventario": # Ajustado nombre para coincidir
                 titulo_pdf = "Inteligente de Reabastecimiento"
-                filtros['categoria'] = categoria
-                filtros['simulado_en'] = fecha_sql
                 
             exportar_a_pdf(df_reporte, file_path, titulo_pdf, filtros) 
             messagebox.showinfo("Éxito", f"Reporte guardado en:\n{file_path}")
 
     except Exception as e:
-        messagebox.showerror("Error Crítico", f"Error al generar reporte: {e}")
-        import traceback
-        traceback.print_exc()
+        error_reporte(e)
         
     finally:
         if root: root.destroy()
+
+
+def error_reporte(e):
+    if isinstance(e, ValueError):
+        messagebox.showerror("Error", str(e))
+        return
+    messagebox.showerror("Error Crítico", f"Error al generar reporte: {e}")
+    import traceback
+    traceback.print_exception(type(e), e, e.__traceback__)
+
+
+def generar_reporte_varios(tipo_reporte, categoria, formato_salida, id_producto, fecha_inicio, fecha_fin, fecha_simulada=None, limite="Los 10 peores", widget=None):
+    """
+    Función principal: obtiene los datos y los exporta.
+    Con 'widget' las consultas corren en el ejecutor de fondo y la exportación sigue
+    en el hilo de Tk cuando llegan; sin él todo se hace en el momento.
+    """
+    exportar = lambda datos: exportar_reporte(tipo_reporte, categoria, formato_salida, *datos)
+    args = (tipo_reporte, categoria, id_producto, fecha_inicio, fecha_fin, fecha_simulada, limite)
+
+    if widget is None:
+        try:
+            datos = obtener_datos_reporte(*args)
+        except Exception as e:
+            error_reporte(e)
+            return
+        exportar(datos)
+        return
+
+    ejecutor_consultas.enviar(widget, obtener_datos_reporte, *args, clave="reportes.generar",
+                              al_terminar=exportar, al_fallar=error_reporte)
         
         
 def obtener_categorias_garantias():
@@ -12,6 +12,21 @@ try:
 except ImportError:
     def conectar_db(): return None 
 
+try:
+    from model_store import cargar_manifiesto
+except ImportError:
+    def cargar_manifiesto(): return None
+
+try:
+    from resumen_ventas import refrescar_resumen_ventas
+except ImportError:
+    def refrescar_resumen_ventas(conn=None, completo=False): return False
+
+try:
+    from services.ejecutor_consultas import ejecutor_consultas
+except ImportError:
+    ejecutor_consultas = None
+
 # ===============================
 # 🔹 1. FUNCIONES DE CONSULTA SQL
 # ===============================
@@ -29,6 +44,25 @@ def obtener_categorias():
     finally:
         if conn: conn.close()
 
+def preparar_pantalla():
+    """Refresca el resumen mensual de ventas (solo el último mes) y devuelve las categorías."""
+    refrescar_resumen_ventas()
+    return obtener_categorias()
+
+def consultar_escenario(categoria: str, anio_historico: int, anio_objetivo: int, con_real: bool):
+    """Las series del gráfico: histórico, predicción y (si con_real) la realidad del año objetivo."""
+    df_hist = consultar_datos_mensuales(categoria, 'desarrollo.ventas', anio_historico)
+    df_pred = consultar_datos_mensuales(categoria, 'desarrollo.prediccion_mensual', anio_objetivo)
+    df_real = consultar_datos_mensuales(categoria, 'desarrollo.ventas', anio_objetivo) if con_real else None
+    return df_hist, df_pred, df_real
+
+def en_segundo_plano(widget, funcion, *args, al_terminar, clave):
+    """Usa el ejecutor compartido; sin él (ejecución suelta del módulo) corre en el momento."""
+    if ejecutor_consultas is None:
+        al_terminar(funcion(*args))
+    else:
+        ejecutor_consultas.enviar(widget, funcion, *args, al_terminar=al_terminar, clave=clave)
+
 def consultar_datos_mensuales(categoria: str, tabla: str, anio: int) -> pd.DataFrame:
     """
     Consulta datos para un año específico.
@@ -47,12 +81,11 @@ def consultar_datos_mensuales(categoria: str, tabla: str, anio: int) -> pd.DataF
     # -----------------------------------------------------------
 
     if tabla == 'desarrollo.ventas':
-        # Ventas reales (históricas o del 2024 actual)
+        # Ventas reales (históricas o del 2024 actual), desde el resumen mensual indexado
         sql = """
-            SELECT DATE_TRUNC('month', v.v_fecha)::date AS fecha, SUM(v.v_cantidad) AS cantidad
-            FROM desarrollo.ventas v
-            JOIN desarrollo.stock s ON v.v_id_producto = s.id_articulo
-            WHERE TRIM(UPPER(s.categoria)) = %s AND EXTRACT(YEAR FROM v.v_fecha) = %s
+            SELECT mes AS fecha, SUM(cantidad) AS cantidad
+            FROM desarrollo.ventas_mensuales
+            WHERE categoria = %s AND mes >= MAKE_DATE(%s, 1, 1) AND mes < MAKE_DATE(%s + 1, 1, 1)
             GROUP BY 1 ORDER BY 1;
         """
     else:
@@ -66,6 +99,8 @@ def consultar_datos_mensuales(categoria: str, tabla: str, anio: int) -> pd.DataF
         """
     
     params = [categoria.strip().upper(), anio]
+    if tabla == 'desarrollo.ventas':
+        params.append(anio)
 
     try:
         df = pd.read_sql(sql, conn, params=params)
@@ -180,14 +215,14 @@ def crear_interfaz_reportes_predictivos(parent_frame):
     
     # Selector
     tk.Label(control_frame, text="Categoría de Producto:", bg="#ecf0f1").pack(padx=15, anchor="w")
-    categorias = obtener_categorias()
-    combo_cat = ttk.Combobox(control_frame, values=categorias, state="readonly")
+    combo_cat = ttk.Combobox(control_frame, values=[], state="readonly")
     combo_cat.pack(fill="x", padx=15, pady=(5, 20))
-    if categorias: combo_cat.current(0)
+    combo_cat.set("⏳ Cargando...")
 
-    # Variables Fijas de Años
-    ANIO_HISTORICO = 2023
-    ANIO_OBJETIVO = 2024
+    # Años a comparar: el objetivo es el primer año pronosticado según el manifiesto del modelo
+    manifiesto = cargar_manifiesto()
+    ANIO_OBJETIVO = pd.Timestamp(manifiesto["fecha_corte"]).year if manifiesto else 2024
+    ANIO_HISTORICO = ANIO_OBJETIVO - 1
 
     # Instancia del Gráfico
     graph_area = tk.Frame(main_container, bg="white")
@@ -195,19 +230,24 @@ def crear_interfaz_reportes_predictivos(parent_frame):
     panel = PanelGraficoPredictivo(graph_area)
 
     # --- LÓGICA DE BOTONES ---
-    def cargar_escenario_completo():
+    def pintar_categorias(categorias):
+        combo_cat.configure(values=categorias)
+        if categorias: combo_cat.current(0)
+        else: combo_cat.set("")
+
+    def categoria_elegida():
         cat = combo_cat.get()
+        return cat if cat in combo_cat.cget("values") else None
+
+    def cargar_escenario_completo():
+        cat = categoria_elegida()
         if not cat: return
         
-        # 1. Traer datos 2023 (Contexto)
-        df_2023 = consultar_datos_mensuales(cat, 'desarrollo.ventas', ANIO_HISTORICO)
-        
-        # 2. Traer predicción 2024 (Modelo)
-        df_pred_2024 = consultar_datos_mensuales(cat, 'desarrollo.prediccion_mensual', ANIO_OBJETIVO)
-        
-        # 3. Traer realidad 2024 (Validación)
-        df_real_2024 = consultar_datos_mensuales(cat, 'desarrollo.ventas', ANIO_OBJETIVO)
-        
+        # 2023 (contexto), predicción 2024 (modelo) y realidad 2024 (validación), en segundo plano
+        en_segundo_plano(combo_cat, consultar_escenario, cat, ANIO_HISTORICO, ANIO_OBJETIVO, True,
+                         al_terminar=lambda series: pintar_escenario(cat, *series), clave="predictivo.escenario")
+
+    def pintar_escenario(cat, df_2023, df_pred_2024, df_real_2024):
         if df_2023.empty and df_pred_2024.empty:
             messagebox.showwarning("Sin datos", "No se encontraron datos para graficar.")
             return
@@ -217,13 +257,11 @@ def crear_interfaz_reportes_predictivos(parent_frame):
 
     def ver_solo_pronostico():
         # Opción para ver solo la predicción sin "hacer trampa" viendo la realidad
-        cat = combo_cat.get()
+        cat = categoria_elegida()
         if not cat: return
         
-        df_2023 = consultar_datos_mensuales(cat, 'desarrollo.ventas', ANIO_HISTORICO)
-        df_pred_2024 = consultar_datos_mensuales(cat, 'desarrollo.prediccion_mensual', ANIO_OBJETIVO)
-        
-        panel.actualizar_grafico(cat, df_2023, df_pred_2024, df_real_2024=None)
+        en_segundo_plano(combo_cat, consultar_escenario, cat, ANIO_HISTORICO, ANIO_OBJETIVO, False,
+                         al_terminar=lambda series: panel.actualizar_grafico(cat, *series), clave="predictivo.escenario")
 
     # Botones
     btn_style = {"relief":"flat", "font":("Segoe UI", 10), "cursor":"hand2", "pady": 8}
@@ -238,6 +276,8 @@ def crear_interfaz_reportes_predictivos(parent_frame):
     tk.Label(control_frame, text=f"Comparando:\n• Base: {ANIO_HISTORICO}\n• Objetivo: {ANIO_OBJETIVO}", 
              bg="#ecf0f1", fg="#7f8c8d", justify="left", font=("Arial", 9)).pack(side="bottom", anchor="w", padx=15, pady=20)
 
+    en_segundo_plano(combo_cat, preparar_pantalla, al_terminar=pintar_categorias, clave="predictivo.categorias")
+
 # ===============================
 # EJECUCIÓN
 # ===============================
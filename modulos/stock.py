@@ -2,9 +2,67 @@
 from tkinter import messagebox
 import customtkinter as ctk
 from sqlalchemy import null
-from bd import conectar_db
+from bd import conectar_db, conexion
 import tkinter.ttk as ttk
 from decimal import Decimal, InvalidOperation
+from services.ejecutor_consultas import ejecutor_consultas
+
+# Filas por página de la tabla de inventario
+TAMANO_PAGINA = 200
+
+
+def _filtros_busqueda(desc_filtro, cat_filtro):
+    """Condiciones WHERE y parámetros comunes a la búsqueda y al conteo."""
+    condiciones = ""
+    params = []
+    if desc_filtro:
+        # Busca tanto en descripción como en el código de barras (índices trigram, ver migraciones.py)
+        condiciones += " AND (descripcion ILIKE %s OR codigo_barras ILIKE %s)"
+        params.extend([f"%{desc_filtro}%", f"%{desc_filtro}%"])
+    if cat_filtro:
+        condiciones += " AND categoria ILIKE %s"
+        params.append(f"%{cat_filtro}%")
+    return condiciones, params
+
+
+def buscar_articulos(desc_filtro="", cat_filtro="", despues_de=None, limite=TAMANO_PAGINA):
+    """
+    Una página de artículos ordenada por id_articulo DESC.
+    Paginación por clave (keyset): despues_de es el último id de la página anterior,
+    así cada página es una lectura por índice sin OFFSET, por profunda que sea.
+    """
+    condiciones, params = _filtros_busqueda(desc_filtro, cat_filtro)
+    if despues_de is not None:
+        condiciones += " AND id_articulo < %s"
+        params.append(despues_de)
+
+    query = f"""
+        SELECT id_articulo, descripcion, precio_unit, cant_inventario, categoria, precio_total, moneda, codigo_barras
+        FROM desarrollo.stock
+        WHERE 1=1 {condiciones}
+        ORDER BY id_articulo DESC
+        LIMIT %s
+    """
+    params.append(limite)
+
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        filas = cursor.fetchall()
+        cursor.close()
+    return filas
+
+
+def contar_articulos(desc_filtro="", cat_filtro=""):
+    """Total de artículos que cumplen el filtro (para el título)."""
+    condiciones, params = _filtros_busqueda(desc_filtro, cat_filtro)
+    with conexion() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT COUNT(*) FROM desarrollo.stock WHERE 1=1 {condiciones}", params)
+        total = cursor.fetchone()[0]
+        cursor.close()
+    return total
+
 
 def mostrar_productos(frame_destino):
     # Limpiar el frame anterior
@@ -111,56 +169,58 @@ def mostrar_productos(frame_destino):
         tree.column(col, anchor=anchor_type, width=col_widths.get(col, 100))
 
     # --- Función para cargar artículos ---
-    def cargar_articulos():
-        tree.delete(*tree.get_children())
-        
-        desc_filtro = entry_desc.get().strip()
-        cat_filtro = entry_cat.get().strip()
-
-        # QUERY ACTUALIZADA
-        query = """
-            SELECT id_articulo, descripcion, precio_unit, cant_inventario, categoria, precio_total, moneda, codigo_barras
-            FROM desarrollo.stock
-            WHERE 1=1
-        """
-        params = []
-        
-        if desc_filtro:
-            # Busca tanto en descripción como en el código de barras
-            query += " AND (descripcion ILIKE %s OR codigo_barras ILIKE %s)"
-            params.extend([f"%{desc_filtro}%", f"%{desc_filtro}%"])
-        if cat_filtro:
-            query += " AND categoria ILIKE %s"
-            params.append(f"%{cat_filtro}%")
-        
-        query += " ORDER BY id_articulo DESC"
-
-        try:
-            conn = conectar_db()
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            filas = cursor.fetchall()
+    # La tabla se llena por páginas: al abrir o buscar se trae la primera y el resto
+    # se pide a medida que el scroll se acerca al final (ver on_scroll_tabla)
+    estado_tabla = {"filtros": ("", ""), "ultimo_id": None, "hay_mas": False, "cargando": False}
+
+    def cargar_pagina():
+        # La consulta va al ejecutor de fondo; una búsqueda nueva reemplaza a la página pendiente
+        desc_filtro, cat_filtro = estado_tabla["filtros"]
+        estado_tabla["cargando"] = True
+        ejecutor_consultas.enviar(tree, buscar_articulos, desc_filtro, cat_filtro, estado_tabla["ultimo_id"],
+                                  clave="stock.pagina", al_terminar=pintar_pagina, al_fallar=error_pagina)
+
+    def error_pagina(e):
+        estado_tabla["cargando"] = False
+        print(f"Error al filtrar: {e}")
+
+    def pintar_pagina(filas):
+        estado_tabla["cargando"] = False
+        for row in filas:
+            id_art, descripcion, precio, stock, categoria, total, moneda, cod_barras = row
             
-            for row in filas:
-                id_art, descripcion, precio, stock, categoria, total, moneda, cod_barras = row
-                
-                moneda_str = moneda if moneda else "USD"
-                cb_str = cod_barras if cod_barras else "Sin código"
-                simbolo = "$" if moneda_str == "USD" else "Gs."
-                
-                precio_fmt = f"{simbolo}{precio:,.2f}" if precio is not None else f"{simbolo}0.00"
-                total_fmt = f"{simbolo}{total:,.2f}" if total is not None else f"{simbolo}0.00"
-                
-                tree.insert("", "end", values=(id_art, cb_str, descripcion, moneda_str, precio_fmt, stock, categoria, total_fmt))
+            moneda_str = moneda if moneda else "USD"
+            cb_str = cod_barras if cod_barras else "Sin código"
+            simbolo = "$" if moneda_str == "USD" else "Gs."
             
-            cursor.close()
-            conn.close()
-            
-            try: lbl_titulo.configure(text=f"📦 Gestión de Inventario ({len(filas)} productos)")
-            except: pass
+            precio_fmt = f"{simbolo}{precio:,.2f}" if precio is not None else f"{simbolo}0.00"
+            total_fmt = f"{simbolo}{total:,.2f}" if total is not None else f"{simbolo}0.00"
             
-        except Exception as e:
-            print(f"Error al filtrar: {e}")
+            tree.insert("", "end", values=(id_art, cb_str, descripcion, moneda_str, precio_fmt, stock, categoria, total_fmt))
+
+        if filas:
+            estado_tabla["ultimo_id"] = filas[-1][0]
+        estado_tabla["hay_mas"] = len(filas) == TAMANO_PAGINA
+
+    def cargar_articulos():
+        tree.delete(*tree.get_children())
+        tree.yview_moveto(0)
+
+        estado_tabla["filtros"] = (entry_desc.get().strip(), entry_cat.get().strip())
+        estado_tabla["ultimo_id"] = None
+        cargar_pagina()
+
+        ejecutor_consultas.enviar(lbl_titulo, contar_articulos, *estado_tabla["filtros"], clave="stock.conteo",
+                                  al_terminar=lambda total: lbl_titulo.configure(text=f"📦 Gestión de Inventario ({total} productos)"),
+                                  al_fallar=lambda e: print(f"Error al contar artículos: {e}"))
+
+    def on_scroll_tabla(primero, ultimo):
+        scrollbar_y.set(primero, ultimo)
+        # Cerca del final de lo cargado: pedir la página siguiente
+        if estado_tabla["hay_mas"] and not estado_tabla["cargando"] and float(ultimo) >= 0.9:
+            tree.after_idle(cargar_pagina)
+
+    tree.configure(yscrollcommand=on_scroll_tabla)
 
     entry_desc.bind("<Return>", lambda event: cargar_articulos())
     entry_cat.bind("<Return>", lambda event: cargar_articulos())
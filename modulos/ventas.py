@@ -1,7 +1,59 @@
 import customtkinter as ctk
 import tkinter.ttk as ttk
-from bd import conectar_db
+from bd import conectar_db, conexion
 from tkinter import messagebox
+from services.ejecutor_consultas import ejecutor_consultas
+
+def consultar_ventas(filtro_comp, filtro_cli, filtro_fec):
+    """Comprobantes agrupados con los filtros de la pantalla de ventas."""
+    # ✅ Query Base MODIFICADA con JOIN para traer el nombre del cliente
+    query = """
+        SELECT 
+            v.v_comprob, 
+            v.v_tipotransacc, 
+            SUM(v.v_montous_total) as total_factura, 
+            MAX(COALESCE(c.id_cliente::text || ' - ' || c.nombre, v.v_id_cliente::text)) as nombre_cliente,
+            v.v_fact, 
+            COUNT(*) as items_fisicos, 
+            MAX(v.v_user), 
+            TO_CHAR(MAX(v.v_fecha), 'DD/MM/YYYY HH24:MI:SS')
+        FROM desarrollo.ventas v
+        LEFT JOIN desarrollo.clientes c ON v.v_id_cliente = c.id_cliente
+        WHERE 1=1
+    """
+    params = []
+
+    # --- APLICACIÓN DE FILTROS ---
+    if filtro_comp: 
+        query += " AND CAST(v.v_comprob AS TEXT) ILIKE %s"
+        params.append(f"%{filtro_comp}%")
+
+    if filtro_cli:
+        if filtro_cli.isdigit():
+            query += " AND v.v_id_cliente = %s"
+            params.append(filtro_cli)
+        else:
+            # Permite buscar por nombre de cliente también
+            query += " AND c.nombre ILIKE %s"
+            params.append(f"%{filtro_cli}%")
+    
+    if filtro_fec:
+        query += " AND TO_CHAR(v.v_fecha, 'DD/MM/YYYY')::text LIKE %s"
+        params.append(f"%{filtro_fec}%")
+
+    # Group By
+    query += """
+        GROUP BY v.v_comprob, v.v_tipotransacc, v.v_fact, v.v_id_cliente
+        ORDER BY MAX(v.v_fecha) DESC
+    """
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(query, params)
+        filas = cur.fetchall()
+        cur.close()
+    return filas
+
 
 def mostrar_ventas(frame_destino):
     # Limpiar frame anterior
@@ -106,70 +158,27 @@ def mostrar_ventas(frame_destino):
         filtro_cli = entry_cliente.get().strip()
         filtro_fec = entry_fecha.get().strip()
 
-        # ✅ Query Base MODIFICADA con JOIN para traer el nombre del cliente
-        query = """
-            SELECT 
-                v.v_comprob, 
-                v.v_tipotransacc, 
-                SUM(v.v_montous_total) as total_factura, 
-                MAX(COALESCE(c.id_cliente::text || ' - ' || c.nombre, v.v_id_cliente::text)) as nombre_cliente,
-                v.v_fact, 
-                COUNT(*) as items_fisicos, 
-                MAX(v.v_user), 
-                TO_CHAR(MAX(v.v_fecha), 'DD/MM/YYYY HH24:MI:SS')
-            FROM desarrollo.ventas v
-            LEFT JOIN desarrollo.clientes c ON v.v_id_cliente = c.id_cliente
-            WHERE 1=1
-        """
-        params = []
-
-        # --- APLICACIÓN DE FILTROS ---
-        if filtro_comp: 
-            query += " AND CAST(v.v_comprob AS TEXT) ILIKE %s"
-            params.append(f"%{filtro_comp}%")
-
-        if filtro_cli:
-            if filtro_cli.isdigit():
-                query += " AND v.v_id_cliente = %s"
-                params.append(filtro_cli)
-            else:
-                # Permite buscar por nombre de cliente también
-                query += " AND c.nombre ILIKE %s"
-                params.append(f"%{filtro_cli}%")
-        
-        if filtro_fec:
-            query += " AND TO_CHAR(v.v_fecha, 'DD/MM/YYYY')::text LIKE %s"
-            params.append(f"%{filtro_fec}%")
-
-        # Group By
-        query += """
-            GROUP BY v.v_comprob, v.v_tipotransacc, v.v_fact, v.v_id_cliente
-            ORDER BY MAX(v.v_fecha) DESC
-        """
+        # La consulta corre en segundo plano; una búsqueda nueva reemplaza a la anterior
+        ejecutor_consultas.enviar(tree, consultar_ventas, filtro_comp, filtro_cli, filtro_fec, clave="ventas.listado",
+                                  al_terminar=pintar_ventas, al_fallar=error_ventas)
 
-        try:
-            conn = conectar_db()
-            cur = conn.cursor()
-            cur.execute(query, params)
-            filas = cur.fetchall()
-            
-            for row in filas:
-                (v_comp, v_tipo, v_total, v_nom, v_fact_ref, v_cant, v_usr, v_date) = row
-                
-                total_fmt = f"${v_total:,.0f}" if v_total else "$0"
-                v_comp_str = str(v_comp) # Asegurar string
+    def error_ventas(e):
+        messagebox.showerror("Error", f"Error SQL: {e}")
+        print(e)
 
-                tree.insert("", "end", values=(
-                    v_comp_str, v_tipo, total_fmt, v_nom, v_fact_ref, v_cant, v_usr, v_date
-                ))
+    def pintar_ventas(filas):
+        tree.delete(*tree.get_children())
+        for row in filas:
+            (v_comp, v_tipo, v_total, v_nom, v_fact_ref, v_cant, v_usr, v_date) = row
             
-            cur.close()
-            conn.close()
-            lbl_titulo.configure(text=f"💰 Historial de Ventas ({len(filas)} registros)")
+            total_fmt = f"${v_total:,.0f}" if v_total else "$0"
+            v_comp_str = str(v_comp) # Asegurar string
 
-        except Exception as e:
-            messagebox.showerror("Error", f"Error SQL: {e}")
-            print(e)
+            tree.insert("", "end", values=(
+                v_comp_str, v_tipo, total_fmt, v_nom, v_fact_ref, v_cant, v_usr, v_date
+            ))
+        
+        lbl_titulo.configure(text=f"💰 Historial de Ventas ({len(filas)} registros)")
 
     # ============================================================
     # 5. DETALLE "FULL" (Mostrar todo)
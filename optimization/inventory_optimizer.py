@@ -4,13 +4,13 @@ import os
 import sys
 from datetime import datetime
 
-# Ajuste de rutas para importar bd
+# Ajuste de rutas para importar data_connector
 current_dir = os.path.dirname(os.path.abspath(__file__))
-parent_dir = os.path.dirname(os.path.dirname(current_dir)) # Subir dos niveles
+parent_dir = os.path.dirname(current_dir)
 if parent_dir not in sys.path:
     sys.path.append(parent_dir)
 
-from src.bd import conectar_db
+from data_connector import conectar_data_db
 
 # --- CONSTANTES DE NEGOCIO (Configurables) ---
 COSTO_HACER_PEDIDO = 50.0   # Costo fijo por emitir una orden de compra
@@ -22,8 +22,8 @@ def obtener_datos_combinados(simulated_date_str=None):
     """
     Une predicciones, stock y costos, usando una fecha simulada.
     """
-    conn = conectar_db()
-    if conn is None: return pd.DataFrame()
+    engine = conectar_data_db()
+    if engine is None: return pd.DataFrame()
 
     if simulated_date_str:
         fecha_base = simulated_date_str
@@ -52,13 +52,11 @@ def obtener_datos_combinados(simulated_date_str=None):
     """
     
     try:
-        df = pd.read_sql(sql, conn, params={"fecha": fecha_base})
+        df = pd.read_sql(sql, engine, params={"fecha": fecha_base})
         return df
     except Exception as e:
         print(f"❌ Error obteniendo datos para optimización: {e}")
         return pd.DataFrame()
-    finally:
-        conn.close()
 
 def calcular_recomendacion_compra(df):
     """
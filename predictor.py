@@ -1,100 +1,88 @@
 # Archivo: src/feature_engineering/predictor.py
 
-import pandas as pd
 import numpy as np
-import pickle
-from datetime import datetime
+import pandas as pd
 import os
+import sys
+
+current_dir = os.path.dirname(os.path.abspath(__file__))
+if current_dir not in sys.path:
+    sys.path.append(current_dir)
 
-RUTA_MODELO = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'modelo_xgboost.pkl')
+from bd import conexion
+from model_store import cargar_modelo_nativo
+
+# Historia mensual de un lote de productos (misma agregación que model_trainer._agrupar_desde_bd)
+SQL_HISTORIA_PRODUCTOS = """
+    SELECT date_trunc('month', v_fecha)::date AS fecha_mes,
+           v_id_producto,
+           categoria,
+           SUM(cantidad_vendida) AS cantidad_vendida,
+           AVG(precio_promedio) AS v_precio
+    FROM desarrollo.prediccion_dataset
+    WHERE v_id_producto = ANY(%(ids)s)
+    GROUP BY 1, 2, 3
+"""
 
 def cargar_modelo():
     """
-    Carga el modelo XGBoost previamente entrenado desde el archivo .pkl.
+    Modelo para predecir: el Booster en formato nativo (UBJ/JSON) que indica el manifiesto,
+    sin deserializar con pickle. Lo cachea model_store por fecha de modificación del archivo,
+    así solo se vuelve a leer del disco si se re-entrenó.
+    Devuelve (booster, manifiesto) o (None, None).
     """
-    try:
-        ruta_modelo_ajustada = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'modelo_xgboost.pkl')
-        
-        with open(ruta_modelo_ajustada, 'rb') as f:
-            modelo = pickle.load(f)
-        return modelo
-    except FileNotFoundError:
-        print(f"❌ Error: Archivo de modelo no encontrado. Asegúrese de que 'modelo_xgboost.pkl' esté en el directorio 'src/'.")
-        return None
-    except Exception as e:
-        print(f"❌ Error al cargar el modelo: {e}")
-        return None
+    return cargar_modelo_nativo()
 
-def crear_df_futuro(producto_id, anio_prediccion):
+def predecir_mensual(df_features, modelo=None, manifiesto=None):
     """
-    Crea un DataFrame con todas las fechas del año a predecir 
-    y sus características temporales.
+    Predice con el modelo mensual guardado por model_trainer (formato nativo + manifiesto),
+    todas las filas (productos x meses) en una sola llamada a inplace_predict().
+    df_features debe tener las columnas listadas en el manifiesto (ver generar_features_mensuales);
+    no hace falta re-derivarlas ni deserializar el wrapper de sklearn.
+    model_trainer la usa con el modelo recién entrenado para escribir prediccion_mensual.
+    Devuelve un array con las cantidades predichas (no negativas); vacío si no hay modelo.
+    Un error de inferencia (p. ej. faltan columnas) se propaga a quien llama.
     """
-    try:
-        # Generar un rango de fechas para todo el año
-        fecha_inicio = f'{anio_prediccion}-01-01'
-        fecha_fin = f'{anio_prediccion}-12-31'
-        
-        df_futuro = pd.DataFrame({
-            'v_fecha': pd.date_range(start=fecha_inicio, end=fecha_fin, freq='D')
-        })
-        
-        # El ID del producto DEBE estar codificado de la misma forma que se entrenó.
-        df_futuro['v_id_producto'] = 0 
-
-        # Extraer las mismas características temporales que en el entrenamiento
-        df_futuro['dia_del_mes'] = df_futuro['v_fecha'].dt.day
-        df_futuro['dia_de_la_semana'] = df_futuro['v_fecha'].dt.dayofweek
-        df_futuro['mes'] = df_futuro['v_fecha'].dt.month
-        df_futuro['anio'] = df_futuro['v_fecha'].dt.year
-
-        # Seleccionar solo las columnas de características para la predicción
-        X_futuro = df_futuro[[
-            'v_id_producto', 
-            'dia_del_mes', 
-            'dia_de_la_semana', 
-            'mes', 
-            'anio'
-        ]]
-        
-        return X_futuro, df_futuro[['v_fecha']]
-
-    except Exception as e:
-        print(f"Error al crear el DataFrame futuro: {e}")
-        return pd.DataFrame(), pd.DataFrame()
-
+    if modelo is None or manifiesto is None:
+        modelo, manifiesto = cargar_modelo()
+    if modelo is None or df_features.empty:
+        return np.array([])
+    
+    predicciones = modelo.inplace_predict(df_features[manifiesto["features"]])
+    if manifiesto.get("objetivo") == "log1p":
+        predicciones = np.expm1(predicciones)
+    return np.maximum(0, predicciones)
 
-def predecir_ventas_anuales(modelo, producto_id, anio_prediccion):
+def predecir_productos(ids, meses=12):
     """
-    Genera las predicciones de ventas diarias para el producto y año dados.
+    Predicción mensual de un lote de productos (p. ej. cientos de SKUs de la pantalla de reportes).
+    Lee la historia mensual de esos productos de prediccion_dataset en una sola consulta, arma las
+    features con las mismas funciones que el entrenamiento y predice los 'meses' siguientes al último
+    mes con datos con el modelo guardado (formato nativo + manifiesto).
+    Cada mes se predice para todos los productos en una sola llamada: los lags de un mes dependen
+    de la predicción del anterior, así que hay una llamada por mes y no una por producto.
+    Devuelve un DataFrame con v_id_producto, categoria, fecha_mes y cantidad_predicha
+    (vacío si no hay modelo entrenado o ninguno de los productos tiene historia).
     """
-    if modelo is None:
-        return pd.DataFrame()
-        
-    X_futuro, df_fechas = crear_df_futuro(producto_id, anio_prediccion)
-    
-    if X_futuro.empty:
-        return pd.DataFrame()
+    # Import diferido: model_trainer importa este módulo
+    from model_trainer import garantizar_continuidad_mensual, generar_features_mensuales, predecir_futuro_recursivo
+
+    columnas = ["v_id_producto", "categoria", "fecha_mes", "cantidad_predicha"]
+    ids = [int(i) for i in ids]
+    modelo, manifiesto = cargar_modelo()
+    if modelo is None or not ids:
+        return pd.DataFrame(columns=columnas)
+
+    with conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(SQL_HISTORIA_PRODUCTOS, {"ids": ids})
+        df_historia = pd.DataFrame(cur.fetchall(), columns=["fecha_mes", "v_id_producto", "categoria", "cantidad_vendida", "v_precio"])
+    if df_historia.empty:
+        return pd.DataFrame(columns=columnas)
 
-    try:
-        # Generar las predicciones
-        predicciones = modelo.predict(X_futuro)
-        
-        # Asegurar que las predicciones no sean negativas y redondear
-        predicciones = np.maximum(0, predicciones).round().astype(int)
-        
-        # Combinar las fechas con las predicciones
-        df_resultado = df_fechas.copy()
-        df_resultado['cantidad_predicha'] = predicciones
-        
-        # Agrupar por mes para un reporte más conciso (opcional)
-        df_resultado['mes'] = df_resultado['v_fecha'].dt.to_period('M')
-        df_reporte = df_resultado.groupby('mes').agg(
-            ventas_predichas=('cantidad_predicha', 'sum')
-        ).reset_index()
-        
-        return df_resultado # Devolvemos el DataFrame diario para el gráfico
+    df_historia["fecha_mes"] = pd.to_datetime(df_historia["fecha_mes"])
+    df_historia[["cantidad_vendida", "v_precio"]] = df_historia[["cantidad_vendida", "v_precio"]].astype(float)
+    df_features = generar_features_mensuales(garantizar_continuidad_mensual(df_historia))
 
-    except Exception as e:
-        print(f"Error durante la predicción: {e}")
-        return pd.DataFrame()
\ No newline at end of file
+    df_futuro = predecir_futuro_recursivo(modelo, df_features, manifiesto["features"], meses_a_predecir=meses)
+    return df_futuro[columnas]
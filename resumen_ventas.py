@@ -0,0 +1,78 @@
+# Archivo: resumen_ventas.py
+# Resumen mensual de ventas por categoría y producto (desarrollo.ventas_mensuales)
+# para las pantallas predictivas: una búsqueda por índice en lugar de recorrer toda la tabla ventas.
+
+from psycopg2 import errors
+
+from bd import conexion
+
+SCHEMA = "desarrollo"
+TABLA_RESUMEN = "ventas_mensuales"
+
+# La tabla (con su clave primaria) y los índices que usa se crean en migraciones.py (versiones 007-009)
+
+# Meses anteriores al último guardado que se vuelven a calcular en cada refresco:
+# cubre ventas cargadas con fecha atrasada. Para más atrás, completo=True.
+MESES_RELECTURA = 2
+
+# Llave del pg_advisory_xact_lock: dos terminales que abren las pantallas predictivas a la vez
+# refrescan una después de la otra, nunca intercaladas.
+LLAVE_RESUMEN = 8150015
+
+
+def _refrescar(conn, completo):
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(%s)", (LLAVE_RESUMEN,))
+
+        # High-water mark: se recalcula desde MESES_RELECTURA meses antes del último guardado
+        desde = None
+        if not completo:
+            cur.execute(f"SELECT (MAX(mes) - make_interval(months => %s))::date FROM {SCHEMA}.{TABLA_RESUMEN}",
+                        (MESES_RELECTURA,))
+            desde = cur.fetchone()[0]
+
+        if desde is None:
+            cur.execute(f"TRUNCATE {SCHEMA}.{TABLA_RESUMEN}")
+            filtro, params = "", ()
+        else:
+            cur.execute(f"DELETE FROM {SCHEMA}.{TABLA_RESUMEN} WHERE mes >= %s", (desde,))
+            filtro, params = "WHERE v.v_fecha >= %s", (desde,)
+
+        # Con el lock no puede haber conflictos; la clave primaria igual impide contar dos veces un mes
+        cur.execute(f"""
+            INSERT INTO {SCHEMA}.{TABLA_RESUMEN} (categoria, mes, v_id_producto, cantidad)
+            SELECT TRIM(UPPER(s.categoria)), DATE_TRUNC('month', v.v_fecha)::date, v.v_id_producto, SUM(v.v_cantidad)
+            FROM {SCHEMA}.ventas v
+            JOIN {SCHEMA}.stock s ON v.v_id_producto = s.id_articulo
+            {filtro}
+            GROUP BY 1, 2, 3
+            ON CONFLICT (categoria, mes, v_id_producto) DO UPDATE SET cantidad = EXCLUDED.cantidad
+        """, params)
+        filas = cur.rowcount
+    conn.commit()
+    return desde, filas
+
+
+def refrescar_resumen_ventas(conn=None, completo=False):
+    """
+    Actualiza desarrollo.ventas_mensuales.
+    Incremental por mes: borra y recalcula el último mes guardado y los MESES_RELECTURA
+    anteriores (ventas cargadas con fecha atrasada). completo=True la reconstruye entera
+    (p. ej. si se recategorizaron productos). Devuelve True si terminó bien.
+    """
+    try:
+        if conn is not None:
+            desde, filas = _refrescar(conn, completo)
+        else:
+            with conexion() as conn_pool:
+                desde, filas = _refrescar(conn_pool, completo)
+        alcance = f"desde {desde}" if desde is not None else "completo"
+        print(f"🗓️ Resumen mensual de ventas actualizado ({alcance}): {filas} filas")
+        return True
+    except Exception as e:
+        if conn is not None:
+            conn.rollback()
+        print(f"❌ Error actualizando el resumen mensual de ventas: {e}")
+        if isinstance(e, errors.UndefinedTable):
+            print("👉 Falta crear la tabla del resumen: ejecute python migraciones.py")
+        return False
@@ -1,16 +1,111 @@
+import select
 import threading
 import time
 from datetime import datetime
-from bd import conectar_db
+
+import psycopg2
+from psycopg2 import errors, extensions
+
+from bd import conexion, DB_CONFIG
+from migraciones import triggers_instalados
+
+# Canal de LISTEN/NOTIFY por el que el trigger de desarrollo.stock avisa qué artículo cambió.
+# El trigger (trg_stock_notificar) lo crea la migración 010 de migraciones.py.
+CANAL_STOCK = "stock_cambios"
+TRIGGER_STOCK = "trg_stock_notificar"
+
+SQL_ALERTAS_RESUELTAS = """
+    UPDATE desarrollo.alertas_stock a
+    SET estado = 'RESUELTA', fecha_resolucion = NOW()
+    FROM desarrollo.stock s
+    WHERE a.id_producto = s.id_articulo
+      AND a.estado = 'ACTIVA'
+      AND s.cant_inventario > COALESCE(s.stock_minimo, 5)
+      AND (%(ids)s::int[] IS NULL OR s.id_articulo = ANY(%(ids)s::int[]))
+"""
+
+# Reconciliación de alertas basada en conjuntos. Mismas reglas que _calcular_nivel:
+# AGOTADO si stock = 0, CRITICO si stock <= mínimo, BAJO hasta 1.25 x mínimo.
+SQL_PROBLEMAS_ALERTAS = """
+    WITH problemas AS (
+        SELECT id_articulo, descripcion,
+               cant_inventario AS stock,
+               COALESCE(stock_minimo, 5) AS minimo,
+               CASE
+                   WHEN cant_inventario = 0 THEN 'AGOTADO'
+                   WHEN cant_inventario <= COALESCE(stock_minimo, 5) THEN 'CRITICO'
+                   ELSE 'BAJO'
+               END AS nivel
+        FROM desarrollo.stock
+        WHERE cant_inventario <= COALESCE(stock_minimo, 5) * 1.25
+          AND (%(ids)s::int[] IS NULL OR id_articulo = ANY(%(ids)s::int[]))
+    ),
+"""
+
+# Un solo INSERT ... ON CONFLICT sobre el índice único de alertas ACTIVAS (migración 013):
+# varias terminales despiertan con el mismo NOTIFY y reconcilian a la vez sin duplicar alertas.
+# Solo se actualizan las que cambiaron; (xmax = 0) distingue las insertadas de las actualizadas.
+SQL_NUEVAS_ALERTAS = SQL_PROBLEMAS_ALERTAS + """
+    cambios AS (
+        INSERT INTO desarrollo.alertas_stock AS a
+            (id_producto, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta)
+        SELECT p.id_articulo, p.descripcion, p.stock, p.minimo, p.nivel, 'ACTIVA', NOW()
+        FROM problemas p
+        ON CONFLICT (id_producto) WHERE estado = 'ACTIVA' DO UPDATE
+        SET nivel_alerta = EXCLUDED.nivel_alerta, stock_actual = EXCLUDED.stock_actual,
+            fecha_alerta = NOW(), stock_minimo = EXCLUDED.stock_minimo
+        WHERE a.nivel_alerta IS DISTINCT FROM EXCLUDED.nivel_alerta
+           OR a.stock_actual IS DISTINCT FROM EXCLUDED.stock_actual
+           OR a.stock_minimo IS DISTINCT FROM EXCLUDED.stock_minimo
+        RETURNING (a.xmax = 0) AS insertada
+    )
+    SELECT COUNT(*) FILTER (WHERE NOT insertada), COUNT(*) FILTER (WHERE insertada) FROM cambios
+"""
+
+# Sin el índice único (migración 013 pendiente): UPDATE + INSERT ... WHERE NOT EXISTS,
+# serializado entre terminales con un advisory lock de transacción
+LLAVE_ALERTAS = 8150018
+
+SQL_NUEVAS_ALERTAS_SIN_INDICE = SQL_PROBLEMAS_ALERTAS + """
+    actualizadas AS (
+        UPDATE desarrollo.alertas_stock a
+        SET nivel_alerta = p.nivel, stock_actual = p.stock, fecha_alerta = NOW(), stock_minimo = p.minimo
+        FROM problemas p
+        WHERE a.id_producto = p.id_articulo
+          AND a.estado = 'ACTIVA'
+          AND (a.nivel_alerta IS DISTINCT FROM p.nivel
+               OR a.stock_actual IS DISTINCT FROM p.stock
+               OR a.stock_minimo IS DISTINCT FROM p.minimo)
+        RETURNING 1
+    ),
+    insertadas AS (
+        INSERT INTO desarrollo.alertas_stock
+            (id_producto, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta)
+        SELECT p.id_articulo, p.descripcion, p.stock, p.minimo, p.nivel, 'ACTIVA', NOW()
+        FROM problemas p
+        WHERE NOT EXISTS (
+            SELECT 1 FROM desarrollo.alertas_stock a
+            WHERE a.id_producto = p.id_articulo AND a.estado = 'ACTIVA'
+        )
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM actualizadas), (SELECT COUNT(*) FROM insertadas)
+"""
 
 class ServicioAlertas:
     def __init__(self):
         self.activo = False
         self.hilo = None
         self.callback_actualizacion = None
+        self._aviso_sin_indice = False
     
-    def iniciar_servicio(self, callback=None, intervalo=30):
-        """Inicia el servicio de alertas en segundo plano"""
+    def iniciar_servicio(self, callback=None, intervalo=30, modo="eventos"):
+        """
+        Inicia el servicio de alertas en segundo plano.
+        modo="eventos": escucha los NOTIFY del trigger de stock y re-evalúa solo los artículos
+        que cambiaron (sin consultas mientras no haya cambios). Si el trigger no se puede
+        instalar, se usa el modo "polling" (revisión completa cada 'intervalo' segundos).
+        """
         if self.activo: return # Evitar doble inicio
         
         self.activo = True
@@ -20,25 +115,28 @@ class ServicioAlertas:
             print(f"✅ Servicio de alertas iniciado (Intervalo: {intervalo}s)")
             while self.activo:
                 try:
-                    # 1. Resolver alertas viejas (Productos que ya tienen stock)
-                    n_resueltas = self.verificar_alertas_resueltas()
-                    
-                    # 2. Crear/Actualizar alertas nuevas
-                    n_nuevas = self.verificar_nuevas_alertas()
-                    
-                    # 3. Feedback en consola (solo si hubo cambios para no ensuciar el log)
-                    if n_resueltas > 0 or n_nuevas > 0:
-                        print(f"⚡ [Monitor Stock] Cambios detectados: {n_nuevas} actualizaciones, {n_resueltas} resoluciones.")
-                        if self.callback_actualizacion:
-                            self.callback_actualizacion(n_nuevas)
-                    
+                    self._revisar(None)
                     time.sleep(intervalo)
                     
                 except Exception as e:
                     print(f"❌ Error crítico en servicio de alertas: {e}")
                     time.sleep(60) # Esperar un minuto si hay error grave antes de reintentar
         
-        self.hilo = threading.Thread(target=verificar_periodicamente, daemon=True)
+        def escuchar_eventos():
+            if not triggers_instalados([TRIGGER_STOCK]):
+                print("⚠️ Falta el trigger de stock (ejecute python migraciones.py), se usa revisión periódica.")
+                verificar_periodicamente()
+                return
+            print("✅ Servicio de alertas iniciado (LISTEN/NOTIFY)")
+            while self.activo:
+                try:
+                    self._escuchar()
+                except Exception as e:
+                    print(f"❌ Conexión de alertas perdida ({e}). Reintentando en 5s...")
+                    time.sleep(5)
+        
+        objetivo = escuchar_eventos if modo == "eventos" else verificar_periodicamente
+        self.hilo = threading.Thread(target=objetivo, daemon=True)
         self.hilo.start()
     
     def detener_servicio(self):
@@ -46,116 +144,109 @@ class ServicioAlertas:
         if self.hilo: self.hilo.join(timeout=1)
         print("⏹️ Servicio detenido.")
 
-    def verificar_alertas_resueltas(self):
-        """Marca como RESUELTA las alertas donde el stock ya supera el mínimo"""
-        conn = None
+    def _revisar(self, ids):
+        """Un ciclo de revisión (ids=None: todo el stock; si no, solo esos artículos)"""
+        # 1. Resolver alertas viejas (Productos que ya tienen stock)
+        n_resueltas = self.verificar_alertas_resueltas(ids)
+        
+        # 2. Crear/Actualizar alertas nuevas
+        n_nuevas = self.verificar_nuevas_alertas(ids)
+        
+        # 3. Feedback en consola (solo si hubo cambios para no ensuciar el log)
+        if n_resueltas > 0 or n_nuevas > 0:
+            print(f"⚡ [Monitor Stock] Cambios detectados: {n_nuevas} actualizaciones, {n_resueltas} resoluciones.")
+            if self.callback_actualizacion:
+                self.callback_actualizacion(n_nuevas)
+
+    def _escuchar(self, espera=1.0, agrupar=0.05):
+        """
+        Conexión dedicada (fuera del pool, en autocommit) con LISTEN.
+        Al conectar hace una revisión completa por si hubo cambios mientras no se escuchaba;
+        después solo despierta con NOTIFY. Los avisos que llegan juntos (p. ej. una venta con
+        varios artículos) se agrupan durante 'agrupar' segundos y se procesan en un solo ciclo.
+        """
+        conn = psycopg2.connect(**DB_CONFIG)
         try:
-            conn = conectar_db()
-            cursor = conn.cursor()
-            
-            # Query optimizada: Solo toca alertas ACTIVAS cuyo stock ya esté bien
-            cursor.execute("""
-                UPDATE desarrollo.alertas_stock a
-                SET estado = 'RESUELTA', fecha_resolucion = NOW()
-                FROM desarrollo.stock s
-                WHERE a.id_producto = s.id_articulo
-                  AND a.estado = 'ACTIVA'
-                  AND s.cant_inventario > COALESCE(s.stock_minimo, 5)
-            """)
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL_STOCK}")
+            self._revisar(None)
             
-            count = cursor.rowcount
-            conn.commit()
-            return count
+            while self.activo:
+                # 'espera' solo sirve para notar detener_servicio(); no consulta la base
+                if select.select([conn], [], [], espera) == ([], [], []):
+                    continue
+                conn.poll()
+                ids = set()
+                while True:
+                    while conn.notifies:
+                        ids.add(int(conn.notifies.pop(0).payload))
+                    if select.select([conn], [], [], agrupar) == ([], [], []):
+                        break
+                    conn.poll()
+                if ids:
+                    self._revisar(sorted(ids))
+        finally:
+            conn.close()
+
+    def verificar_alertas_resueltas(self, ids=None):
+        """
+        Marca como RESUELTA las alertas donde el stock ya supera el mínimo.
+        ids: limita la revisión a esos artículos (None = todos)
+        """
+        try:
+            with conexion() as conn:
+                cursor = conn.cursor()
+
+                # Query optimizada: Solo toca alertas ACTIVAS cuyo stock ya esté bien
+                cursor.execute(SQL_ALERTAS_RESUELTAS, {"ids": ids})
+
+                count = cursor.rowcount
+                conn.commit()
+                return count
         except Exception as e:
             print(f"Error resolviendo alertas: {e}")
             return 0
-        finally:
-            if conn: conn.close()
 
-    def verificar_nuevas_alertas(self):
-        """Analiza el stock y gestiona las alertas (CORREGIDO)"""
-        conn = None
-        cambios = 0
+    def verificar_nuevas_alertas(self, ids=None):
+        """
+        Analiza el stock y gestiona las alertas en UNA sentencia (sin bucle por producto):
+        actualiza las alertas activas cuyo nivel/stock/mínimo cambió e inserta las que faltan.
+        ids: limita la revisión a esos artículos (None = todos)
+        Devuelve la cantidad de alertas actualizadas + insertadas.
+        """
         try:
-            conn = conectar_db()
-            cursor = conn.cursor()
-
-            # 1. Obtener alertas activas (AHORA INCLUIMOS stock_minimo EN LA LECTURA)
-            cursor.execute("""
-                SELECT id_producto, id_alerta, nivel_alerta, stock_actual, stock_minimo 
-                FROM desarrollo.alertas_stock WHERE estado = 'ACTIVA'
-            """)
-            # Guardamos también el mínimo registrado en el diccionario
-            alertas_activas = {
-                row[0]: {'id': row[1], 'nivel': row[2], 'stock': row[3], 'minimo': row[4]} 
-                for row in cursor.fetchall()
-            }
-
-            # 2. Obtener productos con problemas
-            cursor.execute("""
-                SELECT id_articulo, descripcion, cant_inventario, COALESCE(stock_minimo, 5)
-                FROM desarrollo.stock
-                WHERE cant_inventario <= COALESCE(stock_minimo, 5) * 1.25
-            """)
-            productos_problematicos = cursor.fetchall()
-
-            # 3. Comparar
-            for prod in productos_problematicos:
-                pid, desc, stock, minimo = prod
-                
-                # Calcular nivel actual
-                nuevo_nivel = self._calcular_nivel(stock, minimo)
-
-                if pid in alertas_activas:
-                    # YA EXISTE ALERTA
-                    datos_alerta = alertas_activas[pid]
-                    
-                    # --- CORRECCIÓN AQUÍ ---
-                    # Ahora verificamos también si el MÍNIMO ha cambiado
-                    if (datos_alerta['nivel'] != nuevo_nivel or 
-                        datos_alerta['stock'] != stock or 
-                        datos_alerta['minimo'] != minimo): # <--- ESTO FALTABA
-                        
-                        cursor.execute("""
-                            UPDATE desarrollo.alertas_stock 
-                            SET nivel_alerta = %s, stock_actual = %s, fecha_alerta = NOW(), stock_minimo = %s
-                            WHERE id_alerta = %s
-                        """, (nuevo_nivel, stock, minimo, datos_alerta['id']))
-                        cambios += 1
-                        # print(f"🔄 Alerta actualizada: {desc}")
-                else:
-                    # NO EXISTE ALERTA
-                    cursor.execute("""
-                        INSERT INTO desarrollo.alertas_stock 
-                        (id_producto, descripcion_producto, stock_actual, stock_minimo, nivel_alerta, estado, fecha_alerta)
-                        VALUES (%s, %s, %s, %s, %s, 'ACTIVA', NOW())
-                    """, (pid, desc, stock, minimo, nuevo_nivel))
-                    cambios += 1
-
-            conn.commit()
-            return cambios
+            with conexion() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(SQL_NUEVAS_ALERTAS, {"ids": ids})
+                except errors.InvalidColumnReference:
+                    # ON CONFLICT sin índice único que lo respalde: falta la migración 013
+                    conn.rollback()
+                    if not self._aviso_sin_indice:
+                        print("⚠️ Falta el índice único de alertas activas (ejecute python migraciones.py).")
+                        self._aviso_sin_indice = True
+                    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (LLAVE_ALERTAS,))
+                    cursor.execute(SQL_NUEVAS_ALERTAS_SIN_INDICE, {"ids": ids})
+                actualizadas, insertadas = cursor.fetchone()
+                conn.commit()
+                return actualizadas + insertadas
 
         except Exception as e:
             print(f"Error verificando nuevas alertas: {e}")
             return 0
-        finally:
-            if conn: conn.close()
 
     def marcar_alerta_vista(self, id_alerta):
         """Versión compatible con restricción de estado"""
-        conn = None
         try:
-            conn = conectar_db()
-            cursor = conn.cursor()
-            # En lugar de cambiar estado='VISTA', usamos la columna booleana 'vista'
-            # (Asegúrate de que tu tabla tenga la columna 'vista')
-            cursor.execute("UPDATE desarrollo.alertas_stock SET vista = TRUE WHERE id_alerta = %s", (id_alerta,))
-            conn.commit()
-            return True
+            with conexion() as conn:
+                cursor = conn.cursor()
+                # En lugar de cambiar estado='VISTA', usamos la columna booleana 'vista'
+                # (Asegúrate de que tu tabla tenga la columna 'vista')
+                cursor.execute("UPDATE desarrollo.alertas_stock SET vista = TRUE WHERE id_alerta = %s", (id_alerta,))
+                conn.commit()
+                return True
         except Exception as e:
             print(e); return False
-        finally:
-            if conn: conn.close()
 
     def _calcular_nivel(self, stock, minimo):
         """Helper puro para determinar string de nivel"""
@@ -0,0 +1,130 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from bd import POOL_CONFIG
+
+# Hilos para las consultas de las pantallas. Menos que el máximo del pool de conexiones,
+# así siempre quedan conexiones libres para los servicios de fondo y los formularios.
+MAX_HILOS = max(2, POOL_CONFIG['maxconn'] - 4)
+
+
+class Tarea:
+    """Una consulta enviada al ejecutor. cancelar() descarta su resultado."""
+
+    def __init__(self, clave, widget, funcion, args, al_terminar, al_fallar):
+        self.clave = clave
+        self.widget = widget
+        self.funcion = funcion
+        self.args = args
+        self.al_terminar = al_terminar
+        self.al_fallar = al_fallar
+        self.cancelada = False
+        self.future = None
+
+    def cancelar(self):
+        # Si ya se está ejecutando no se puede interrumpir: solo se descarta el resultado
+        self.cancelada = True
+        if self.future is not None:
+            self.future.cancel()
+
+
+class EjecutorConsultas:
+    """
+    Ejecuta las consultas de las pantallas fuera del hilo de Tk, en un pool acotado de hilos,
+    y entrega el resultado en el hilo de Tk con widget.after().
+
+    - clave: agrupa pedidos equivalentes. Un pedido nuevo con la misma clave reemplaza al
+      anterior (que se cancela), salvo que sea idéntico y siga en curso: entonces se aprovecha.
+    - Al navegar a otra pantalla, cancelar_dentro_de(contenedor) descarta todo lo pedido por
+      widgets de ese contenedor; y nunca se entrega un resultado a un widget destruido.
+    """
+
+    def __init__(self, max_hilos=MAX_HILOS):
+        self.max_hilos = max_hilos
+        self._pool = None
+        self._lock = threading.Lock()
+        self._tareas = set()
+        self._por_clave = {}
+
+    def _obtener_pool(self):
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(max_workers=self.max_hilos, thread_name_prefix="consulta")
+        return self._pool
+
+    def enviar(self, widget, funcion, *args, al_terminar=None, al_fallar=None, clave=None):
+        """
+        Ejecuta funcion(*args) en segundo plano. al_terminar(resultado) o al_fallar(excepción)
+        se llaman en el hilo de Tk, solo si la tarea no se canceló y 'widget' sigue existiendo.
+        Sin al_fallar, el error se imprime.
+        """
+        with self._lock:
+            previa = self._por_clave.get(clave) if clave is not None else None
+            if (previa is not None and not previa.cancelada and not previa.future.done()
+                    and previa.funcion is funcion and previa.args == args):
+                # El mismo pedido ya está en curso: solo cambia a quién se le entrega
+                previa.widget, previa.al_terminar, previa.al_fallar = widget, al_terminar, al_fallar
+                return previa
+            if previa is not None:
+                previa.cancelar()
+
+            tarea = Tarea(clave, widget, funcion, args, al_terminar, al_fallar)
+            self._tareas.add(tarea)
+            if clave is not None:
+                self._por_clave[clave] = tarea
+            tarea.future = self._obtener_pool().submit(funcion, *args)
+        tarea.future.add_done_callback(lambda _: self._terminada(tarea))
+        return tarea
+
+    def cancelar(self, clave):
+        with self._lock:
+            tarea = self._por_clave.pop(clave, None)
+        if tarea is not None:
+            tarea.cancelar()
+
+    def cancelar_dentro_de(self, contenedor):
+        """Cancela las tareas pedidas por widgets hijos de 'contenedor' (p. ej. al cambiar de pantalla)."""
+        prefijo = str(contenedor) + "."
+        with self._lock:
+            tareas = [t for t in self._tareas if str(t.widget).startswith(prefijo)]
+            for tarea in tareas:
+                if self._por_clave.get(tarea.clave) is tarea:
+                    del self._por_clave[tarea.clave]
+        for tarea in tareas:
+            tarea.cancelar()
+
+    def _terminada(self, tarea):
+        # Hilo del pool (o el de Tk, si terminó antes de registrar el callback)
+        with self._lock:
+            self._tareas.discard(tarea)
+            if self._por_clave.get(tarea.clave) is tarea:
+                del self._por_clave[tarea.clave]
+        if tarea.cancelada or tarea.future.cancelled():
+            return
+
+        error = tarea.future.exception()
+        resultado = None if error is not None else tarea.future.result()
+        try:
+            tarea.widget.after(0, lambda: self._entregar(tarea, resultado, error))
+        except Exception:
+            pass  # la ventana ya se cerró
+
+    def _entregar(self, tarea, resultado, error):
+        # Hilo de Tk
+        if tarea.cancelada:
+            return
+        try:
+            if not tarea.widget.winfo_exists():
+                return
+        except Exception:
+            return
+        if error is not None:
+            if tarea.al_fallar:
+                tarea.al_fallar(error)
+            else:
+                print(f"❌ Error en consulta en segundo plano ({getattr(tarea.funcion, '__name__', tarea.funcion)}): {error}")
+        elif tarea.al_terminar:
+            tarea.al_terminar(resultado)
+
+
+# Instancia compartida por todas las pantallas
+ejecutor_consultas = EjecutorConsultas()
@@ -0,0 +1,253 @@
+import select
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+from bd import conexion, DB_CONFIG
+from migraciones import triggers_instalados
+
+# Índice en memoria para la pestaña de salidas: cada escaneo se resuelve con un dict,
+# sin ida y vuelta a la base. Los triggers avisan por este canal qué cambió:
+# "s<id_articulo>" para stock, "m<serial>" para movimientos.
+# Los triggers los crea la migración 011 de migraciones.py.
+CANAL_INDICE = "indice_salidas"
+TRIGGERS_INDICE = ["trg_stock_indice", "trg_movimientos_indice"]
+
+# Mismas columnas que espera cargar_datos_producto: (id, descripción, stock, precio, código de barras)
+SQL_PRODUCTOS = """
+    SELECT id_articulo, descripcion, cant_inventario, precio_unit, codigo_barras
+    FROM desarrollo.stock
+    WHERE %(ids)s::int[] IS NULL OR id_articulo = ANY(%(ids)s::int[])
+"""
+
+# Última SALIDA de cada serial
+SQL_SERIALES = """
+    SELECT DISTINCT ON (serial) serial::text, id_producto, fecha_entrega
+    FROM desarrollo.movimientos
+    WHERE tipo_movimiento = 'SALIDA' AND serial IS NOT NULL
+      AND (%(seriales)s::text[] IS NULL OR serial::text = ANY(%(seriales)s::text[]))
+    ORDER BY serial, fecha_entrega DESC
+"""
+
+FILAS_POR_BLOQUE = 50000
+
+
+class IndiceSalidas:
+    def __init__(self):
+        self.listo = False
+        self.activo = False
+        self.hilo = None
+        self._lock = threading.Lock()
+        self._productos = {}   # id_articulo -> fila de SQL_PRODUCTOS
+        self._por_codigo = {}  # codigo_barras -> id_articulo
+        self._seriales = {}    # serial -> (id_producto, fecha_entrega) de la última SALIDA
+
+    # --- Consultas (hilo de Tk) ---
+    # Mientras el índice no terminó de cargar, cada consulta va a la base como antes.
+
+    def producto(self, id_articulo):
+        """Fila del producto o None."""
+        if self.listo:
+            return self._productos.get(id_articulo)
+        filas = self._consultar(SQL_PRODUCTOS, {"ids": [id_articulo]})
+        return filas[0] if filas else None
+
+    def buscar_exacto(self, criterio):
+        """
+        Productos cuyo id, código de barras o serial vendido coincide exactamente con 'criterio'
+        (lo que produce un lector de códigos). Sin duplicados, en el orden id / código / serial.
+        """
+        if not self.listo:
+            return self._buscar_exacto_bd(criterio)
+        ids = []
+        if criterio.isdigit() and int(criterio) in self._productos:
+            ids.append(int(criterio))
+        id_codigo = self._por_codigo.get(criterio)
+        if id_codigo is not None:
+            ids.append(id_codigo)
+        venta = self._seriales.get(criterio)
+        if venta is not None:
+            ids.append(venta[0])
+        vistos = set()
+        return [self._productos[i] for i in ids if i in self._productos and not (i in vistos or vistos.add(i))]
+
+    def venta_de_serial(self, serial):
+        """(descripción del producto, fecha de entrega) si el serial ya salió, si no None."""
+        if self.listo:
+            venta = self._seriales.get(serial)
+            if venta is None:
+                return None
+            producto = self._productos.get(venta[0])
+            return (producto[1] if producto else "", venta[1])
+        filas = self._consultar("""
+            SELECT s.descripcion, m.fecha_entrega
+            FROM desarrollo.movimientos m
+            JOIN desarrollo.stock s ON m.id_producto = s.id_articulo
+            WHERE m.serial = %s AND m.tipo_movimiento = 'SALIDA'
+            ORDER BY m.fecha_entrega DESC LIMIT 1
+        """, (serial,))
+        return filas[0] if filas else None
+
+    def registrar_salida(self, id_producto, seriales, fecha):
+        """
+        Aplica en el índice una salida recién confirmada, sin esperar el aviso del trigger
+        (así el siguiente escaneo en esta misma terminal ya la ve).
+        """
+        with self._lock:
+            for serial in seriales:
+                self._seriales[serial] = (id_producto, fecha)
+            fila = self._productos.get(id_producto)
+            if fila is not None:
+                stock = fila[2] - len(seriales)
+                self._productos[id_producto] = (fila[0], fila[1], stock, fila[3], fila[4])
+
+    # --- Carga y actualización (hilo propio) ---
+
+    def iniciar(self, intervalo=60):
+        """Carga el índice en segundo plano y lo mantiene al día (LISTEN/NOTIFY o recarga periódica)."""
+        if self.activo: return
+        self.activo = True
+
+        def trabajar():
+            if not triggers_instalados(TRIGGERS_INDICE):
+                print(f"⚠️ Índice de salidas sin triggers (ejecute python migraciones.py): se recarga cada {intervalo}s.")
+                while self.activo:
+                    try:
+                        self._cargar_completo()
+                    except Exception as e:
+                        print(f"❌ Error cargando el índice de salidas: {e}")
+                    time.sleep(intervalo)
+                return
+            while self.activo:
+                try:
+                    self._escuchar()
+                except Exception as e:
+                    print(f"❌ Conexión del índice de salidas perdida ({e}). Reintentando en 5s...")
+                    time.sleep(5)
+
+        self.hilo = threading.Thread(target=trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.activo = False
+        if self.hilo: self.hilo.join(timeout=1)
+
+    def _cargar_completo(self):
+        inicio = time.perf_counter()
+        productos, por_codigo, seriales = {}, {}, {}
+        with conexion() as conn:
+            cur = conn.cursor()
+            cur.execute(SQL_PRODUCTOS, {"ids": None})
+            for fila in cur.fetchall():
+                productos[fila[0]] = fila
+                if fila[4]:
+                    por_codigo[fila[4]] = fila[0]
+            cur.close()
+
+            # Cursor del lado del servidor: los seriales pueden ser millones
+            cur = conn.cursor(name="cursor_indice_seriales")
+            cur.itersize = FILAS_POR_BLOQUE
+            cur.execute(SQL_SERIALES, {"seriales": None})
+            while True:
+                bloque = cur.fetchmany(FILAS_POR_BLOQUE)
+                if not bloque: break
+                for serial, id_producto, fecha in bloque:
+                    seriales[serial] = (id_producto, fecha)
+            cur.close()
+            conn.commit()
+
+        with self._lock:
+            self._productos, self._por_codigo, self._seriales = productos, por_codigo, seriales
+        self.listo = True
+        print(f"🔎 Índice de salidas cargado: {len(productos)} productos, {len(seriales)} seriales "
+              f"({time.perf_counter() - inicio:.2f}s)")
+
+    def _actualizar(self, ids, seriales):
+        """Relee solo los productos y seriales avisados por los triggers."""
+        with conexion() as conn:
+            cur = conn.cursor()
+            productos = {}
+            if ids:
+                cur.execute(SQL_PRODUCTOS, {"ids": sorted(ids)})
+                productos = {fila[0]: fila for fila in cur.fetchall()}
+            ventas = {}
+            if seriales:
+                cur.execute(SQL_SERIALES, {"seriales": sorted(seriales)})
+                ventas = {serial: (id_producto, fecha) for serial, id_producto, fecha in cur.fetchall()}
+            conn.commit()
+
+        with self._lock:
+            for id_articulo in ids:
+                anterior = self._productos.pop(id_articulo, None)
+                if anterior is not None and anterior[4] and self._por_codigo.get(anterior[4]) == id_articulo:
+                    del self._por_codigo[anterior[4]]
+                fila = productos.get(id_articulo)
+                if fila is not None:
+                    self._productos[id_articulo] = fila
+                    if fila[4]:
+                        self._por_codigo[fila[4]] = id_articulo
+            for serial in seriales:
+                if serial in ventas:
+                    self._seriales[serial] = ventas[serial]
+                else:
+                    self._seriales.pop(serial, None)
+
+    def _escuchar(self, espera=1.0, agrupar=0.05):
+        """
+        Igual que el servicio de alertas: conexión dedicada con LISTEN, carga completa al
+        conectar (por si algo cambió mientras no se escuchaba) y después solo los avisos.
+        """
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL_INDICE}")
+            self._cargar_completo()
+
+            while self.activo:
+                if select.select([conn], [], [], espera) == ([], [], []):
+                    continue
+                conn.poll()
+                ids, seriales = set(), set()
+                while True:
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0).payload
+                        if aviso[0] == "s":
+                            ids.add(int(aviso[1:]))
+                        else:
+                            seriales.add(aviso[1:])
+                    if select.select([conn], [], [], agrupar) == ([], [], []):
+                        break
+                    conn.poll()
+                if ids or seriales:
+                    self._actualizar(ids, seriales)
+        finally:
+            self.listo = False  # sin escucha el índice puede quedar viejo: volver a la base
+            conn.close()
+
+    def _buscar_exacto_bd(self, criterio):
+        return self._consultar("""
+            SELECT id_articulo, descripcion, cant_inventario, precio_unit, codigo_barras
+            FROM desarrollo.stock
+            WHERE id_articulo::text = %(c)s OR codigo_barras = %(c)s
+               OR id_articulo = (SELECT id_producto FROM desarrollo.movimientos
+                                 WHERE serial::text = %(c)s AND tipo_movimiento = 'SALIDA'
+                                 ORDER BY fecha_entrega DESC LIMIT 1)
+        """, {"c": criterio})
+
+    def _consultar(self, sql, params):
+        try:
+            with conexion() as conn:
+                cur = conn.cursor()
+                cur.execute(sql, params)
+                filas = cur.fetchall()
+                cur.close()
+            return filas
+        except Exception as e:
+            print(f"❌ Error consultando el índice de salidas: {e}")
+            return []
+
+
+# Instancia global
+indice_salidas = IndiceSalidas()
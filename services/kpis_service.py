@@ -0,0 +1,228 @@
+import select
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import psycopg2
+from psycopg2 import errors, extensions
+
+from bd import conexion, DB_CONFIG
+from migraciones import triggers_instalados
+
+# Tarjetas del inicio. Los triggers de stock y ventas mandan por este canal lo que cambió
+# cada sentencia, ya sumado, para ajustar la foto en memoria sin volver a consultar:
+#   "s:<txid>:<n>:<total>:<valor>:<bajo>"   diferencia en stock (artículos, valor, stock bajo)
+#   "v:<txid>:<n>:<AAAA-MM>=<monto>;..."    diferencia de ventas por mes
+#   "x:<txid>:<n>"                          recalcular todo (TRUNCATE, predicción nueva, etc.)
+# <n> sale de una secuencia: NOTIFY descarta los avisos repetidos dentro de una transacción
+# y dos sentencias iguales mandarían el mismo texto.
+# La secuencia, las funciones y los triggers los crea la migración 012 de migraciones.py.
+CANAL_KPIS = "kpis_inicio"
+TRIGGERS_KPIS = [f"trg_{tabla}_kpis_{op}" for tabla in ("stock", "ventas") for op in ("ins", "upd", "del", "trunc")]
+
+# Mismo año fijo que usaban las consultas del dashboard para predicción y ventas del mes
+ANIO_KPIS = 2024
+UMBRAL_STOCK_BAJO = 10
+
+SQL_PREDICCION_MES = """(SELECT COALESCE(SUM(cantidad_predicha), 0)::numeric FROM desarrollo.prediccion_mensual
+         WHERE mes = %(mes)s AND anio = %(anio)s)"""
+
+SQL_KPIS = """
+    SELECT
+        (SELECT COUNT(*) FROM desarrollo.stock),
+        (SELECT COALESCE(SUM(cant_inventario * precio_unit), 0)::numeric FROM desarrollo.stock),
+        (SELECT COUNT(*) FROM desarrollo.stock WHERE cant_inventario <= %(umbral)s),
+        {prediccion},
+        (SELECT COALESCE(SUM(v_montous_total), 0)::numeric FROM desarrollo.ventas
+         WHERE v_fecha >= make_date(%(anio)s, %(mes)s, 1)
+           AND v_fecha < make_date(%(anio)s, %(mes)s, 1) + INTERVAL '1 month'),
+        txid_current_snapshot()::text
+"""
+
+
+def avisar_recalculo(conn):
+    """Pide a los dashboards abiertos que recalculen sus KPIs (p. ej. después de guardar una predicción nueva)."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_notify(%s, 'x')", (CANAL_KPIS,))
+        conn.commit()
+    except Exception as e:
+        print(f"⚠️ No se pudo avisar el recálculo de KPIs: {e}")
+
+
+def _visible(txid, snapshot):
+    """True si la transacción txid ya estaba confirmada en snapshot (texto 'xmin:xmax:xip,...')."""
+    xmin, xmax, xip = snapshot.split(":")
+    if txid < int(xmin):
+        return True
+    if txid >= int(xmax):
+        return False
+    return str(txid) not in xip.split(",")
+
+
+class ServicioKpis:
+    """
+    Foto en memoria de los KPIs del inicio.
+
+    - Se calcula con una sola sentencia (SQL_KPIS) y vence a los 'ttl' segundos.
+    - Con los triggers creados (migración 012), un hilo escucha CANAL_KPIS y suma a la foto la diferencia
+      que trae cada aviso: abrir el inicio no hace ninguna consulta si nada cambió.
+      Cada aviso trae su txid; los que la foto ya incluía (visibles en su snapshot) se ignoran.
+    - Sin escucha (faltan los triggers, conexión caída) la foto dura 'ttl_sin_avisos'.
+    """
+
+    def __init__(self, ttl=600, ttl_sin_avisos=30):
+        self.ttl = ttl
+        self.ttl_sin_avisos = ttl_sin_avisos
+        self.escuchando = False
+        self.activo = False
+        self.hilo = None
+        self._lock = threading.Lock()
+        self._lock_calculo = threading.Lock()
+        self._foto = None        # dict de KPIs
+        self._snapshot = None    # txid_current_snapshot() con el que se calculó la foto
+        self._momento = 0
+        self._recibidos = None   # avisos que llegan mientras se recalcula (ver _recalcular)
+        self._generacion = 0     # sube con cada invalidar(): un cálculo anterior ya no sirve
+
+    # --- Consultas ---
+
+    def vigente(self):
+        """La foto si sigue al día (sin consultar), si no None."""
+        with self._lock:
+            if self._foto is None or self._foto["mes"] != datetime.now().month:
+                return None
+            ttl = self.ttl if self.escuchando else self.ttl_sin_avisos
+            if time.monotonic() - self._momento >= ttl:
+                return None
+            return dict(self._foto)
+
+    def obtener(self):
+        """La foto vigente o, si venció, una recién calculada. None si la base falla."""
+        foto = self.vigente()
+        if foto is not None:
+            return foto
+        try:
+            return self._recalcular()
+        except Exception as e:
+            print(f"❌ Error calculando KPIs del inicio: {e}")
+            return None
+
+    def invalidar(self):
+        with self._lock:
+            self._foto = None
+            self._generacion += 1
+
+    # --- Cálculo ---
+
+    def _recalcular(self):
+        with self._lock_calculo:
+            with self._lock:
+                self._recibidos = []
+                generacion = self._generacion
+            try:
+                mes = datetime.now().month
+                with conexion() as conn:
+                    cur = conn.cursor()
+                    params = {"mes": mes, "anio": ANIO_KPIS, "umbral": UMBRAL_STOCK_BAJO}
+                    try:
+                        cur.execute(SQL_KPIS.format(prediccion=SQL_PREDICCION_MES), params)
+                    except errors.UndefinedTable:
+                        # Todavía no se entrenó ningún modelo: predicción en 0, como antes
+                        conn.rollback()
+                        cur.execute(SQL_KPIS.format(prediccion="0::numeric"), params)
+                    total, valor, bajo, prediccion, ventas, snapshot = cur.fetchone()
+                    cur.close()
+                    conn.commit()
+                foto = {
+                    "mes": mes, "total_productos": total, "valor_inventario": valor,
+                    "total_alertas": bajo, "venta_predicha": prediccion, "ventas_reales_mes": ventas,
+                }
+                with self._lock:
+                    # Lo que llegó durante la consulta y la foto no alcanzó a ver se aplica ahora
+                    for aviso in self._recibidos:
+                        if not _visible(aviso[1], snapshot):
+                            self._aplicar(foto, aviso)
+                    if generacion == self._generacion:
+                        self._foto, self._snapshot, self._momento = foto, snapshot, time.monotonic()
+                    return dict(foto)
+            finally:
+                with self._lock:
+                    self._recibidos = None
+
+    def _aplicar(self, foto, aviso):
+        # Llamar con self._lock tomado
+        tipo, _, datos = aviso
+        if tipo == "s":
+            foto["total_productos"] += int(datos[0])
+            foto["valor_inventario"] += Decimal(datos[1])
+            foto["total_alertas"] += int(datos[2])
+        elif tipo == "v":
+            clave = f"{ANIO_KPIS}-{foto['mes']:02d}"
+            for parte in datos[0].split(";"):
+                mes, monto = parte.split("=")
+                if mes == clave:
+                    foto["ventas_reales_mes"] += Decimal(monto)
+
+    def _procesar(self, payload):
+        partes = payload.split(":")
+        tipo = partes[0]
+        if tipo == "x" or len(partes) < 3 or (tipo == "v" and partes[3] == "*"):
+            self.invalidar()
+            return
+        aviso = (tipo, int(partes[1]), partes[3:])
+        with self._lock:
+            if self._recibidos is not None:
+                self._recibidos.append(aviso)
+            if self._foto is not None and not _visible(aviso[1], self._snapshot):
+                self._aplicar(self._foto, aviso)
+
+    # --- Escucha (hilo propio) ---
+
+    def iniciar(self):
+        """Si existen los triggers, escucha los avisos en segundo plano."""
+        if self.activo: return
+        self.activo = True
+
+        def trabajar():
+            if not triggers_instalados(TRIGGERS_KPIS):
+                print(f"⚠️ KPIs del inicio sin triggers (ejecute python migraciones.py): se recalculan cada {self.ttl_sin_avisos}s al abrir el inicio.")
+                return
+            while self.activo:
+                try:
+                    self._escuchar()
+                except Exception as e:
+                    print(f"❌ Conexión de KPIs perdida ({e}). Reintentando en 5s...")
+                    time.sleep(5)
+
+        self.hilo = threading.Thread(target=trabajar, daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.activo = False
+        if self.hilo: self.hilo.join(timeout=1)
+
+    def _escuchar(self, espera=1.0):
+        """Conexión dedicada con LISTEN, igual que el índice de salidas."""
+        conn = psycopg2.connect(**DB_CONFIG)
+        try:
+            conn.set_isolation_level(extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+            conn.cursor().execute(f"LISTEN {CANAL_KPIS}")
+            # Lo que cambió mientras no se escuchaba no llegó como aviso: foto nueva
+            self.invalidar()
+            self.escuchando = True
+
+            while self.activo:
+                if select.select([conn], [], [], espera) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    self._procesar(conn.notifies.pop(0).payload)
+        finally:
+            self.escuchando = False
+            conn.close()
+
+
+# Instancia global
+servicio_kpis = ServicioKpis()
@@ -0,0 +1,214 @@
+import threading
+import time
+from collections import OrderedDict
+
+import psycopg2
+from psycopg2 import errors
+
+from bd import DB_CONFIG
+
+_CANCELADA = object()
+
+SQL_SUGERENCIAS_PRODUCTOS = """
+    SELECT id_articulo, descripcion, codigo_barras
+    FROM desarrollo.stock
+    WHERE descripcion ILIKE %(contiene)s OR id_articulo::text ILIKE %(prefijo)s OR codigo_barras ILIKE %(prefijo)s
+    LIMIT %(limite)s
+"""
+
+SQL_SUGERENCIAS_CLIENTES = """
+    SELECT nombre, id_cliente
+    FROM desarrollo.clientes
+    WHERE nombre ILIKE %(contiene)s OR id_cliente::text ILIKE %(prefijo)s
+    LIMIT %(limite)s
+"""
+
+
+def _coincide_producto(fila, texto):
+    """Mismo criterio que SQL_SUGERENCIAS_PRODUCTOS, aplicado en memoria."""
+    id_articulo, descripcion, codigo_barras = fila
+    return (texto in (descripcion or "").lower()
+            or str(id_articulo).startswith(texto)
+            or (codigo_barras or "").lower().startswith(texto))
+
+
+def _coincide_cliente(fila, texto):
+    """Mismo criterio que SQL_SUGERENCIAS_CLIENTES, aplicado en memoria."""
+    nombre, id_cliente = fila
+    return texto in (nombre or "").lower() or str(id_cliente).startswith(texto)
+
+
+class BuscadorSugerencias:
+    """
+    Autocompletado contra la base de datos para un campo de texto.
+
+    - Debounce: cada tecla reprograma la búsqueda; solo se consulta cuando el usuario
+      (o el lector de código de barras) deja de escribir durante 'espera_ms'.
+    - Cancelación: una sola consulta en curso por buscador, en un hilo propio con su
+      conexión dedicada. Si llega un texto nuevo se cancela la consulta anterior en el
+      servidor (conn.cancel()) y su resultado se descarta.
+    - Caché LRU por texto con vencimiento ('ttl' segundos). Si un prefijo del texto ya
+      trajo menos de 'limite' filas, ese resultado está completo y el texto más largo
+      se resuelve filtrándolo en memoria, sin consultar.
+    """
+
+    def __init__(self, sql, coincide, limite=8, espera_ms=150, capacidad=256, ttl=30):
+        self.sql = sql
+        self.coincide = coincide
+        self.limite = limite
+        self.espera_ms = espera_ms
+        self.capacidad = capacidad
+        self.ttl = ttl
+
+        self._cache = OrderedDict()   # texto -> (momento, filas)
+        self._lock = threading.Lock()
+        self._hay_trabajo = threading.Event()
+        self._pendiente = None        # (solicitud, texto, widget, callback) a consultar
+        self._solicitud = 0           # la última pedida; cualquier otra es vieja
+        self._en_curso = None         # solicitud que se está ejecutando en el servidor
+        self._conn = None
+        self._hilo = None
+        self._after_id = None
+        self._widget_after = None
+
+    # --- API usada desde el hilo de Tk ---
+
+    def buscar(self, widget, texto, callback):
+        """
+        Programa la búsqueda de 'texto'. callback(filas) se llama en el hilo de Tk,
+        solo si para entonces sigue siendo la última búsqueda pedida.
+        """
+        self.cancelar()
+        self._widget_after = widget
+        self._after_id = widget.after(self.espera_ms, lambda: self._lanzar(widget, texto, callback))
+
+    def cancelar(self):
+        """Descarta la búsqueda programada y la que esté en curso."""
+        if self._after_id is not None:
+            try:
+                self._widget_after.after_cancel(self._after_id)
+            except Exception:
+                pass
+            self._after_id = None
+        with self._lock:
+            self._solicitud += 1
+            self._pendiente = None
+            self._cancelar_en_servidor()
+
+    def invalidar(self):
+        """Vacía la caché (p. ej. después de editar productos o clientes)."""
+        with self._lock:
+            self._cache.clear()
+
+    # --- Internos ---
+
+    def _lanzar(self, widget, texto, callback):
+        self._after_id = None
+        texto = texto.strip().lower()
+
+        filas = self._desde_cache(texto)
+        if filas is not None:
+            callback(filas)
+            return
+
+        with self._lock:
+            self._solicitud += 1
+            self._pendiente = (self._solicitud, texto, widget, callback)
+            self._cancelar_en_servidor()
+        self._asegurar_hilo()
+        self._hay_trabajo.set()
+
+    def _desde_cache(self, texto):
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._cache.get(texto)
+            if entrada and ahora - entrada[0] < self.ttl:
+                self._cache.move_to_end(texto)
+                return entrada[1]
+
+            # Prefijo más largo con resultado completo (trajo menos filas que el límite)
+            for largo in range(len(texto) - 1, 0, -1):
+                entrada = self._cache.get(texto[:largo])
+                if entrada and ahora - entrada[0] < self.ttl and len(entrada[1]) < self.limite:
+                    filas = [f for f in entrada[1] if self.coincide(f, texto)]
+                    self._guardar_cache(texto, filas, entrada[0])
+                    return filas
+        return None
+
+    def _guardar_cache(self, texto, filas, momento=None):
+        # Llamar con self._lock tomado
+        self._cache[texto] = (momento if momento is not None else time.monotonic(), filas)
+        self._cache.move_to_end(texto)
+        while len(self._cache) > self.capacidad:
+            self._cache.popitem(last=False)
+
+    def _cancelar_en_servidor(self):
+        # Llamar con self._lock tomado. La conexión es exclusiva de este buscador,
+        # así que cancel() solo puede afectar a una consulta nuestra.
+        if self._en_curso is not None and self._conn is not None:
+            try:
+                self._conn.cancel()
+            except Exception:
+                pass
+
+    def _asegurar_hilo(self):
+        if self._hilo is None or not self._hilo.is_alive():
+            self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+            self._hilo.start()
+
+    def _trabajar(self):
+        while True:
+            self._hay_trabajo.wait()
+            with self._lock:
+                self._hay_trabajo.clear()
+                pendiente, self._pendiente = self._pendiente, None
+                if pendiente is None:
+                    continue
+                self._en_curso = pendiente[0]
+
+            solicitud, texto, widget, callback = pendiente
+            filas = self._consultar(texto)
+
+            with self._lock:
+                self._en_curso = None
+                vigente = solicitud == self._solicitud
+                if filas is _CANCELADA:
+                    # Un cancel() tardío puede alcanzar a la consulta vigente: se reintenta
+                    if vigente and self._pendiente is None:
+                        self._pendiente = pendiente
+                        self._hay_trabajo.set()
+                    continue
+                if vigente and filas is not None:
+                    self._guardar_cache(texto, filas)
+            if vigente and filas is not None:
+                try:
+                    widget.after(0, lambda: self._entregar(solicitud, callback, filas))
+                except Exception:
+                    pass  # la pantalla ya se cerró
+
+    def _entregar(self, solicitud, callback, filas):
+        if solicitud == self._solicitud:
+            callback(filas)
+
+    def _consultar(self, texto):
+        """Ejecuta la consulta; _CANCELADA si se canceló, None si falló."""
+        try:
+            if self._conn is None or self._conn.closed:
+                self._conn = psycopg2.connect(**DB_CONFIG)
+                self._conn.autocommit = True
+            with self._conn.cursor() as cur:
+                cur.execute(self.sql, {"contiene": f"%{texto}%", "prefijo": f"{texto}%", "limite": self.limite})
+                return cur.fetchall()
+        except errors.QueryCanceled:
+            return _CANCELADA
+        except Exception as e:
+            print(f"❌ Error buscando sugerencias: {e}")
+            if self._conn is not None and not self._conn.closed:
+                self._conn.close()
+            self._conn = None
+            return None
+
+
+# Instancias compartidas: la caché sobrevive a cerrar y volver a abrir la pantalla
+sugerencias_productos = BuscadorSugerencias(SQL_SUGERENCIAS_PRODUCTOS, _coincide_producto, limite=8)
+sugerencias_clientes = BuscadorSugerencias(SQL_SUGERENCIAS_CLIENTES, _coincide_cliente, limite=5)
@@ -0,0 +1,96 @@
+# Medias móviles contra pandas y paridad de features entre entrenamiento (generar_features_mensuales)
+# y predicción recursiva (EstadoRecursivo)
+#
+# Uso:
+#   python -m pytest -q tests
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from model_trainer import EstadoRecursivo, generar_features_mensuales, medias_moviles_desplazadas
+
+VENTANAS = (3, 6, 12)
+COLUMNAS_ESTADO = ["lag_1", "lag_2", "lag_3", "lag_12", "rm_3", "rm_6", "rm_12", "promedio_historico"]
+
+
+def historia_mensual(n_productos=40, ultimo_mes="2024-06-01", seed=7):
+    """Productos con distinta antigüedad (de 1 a 60 meses) que terminan todos en el mismo mes."""
+    rng = np.random.default_rng(seed)
+    filas = []
+    for producto in range(1, n_productos + 1):
+        meses = pd.date_range(end=ultimo_mes, periods=int(rng.integers(1, 61)), freq="MS")
+        filas.append(pd.DataFrame({
+            "v_id_producto": producto,
+            "fecha_mes": meses,
+            "categoria": f"CAT{producto % 3}",
+            "v_precio": 100.0 + producto,
+            # Escalas muy distintas entre productos: donde más se nota el error de redondeo
+            "cantidad_vendida": rng.gamma(2.0, 10.0 ** (producto % 5), len(meses)).round(3),
+        }))
+    return pd.concat(filas, ignore_index=True)
+
+
+def test_medias_contra_pandas():
+    df = historia_mensual().sort_values(["v_id_producto", "fecha_mes"])
+    grouped = df.groupby("v_id_producto")["cantidad_vendida"]
+    medias = medias_moviles_desplazadas(df["cantidad_vendida"], df["v_id_producto"], VENTANAS)
+    for w in VENTANAS:
+        esperado = grouped.transform(lambda x: x.shift(1).rolling(w).mean()).to_numpy()
+        np.testing.assert_allclose(medias[w], esperado, rtol=1e-12, atol=1e-9, equal_nan=True)
+
+
+def test_medias_recursivas_contra_pandas():
+    historia = historia_mensual()
+    estado = EstadoRecursivo(generar_features_mensuales(historia))
+    rng = np.random.default_rng(11)
+
+    for paso in range(1, 16):
+        siguiente = historia["fecha_mes"].max() + pd.DateOffset(months=1)
+        recursivas = estado.features(siguiente)
+
+        # rolling(w).mean() de los w meses anteriores, sobre la historia más las predicciones
+        df = historia.sort_values(["v_id_producto", "fecha_mes"])
+        grouped = df.groupby("v_id_producto")["cantidad_vendida"]
+        for w in VENTANAS:
+            esperado = grouped.apply(lambda x: x.rolling(w).mean().iloc[-1]).fillna(0)
+            esperado = esperado.loc[estado.productos["v_id_producto"]].to_numpy()
+            np.testing.assert_allclose(recursivas[f"rm_{w}"].to_numpy(), esperado, rtol=1e-12, atol=1e-9,
+                                       err_msg=f"rm_{w} (paso {paso})")
+
+        cantidades = rng.gamma(2.0, 10.0, len(estado.productos)).round(3)
+        estado.avanzar(cantidades)
+        historia = pd.concat([historia, estado.productos.assign(fecha_mes=siguiente, cantidad_vendida=cantidades)],
+                             ignore_index=True)
+
+
+def test_features_recursivas_iguales_a_entrenamiento():
+    historia = historia_mensual()
+    estado = EstadoRecursivo(generar_features_mensuales(historia))
+    rng = np.random.default_rng(11)
+
+    for paso in range(1, 16):
+        siguiente = historia["fecha_mes"].max() + pd.DateOffset(months=1)
+        recursivas = estado.features(siguiente)
+
+        # El entrenamiento ve el mes a predecir como una fila más con cantidad 0
+        fila_nueva = estado.productos.assign(fecha_mes=siguiente, cantidad_vendida=0.0)
+        entrenamiento = generar_features_mensuales(pd.concat([historia, fila_nueva], ignore_index=True))
+        entrenamiento = entrenamiento[entrenamiento["fecha_mes"] == siguiente]
+        entrenamiento = entrenamiento.set_index(entrenamiento["v_id_producto"].astype(int))
+        entrenamiento = entrenamiento.loc[estado.productos["v_id_producto"]]
+
+        for columna in COLUMNAS_ESTADO[:-1]:
+            np.testing.assert_array_equal(recursivas[columna].to_numpy(), entrenamiento[columna].to_numpy(),
+                                          err_msg=f"{columna} (paso {paso})")
+        np.testing.assert_allclose(recursivas["promedio_historico"].to_numpy(),
+                                   entrenamiento["promedio_historico"].to_numpy(), rtol=1e-12)
+
+        # La "predicción" del paso pasa a ser historia, como en predecir_futuro_recursivo
+        cantidades = rng.gamma(2.0, 10.0, len(fila_nueva)).round(3)
+        estado.avanzar(cantidades)
+        historia = pd.concat([historia, fila_nueva.assign(cantidad_vendida=cantidades)], ignore_index=True)